@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+import cache
+import logs
+
+# Content-addressed cache for AI quiz generation.
+#
+# Requests are keyed by a hash of their normalized inputs. Lookups go to an
+# in-memory LRU first, then to an optional persistent tier (Mongo or disk) with
+# a TTL. Concurrent requests for the same key share one in-flight model call:
+# the first caller generates, the rest wait for its result.
+
+log = logs.get_logger('ai_cache')
+
+
+def cache_key(content, num_questions, quiz_type, difficulty):
+    """Returns the sha256 hex digest identifying a generation request."""
+    normalized = {
+        "content": re.sub(r'\s+', ' ', content).strip(),
+        "num_questions": int(num_questions),
+        "quiz_type": quiz_type.strip().lower(),
+        "difficulty": difficulty.strip().lower()
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class MongoStore:
+    """Persistent tier in a Mongo collection; expiry is left to a TTL index on expires_at."""
+
+    def __init__(self, collection, ttl):
+        self.collection = collection
+        self.ttl = ttl
+
+    def get(self, key):
+        doc = self.collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.now()}}, {'value': 1})
+        return doc['value'] if doc else None
+
+    def set(self, key, value):
+        self.collection.replace_one(
+            {'_id': key},
+            {'_id': key, 'value': value, 'expires_at': datetime.now() + timedelta(seconds=self.ttl)},
+            upsert=True
+        )
+
+
+class DiskStore:
+    """Persistent tier as one JSON file per key; files older than `ttl` are ignored."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key):
+        try:
+            if time.time() - os.path.getmtime(self._file(key)) > self.ttl:
+                return None
+            with open(self._file(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        # Write-then-rename so readers never see a partial file
+        tmp = f"{self._file(key)}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(tmp, self._file(key))
+
+
+class _InFlight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class GenerationCache:
+
+    def __init__(self, maxsize=256, ttl=86400, persistent=None):
+        self.memory = cache.TTLCache(maxsize=maxsize, ttl=ttl)
+        self.persistent = persistent
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def lookup(self, key):
+        """Returns the cached value for `key` from either tier, or None."""
+        value = self.memory.get(key)
+        if value is not cache.MISSING:
+            self._count("memory_hits")
+            return value
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except Exception:
+                logs.event(log, 'ai_cache_read_failed', level=logging.WARNING, exc_info=True)
+                value = None
+            if value:
+                self._count("persistent_hits")
+                self.memory.set(key, value)
+                return value
+        return None
+
+    def store(self, key, value):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value)
+            except Exception:
+                logs.event(log, 'ai_cache_write_failed', level=logging.WARNING, exc_info=True)
+
+    def get_or_generate(self, key, generate, bypass=False):
+        """
+        Returns the cached value for `key`, or calls `generate()` once for all
+        concurrent callers asking for the same key. Empty results are not cached.
+
+        Args:
+            key (str): From cache_key().
+            generate (callable): Produces the value on a miss.
+            bypass (bool): Skip cache reads and coalescing and always call
+                           generate(); the fresh value still replaces the cached one.
+        """
+        if bypass:
+            self._count("bypassed")
+            value = generate()
+            if value:
+                self.store(key, value)
+            return value
+
+        value = self.lookup(key)
+        if value:
+            return value
+
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[key] = _InFlight()
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.value
+
+        try:
+            in_flight.value = generate()
+            if in_flight.value:
+                self.store(key, in_flight.value)
+            return in_flight.value
+        except Exception as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self._in_flight)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["memory"] = self.memory.stats()
+        return stats
@@ -0,0 +1,195 @@
+import random
+import threading
+import time
+
+# Call policy for the model backend: a concurrency limit, a token-bucket rate
+# limiter matching the API quota, exponential-backoff retries for transient
+# errors, and per-call latency and token-usage metrics.
+
+# Exception class names (anywhere in the MRO) that are worth retrying. Matched
+# by name so this module doesn't depend on google.api_core being importable.
+TRANSIENT_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'RetryError', 'TimeoutError', 'ConnectionError'
+}
+
+
+class AIGenerationError(Exception):
+    """
+    A model call that failed for good.
+
+    Attributes:
+        transient (bool): True if the failure was temporary (quota, overload,
+                          timeout) and the request may succeed later.
+    """
+
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+def is_transient(error):
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Takes one token, waiting up to `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CallPolicy:
+    """
+    Wraps model calls with the limits and retries described above.
+
+    Args:
+        max_concurrency (int): Model calls in flight at once.
+        requests_per_minute (float): Sustained request rate allowed by the quota.
+        burst (int): Requests allowed back to back before the rate applies.
+        max_retries (int): Retries after the first attempt for transient errors.
+        base_delay (float): First backoff delay in seconds; doubles per retry.
+        max_delay (float): Upper bound on a single backoff delay.
+        acquire_timeout (float): Longest wait for a concurrency slot or rate token.
+    """
+
+    def __init__(self, max_concurrency=4, requests_per_minute=60, burst=10,
+                 max_retries=3, base_delay=1.0, max_delay=20.0, acquire_timeout=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self._lock = threading.Lock()
+        self.metrics = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "throttled": 0,
+            "total_latency_seconds": 0.0,
+            "max_latency_seconds": 0.0,
+            "prompt_tokens": 0,
+            "output_tokens": 0
+        }
+
+    def _record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self.metrics[name] += value
+
+    def record_usage(self, usage):
+        # usage is the response's usage_metadata, when the backend reports one
+        if usage is not None:
+            self._record(
+                prompt_tokens=getattr(usage, 'prompt_token_count', 0) or 0,
+                output_tokens=getattr(usage, 'candidates_token_count', 0) or 0
+            )
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries from many workers from lining up
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._record(throttled=1)
+            raise AIGenerationError("Too many AI requests in progress.", transient=True)
+        if not self._bucket.acquire(timeout=self.acquire_timeout):
+            self._slots.release()
+            self._record(throttled=1)
+            raise AIGenerationError("AI request rate limit reached.", transient=True)
+
+    def call(self, fn):
+        """
+        Runs fn() under the concurrency and rate limits, retrying transient errors.
+
+        Raises:
+            AIGenerationError: When fn() fails permanently or retries run out.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                self._finish(started, failed=True)
+                if not is_transient(e):
+                    raise AIGenerationError(f"AI request failed: {e}") from e
+                if attempt >= self.max_retries:
+                    raise AIGenerationError(f"AI request failed after {attempt + 1} attempts: {e}", transient=True) from e
+                self._record(retries=1)
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self._finish(started)
+            return result
+
+    def stream(self, open_stream):
+        """
+        Like call(), for a streaming response: open_stream() returns an iterator.
+        The concurrency slot is held until the stream is exhausted, and a failure
+        is retried only if it happens before the first item was produced.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            started = time.monotonic()
+            produced = False
+            try:
+                for item in open_stream():
+                    produced = True
+                    yield item
+            except Exception as e:
+                self._finish(started, failed=True)
+                if produced or not is_transient(e):
+                    raise AIGenerationError(f"AI request failed: {e}", transient=is_transient(e)) from e
+                if attempt >= self.max_retries:
+                    raise AIGenerationError(f"AI request failed after {attempt + 1} attempts: {e}", transient=True) from e
+                self._record(retries=1)
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Consumer stopped early (GeneratorExit); just give the slot back
+                self._finish(started)
+                raise
+            self._finish(started)
+            return
+
+    def _finish(self, started, failed=False):
+        elapsed = time.monotonic() - started
+        self._slots.release()
+        with self._lock:
+            self.metrics["calls"] += 1
+            self.metrics["failures"] += 1 if failed else 0
+            self.metrics["total_latency_seconds"] += elapsed
+            self.metrics["max_latency_seconds"] = max(self.metrics["max_latency_seconds"], elapsed)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+        stats["avg_latency_seconds"] = stats["total_latency_seconds"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
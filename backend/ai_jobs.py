@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logs
+
+# Background jobs for AI quiz generation.
+#
+# submit() returns a job id immediately and runs the generation on a bounded
+# thread pool. Job state lives in this process and is mirrored to the ai_jobs
+# collection, so any worker can answer a status poll; long-polls on a job owned
+# by another worker fall back to re-reading that document.
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+REMOTE_POLL_INTERVAL = 0.5
+
+log = logs.get_logger('ai_jobs')
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class JobManager:
+    """
+    Args:
+        run (callable): Called as run(**params) in a worker thread; its return
+                        value becomes the job result. A falsy result or an
+                        exception fails the job.
+        collection: Optional Mongo collection that mirrors job state.
+        max_workers (int): Generations running at once.
+        max_pending (int): Jobs queued or running before submit() refuses more.
+        retention (float): Seconds a finished job is kept.
+    """
+
+    def __init__(self, run, collection=None, max_workers=4, max_pending=100, retention=3600):
+        self.run = run
+        self.collection = collection
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._executor = None
+
+    def _get_executor(self):
+        # Caller holds the lock. Created on first use so pre-fork servers don't inherit threads.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ai-job')
+        return self._executor
+
+    def _active(self):
+        return sum(1 for job in self._jobs.values() if job['status'] not in FINISHED)
+
+    def _purge(self):
+        # Caller holds the lock
+        cutoff = datetime.now() - timedelta(seconds=self.retention)
+        for job_id in [j for j, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < cutoff]:
+            del self._jobs[job_id]
+
+    def _save(self, job):
+        if self.collection is not None:
+            doc = dict(job)
+            doc['expires_at'] = (job['finished_at'] or job['created_at']) + timedelta(seconds=self.retention)
+            try:
+                self.collection.replace_one({'_id': job['job_id']}, doc, upsert=True)
+            except Exception:
+                logs.event(log, 'ai_job_save_failed', level=logging.ERROR, exc_info=True, job_id=job['job_id'])
+
+    def submit(self, **params):
+        """
+        Queues a generation.
+
+        Returns:
+            dict: The new job's status.
+
+        Raises:
+            JobQueueFull: If max_pending jobs are already queued or running.
+        """
+        with self._cond:
+            self._purge()
+            if self._active() >= self.max_pending:
+                raise JobQueueFull("Too many AI generation jobs in progress.")
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                'status': QUEUED,
+                'result': None,
+                'error': None,
+                'created_at': datetime.now(),
+                'started_at': None,
+                'finished_at': None
+            }
+            self._jobs[job_id] = job
+            snapshot = dict(job)
+        # Persist the queued state before a worker can move it on
+        self._save(snapshot)
+        with self._cond:
+            self._get_executor().submit(self._execute, job_id, params)
+        return snapshot
+
+    def _update(self, job_id, **fields):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            snapshot = dict(job)
+            self._cond.notify_all()
+        self._save(snapshot)
+
+    def _execute(self, job_id, params):
+        self._update(job_id, status=RUNNING, started_at=datetime.now())
+        try:
+            result = self.run(**params)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), finished_at=datetime.now())
+            return
+        if result:
+            self._update(job_id, status=DONE, result=result, finished_at=datetime.now())
+        else:
+            self._update(job_id, status=FAILED, error="Generation returned no questions.", finished_at=datetime.now())
+
+    def get(self, job_id, wait=0):
+        """
+        Returns the job's status, or None if it is unknown.
+
+        Args:
+            job_id (str): The id returned by submit().
+            wait (float): Long-poll: seconds to wait for the job to finish.
+        """
+        deadline = time.monotonic() + wait
+        with self._cond:
+            if job_id in self._jobs:
+                while self._jobs[job_id]['status'] not in FINISHED:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                return dict(self._jobs[job_id])
+
+        # Not ours: another worker owns it, read the mirrored state
+        if self.collection is None:
+            return None
+        while True:
+            doc = self.collection.find_one({'_id': job_id}, {'_id': 0, 'expires_at': 0})
+            if doc is None or doc['status'] in FINISHED or time.monotonic() >= deadline:
+                return doc
+            time.sleep(min(REMOTE_POLL_INTERVAL, max(0, deadline - time.monotonic())))
+
+    def stats(self):
+        with self._cond:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+        counts['max_workers'] = self.max_workers
+        counts['max_pending'] = self.max_pending
+        return counts
@@ -0,0 +1,181 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logs
+
+# Chunked generation for long source documents.
+#
+# Content over CHUNK_THRESHOLD characters is split into chunks on paragraph (or
+# sentence) boundaries. Questions are generated for every chunk concurrently,
+# then merged: near-duplicates are dropped and questions are taken round-robin
+# across chunks so the quiz covers the whole document. Chunks that fail or time
+# out are skipped and whatever the others produced is returned.
+
+CHUNK_THRESHOLD = int(os.getenv('AI_CHUNK_THRESHOLD', 12000))
+CHUNK_SIZE = int(os.getenv('AI_CHUNK_SIZE', 8000))
+CHUNK_OVERLAP = int(os.getenv('AI_CHUNK_OVERLAP', 200))
+CHUNK_WORKERS = int(os.getenv('AI_CHUNK_WORKERS', 4))
+CHUNK_TIMEOUT = float(os.getenv('AI_CHUNK_TIMEOUT', 60))
+# Questions whose word sets overlap at least this much count as duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+log = logs.get_logger('ai_pipeline')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix='ai-chunk')
+        return _executor
+
+
+def split_content(content, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Splits `content` into chunks of at most about `chunk_size` characters,
+    breaking between paragraphs where possible. Consecutive chunks share up to
+    `overlap` characters so a fact on a boundary isn't lost.
+    """
+    # Paragraphs first; a paragraph that is itself too long is split into sentences
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= chunk_size:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            while len(sentence) > chunk_size:
+                pieces.append(sentence[:chunk_size])
+                sentence = sentence[chunk_size:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_size:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else ''
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _words(question):
+    return set(re.findall(r'\w+', str(question.get('question', '')).lower()))
+
+
+def is_duplicate(words, seen):
+    for other in seen:
+        union = words | other
+        if union and len(words & other) / len(union) >= DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+def merge_questions(per_chunk, num_questions):
+    """
+    Merges per-chunk question lists into at most `num_questions` questions,
+    taking them round-robin across chunks and skipping near-duplicates.
+    """
+    merged = []
+    seen = []
+    queues = [list(questions) for questions in per_chunk if questions]
+    while queues and len(merged) < num_questions:
+        for queue in list(queues):
+            if len(merged) >= num_questions:
+                break
+            while queue:
+                question = queue.pop(0)
+                words = _words(question)
+                if not is_duplicate(words, seen):
+                    merged.append(question)
+                    seen.append(words)
+                    break
+            if not queue:
+                queues.remove(queue)
+    return merged
+
+
+def generate_chunked(content, num_questions, generate_chunk, timeout=CHUNK_TIMEOUT):
+    """
+    Generates `num_questions` questions from long `content` chunk by chunk.
+
+    Args:
+        content (str): The full source text.
+        num_questions (int): Questions wanted in the merged quiz.
+        generate_chunk (callable): Called as generate_chunk(chunk, n) and returns
+                                   a list of up to n questions for that chunk.
+        timeout (float): Seconds allowed per chunk, from when a worker starts it.
+
+    Returns:
+        list: The merged questions; fewer than requested if chunks failed.
+    """
+    chunks = split_content(content)
+    # Ask each chunk for a little more than its share to leave room for dedup
+    per_chunk = min(num_questions, math.ceil(num_questions / len(chunks)) + 1)
+
+    # The executor is shared with other requests, so a chunk's time only starts
+    # counting once a worker picks it up, not while it waits behind theirs
+    changed = threading.Condition()
+    started_at = {}
+
+    def run(index, chunk):
+        with changed:
+            started_at[index] = time.monotonic()
+            changed.notify_all()
+        return generate_chunk(chunk, per_chunk)
+
+    def finished(_future):
+        with changed:
+            changed.notify_all()
+
+    executor = _get_executor()
+    started = time.monotonic()
+    futures = [executor.submit(run, index, chunk) for index, chunk in enumerate(chunks)]
+    for future in futures:
+        future.add_done_callback(finished)
+
+    timed_out = set()
+    with changed:
+        while True:
+            now = time.monotonic()
+            waiting = [i for i, future in enumerate(futures) if not future.done() and i not in timed_out]
+            timed_out.update(i for i in waiting if i in started_at and now - started_at[i] >= timeout)
+            waiting = [i for i in waiting if i not in timed_out]
+            if not waiting:
+                break
+            deadlines = [started_at[i] + timeout for i in waiting if i in started_at]
+            changed.wait(min(deadlines) - now if deadlines else None)
+
+    results = []
+    failed = 0
+    for index, future in enumerate(futures):
+        if index in timed_out and not future.done():
+            # Still running; its result, if any, is dropped
+            results.append([])
+            failed += 1
+            continue
+        try:
+            results.append(future.result() or [])
+        except Exception:
+            logs.event(log, 'ai_chunk_failed', level=logging.WARNING, exc_info=True)
+            results.append([])
+            failed += 1
+
+    if failed:
+        logs.event(
+            log, 'ai_partial_quiz', level=logging.WARNING, failed_chunks=failed, chunks=len(chunks),
+            elapsed_seconds=round(time.monotonic() - started, 1)
+        )
+    return merge_questions(results, num_questions)
@@ -1,14 +1,171 @@
+import logging
 import os
-import google.generativeai as genai
+import threading
+import time
+import zlib
 import json
+import copy
+from ai_client import AIGenerationError, CallPolicy
+from ai_cache import DiskStore, GenerationCache, cache_key
+import ai_pipeline
+import logs
+from json_stream import JSONArrayStreamParser, parse_json_array
+
+# Model name and call limits come from the environment (see README)
+AI_MODEL = os.getenv('AI_MODEL', 'gemini-2.5-flash')
+AI_REQUEST_TIMEOUT = float(os.getenv('AI_REQUEST_TIMEOUT', 60))
+
+log = logs.get_logger('ai')
+
+
+def call_policy_from_env():
+    return CallPolicy(
+        max_concurrency=int(os.getenv('AI_MAX_CONCURRENCY', 4)),
+        requests_per_minute=float(os.getenv('AI_RATE_LIMIT_RPM', 60)),
+        burst=int(os.getenv('AI_RATE_LIMIT_BURST', 10)),
+        max_retries=int(os.getenv('AI_MAX_RETRIES', 3)),
+        base_delay=float(os.getenv('AI_RETRY_BASE_DELAY', 1.0)),
+        max_delay=float(os.getenv('AI_RETRY_MAX_DELAY', 20.0))
+    )
+
+
+class GeminiBackend:
+    """
+    Generates quiz text with the Gemini API.
+
+    One long-lived instance is shared by all requests: the model client is built
+    once, and every call goes through a CallPolicy (concurrency limit, rate
+    limit, retries and metrics).
+    """
+
+    def __init__(self, model_name=None, policy=None):
+        self.model_name = model_name or AI_MODEL
+        self.policy = policy or call_policy_from_env()
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._model_lock:
+            if self._model is None:
+                # Imported on first use: the SDK is slow to import and only this backend needs it
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv('GEMINI_API_KEY', "ENTER YOUR API"))
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def _request_options(self, timeout):
+        return {"timeout": timeout or AI_REQUEST_TIMEOUT}
+
+    def generate(self, prompt, timeout=None, **params):
+        def call():
+            response = self.model.generate_content(prompt, request_options=self._request_options(timeout))
+            self.policy.record_usage(getattr(response, 'usage_metadata', None))
+            return response.text
+        return self.policy.call(call)
+
+    def stream(self, prompt, timeout=None, **params):
+        def open_stream():
+            usage = None
+            for chunk in self.model.generate_content(prompt, stream=True, request_options=self._request_options(timeout)):
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                yield chunk.text
+            self.policy.record_usage(usage)
+        return self.policy.stream(open_stream)
+
+    def stats(self):
+        stats = self.policy.stats()
+        stats["model"] = self.model_name
+        return stats
+
+
+class StubBackend:
+    """
+    Local stand-in for the model, for offline testing and load tests.
+    Sleeps `latency` seconds and returns `num_questions` canned questions.
+    """
+
+    def __init__(self, latency=None, policy=None):
+        self.latency = float(os.getenv('AI_STUB_LATENCY', 1.0)) if latency is None else latency
+        # Same limits as the real backend, so queueing behaves the same in load tests
+        self.policy = policy or call_policy_from_env()
+
+    def _render(self, prompt, num_questions):
+        # Tag questions with the prompt's checksum so different chunks yield different questions
+        tag = zlib.crc32(prompt.encode('utf-8'))
+        questions = [
+            {
+                "question": f"Stub question {i + 1} on passage {tag}?",
+                "options": ["Option A", "Option B", "Option C", "Option D"],
+                "correct_answer": "ABCD"[i % 4]
+            }
+            for i in range(num_questions)
+        ]
+        return "```json\n" + json.dumps(questions) + "\n```"
+
+    def generate(self, prompt, num_questions=5, **params):
+        def call():
+            time.sleep(self.latency)
+            return self._render(prompt, num_questions)
+        return self.policy.call(call)
+
+    def stream(self, prompt, num_questions=5, fragment_size=64, **params):
+        def open_stream():
+            # Spread the latency over the output, as a real token stream would
+            text = self._render(prompt, num_questions)
+            delay = self.latency * fragment_size / max(len(text), 1)
+            for i in range(0, len(text), fragment_size):
+                time.sleep(delay)
+                yield text[i:i + fragment_size]
+        return self.policy.stream(open_stream)
+
+    def stats(self):
+        stats = self.policy.stats()
+        stats["model"] = "stub"
+        return stats
+
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'stub': StubBackend
+}
+
+_backend = None
+
+
+def get_backend():
+    """Returns the model backend, chosen by the AI_BACKEND environment variable on first use."""
+    global _backend
+    if _backend is None:
+        name = os.getenv('AI_BACKEND', 'gemini')
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown AI backend '{name}'. Must be one of: {', '.join(BACKENDS)}.")
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+def set_backend(backend):
+    """Replaces the model backend, e.g. with a StubBackend in tests."""
+    global _backend
+    _backend = backend
+
+# Identical requests are served from this cache instead of calling the model again.
+# The persistent tier is optional: AI_CACHE_DIR enables a disk tier here, and the
+# app can plug in a Mongo tier (see app.py).
+generation_cache = GenerationCache(
+    maxsize=int(os.getenv('AI_CACHE_SIZE', 256)),
+    ttl=float(os.getenv('AI_CACHE_TTL', 86400)),
+    persistent=DiskStore(os.getenv('AI_CACHE_DIR'), float(os.getenv('AI_CACHE_TTL', 86400)))
+    if os.getenv('AI_CACHE_DIR') else None
+)
 
-genai.configure(api_key="ENTER YOUR API")
 
 def generate_quiz_from_content(
     content: str,
     num_questions: int = 5,
     quiz_type: str = "multiple choice",
-    difficulty: str = "medium"
+    difficulty: str = "medium",
+    fresh: bool = False
 ) -> list:
     """
     Generates quiz questions and answers using the Gemini API.
@@ -18,17 +175,53 @@ def generate_quiz_from_content(
         num_questions (int): The desired number of questions.
         quiz_type (str): The type of quiz (e.g., "multiple choice", "true/false").
         difficulty (str): The difficulty level (e.g., "easy", "medium", "hard").
+        fresh (bool): Bypass the generation cache and always call the model.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a question
               with its options and correct answer.
-              Returns an empty list if generation fails.
+              Returns an empty list if the model's output can't be parsed.
+
+    Raises:
+        AIGenerationError: If the model call fails after retries. Its
+                           `transient` flag tells quota/overload from permanent errors.
     """
     if not content:
         return []
 
+    key = cache_key(content, num_questions, quiz_type, difficulty)
+    quiz_data = generation_cache.get_or_generate(
+        key,
+        lambda: _generate_uncached(content, num_questions, quiz_type, difficulty),
+        bypass=fresh
+    )
+    # Callers may mutate the questions; keep the cached copy intact
+    return copy.deepcopy(quiz_data)
+
+
+def _generate_uncached(content, num_questions, quiz_type, difficulty):
+    # Long documents go through the chunked pipeline; partial results are kept
+    if len(content) > ai_pipeline.CHUNK_THRESHOLD:
+        return ai_pipeline.generate_chunked(
+            content,
+            num_questions,
+            lambda chunk, n: _generate_once(chunk, n, quiz_type, difficulty, timeout=ai_pipeline.CHUNK_TIMEOUT)
+        )
+
+    try:
+        return _generate_once(content, num_questions, quiz_type, difficulty)
+    except AIGenerationError:
+        # Model call failed after retries; let the caller tell quota problems from bad requests
+        raise
+    except Exception:
+        # The model answered, but not with a usable JSON array
+        logs.event(log, 'ai_generation_unusable', level=logging.ERROR, exc_info=True)
+        return []
+
+
+def _build_prompt(content, num_questions, quiz_type, difficulty):
     # Craft a detailed prompt for the Gemini model
-    prompt = f"""
+    return f"""
     Generate a {difficulty} difficulty {quiz_type} quiz with {num_questions} questions based on the following content.
     For each question, provide 4 options (A, B, C, D) and indicate the correct answer.
     Ensure the questions and answers are directly derivable from the provided content.
@@ -48,22 +241,74 @@ def generate_quiz_from_content(
     ]
     """
 
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        
-        # Extract the text and attempt to parse it as JSON
-        generated_text = response.text.strip()
-        
-        # Gemini might sometimes wrap JSON in markdown code blocks
-        if generated_text.startswith('```json') and generated_text.endswith('```'):
-            generated_text = generated_text[7:-3].strip()
-
-        quiz_data = json.loads(generated_text)
-        return quiz_data
-    except Exception as e:
-        print(f"Error generating quiz: {e}")
-        return []
+
+def _generate_once(content, num_questions, quiz_type, difficulty, timeout=None):
+    """Makes a single model call for `content` and parses the JSON array it returns."""
+    generated_text = get_backend().generate(
+        _build_prompt(content, num_questions, quiz_type, difficulty),
+        num_questions=num_questions,
+        quiz_type=quiz_type,
+        difficulty=difficulty,
+        timeout=timeout
+    )
+
+    # Gemini might sometimes wrap JSON in markdown code blocks; the parser skips the fence
+    return parse_json_array(generated_text)
+
+
+def stream_quiz_from_content(
+    content: str,
+    num_questions: int = 5,
+    quiz_type: str = "multiple choice",
+    difficulty: str = "medium",
+    fresh: bool = False
+):
+    """
+    Like generate_quiz_from_content, but yields each question as soon as the
+    model has finished writing it.
+
+    Cached quizzes are replayed immediately, and a completed stream is stored in
+    the cache. Long content goes through the chunked pipeline and is yielded
+    once merged.
+
+    Yields:
+        dict: One question with its options and correct answer.
+
+    Raises:
+        Exception: If the model call fails or its output is not a JSON array.
+    """
+    if not content:
+        return
+
+    key = cache_key(content, num_questions, quiz_type, difficulty)
+    if not fresh:
+        cached = generation_cache.lookup(key)
+        if cached:
+            yield from copy.deepcopy(cached)
+            return
+
+    if len(content) > ai_pipeline.CHUNK_THRESHOLD:
+        yield from generate_quiz_from_content(content, num_questions, quiz_type, difficulty, fresh=fresh)
+        return
+
+    parser = JSONArrayStreamParser()
+    questions = []
+    fragments = get_backend().stream(
+        _build_prompt(content, num_questions, quiz_type, difficulty),
+        num_questions=num_questions,
+        quiz_type=quiz_type,
+        difficulty=difficulty
+    )
+    for fragment in fragments:
+        for question in parser.feed(fragment):
+            questions.append(question)
+            yield copy.deepcopy(question)
+        if parser.finished:
+            break
+    parser.close()
+
+    if questions:
+        generation_cache.store(key, questions)
 
 if __name__ == '__main__':
     # Example usage (requires GEMINI_API_KEY environment variable set)
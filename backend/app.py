@@ -1,57 +1,146 @@
 import os
-from flask import Flask, jsonify, request, send_from_directory
+import json
+import click
+import logging
+from flask import Blueprint, Flask, Response, jsonify, request, send_from_directory, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
-from flask_bcrypt import Bcrypt
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
 from datetime import datetime
 from bson.objectid import ObjectId # Import ObjectId
 from functools import wraps
+from werkzeug.local import LocalProxy
 from werkzeug.utils import secure_filename # For secure filenames
-from ai_quiz_generator import generate_quiz_from_content # Import the AI quiz generator
-
-app = Flask(__name__)
-CORS(app) # Enable CORS for all routes
-bcrypt = Bcrypt(app)
-
-# MongoDB connection
-try:
-    client = MongoClient('mongodb://localhost:27017/') # Assuming default MongoDB port
-    db = client.test_quiz_db # Changed to 'test_quiz_db' for testing
-    # The ping command is cheap and does not require auth. 
-    # It will be green if the server is running. 
-    client.admin.command('ping') 
-    print("MongoDB connected successfully!")
-
-    # Add dummy categories if the collection is empty
-    if db.categories.count_documents({}) == 0:
-        print("Adding dummy categories...")
-        dummy_categories = [
-            {"name": "Science", "description": "Questions about various scientific fields."},
-            {"name": "History", "description": "Events and figures from the past."},
-            {"name": "Mathematics", "description": "Problems and concepts in mathematics."},
-            {"name": "Literature", "description": "Works and authors of literature."}
-        ]
-        db.categories.insert_many(dummy_categories)
-        print("Dummy categories added.")
-
-except Exception as e:
-    print(f"Could not connect to MongoDB: {e}")
-    client = None
-    db = None
-
-# Configuration for file uploads
-UPLOAD_FOLDER = 'static/avatars'
+from ai_quiz_generator import generate_quiz_from_content, generation_cache, stream_quiz_from_content # Import the AI quiz generator
+from ai_cache import MongoStore
+from ai_client import AIGenerationError
+import ai_quiz_generator
+from ai_jobs import JobManager, JobQueueFull
+import cache
+import cascades
+import compression
+import exports
+from category_cache import CategoryCache
+from config import Config
+from extensions import mongo
+import grading
+import indexes
+from json_provider import FastJSONProvider
+import leaderboard
+import logs
+import metrics
+import pagination
+import passwords
+import quiz_stats
+import result_codec
+import search
+import validation
+from validation import ValidationError
+from write_buffer import WriteBuffer
+
+bp = Blueprint('api', __name__, cli_group=None) # Routes and CLI commands, registered by create_app()
+log = logs.get_logger('api')
+
+# Handles to the app's MongoDB connection; they resolve to the client bound by
+# create_app(), so nothing here connects at import time.
+client = LocalProxy(lambda: mongo.client)
+db = LocalProxy(lambda: mongo.db)
+
+# Session and result inserts go through the write-behind buffer (see write_buffer.py)
+write_buffer = WriteBuffer(
+    db,
+    mode=os.getenv('WRITE_MODE', 'sync'),
+    batch_size=int(os.getenv('WRITE_BATCH_SIZE', 500)),
+    flush_interval=float(os.getenv('WRITE_FLUSH_INTERVAL', 0.2)),
+    max_queue=int(os.getenv('WRITE_MAX_QUEUE', 10000)),
+    max_attempts=int(os.getenv('WRITE_MAX_ATTEMPTS', 5))
+)
+
+# Background AI generation jobs (see ai_jobs.py)
+AI_JOB_MAX_WAIT = float(os.getenv('AI_JOB_MAX_WAIT', 30))
+ai_job_manager = JobManager(
+    generate_quiz_from_content,
+    collection=LocalProxy(lambda: mongo.db.ai_jobs),
+    max_workers=int(os.getenv('AI_JOB_WORKERS', 4)),
+    max_pending=int(os.getenv('AI_JOB_MAX_PENDING', 100))
+)
+
+# User and quiz deletes: the dependent rows are removed in the background (see cascades.py)
+cascade_deleter = cascades.CascadeDeleter(
+    db,
+    batch_size=int(os.getenv('CASCADE_BATCH_SIZE', 500)),
+    pause=float(os.getenv('CASCADE_BATCH_PAUSE', 0.05))
+)
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Create upload folder if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+def create_app(config=None):
+    """
+    Builds the Flask app.
+
+    Startup does no database I/O unless ENSURE_INDEXES_ON_STARTUP is set: the
+    Mongo client connects on first use and categories are seeded by the
+    one-shot `flask seed-categories` command.
+
+    Args:
+        config (dict): Overrides for the settings in config.Config.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+
+    # ObjectId and datetime values are encoded by the JSON provider, so documents
+    # from Mongo can be returned as they are
+    app.json = FastJSONProvider(app)
+
+    CORS(app, expose_headers=['ETag', 'X-Next-Cursor']) # Enable CORS for all routes
+    mongo.init_app(app)
+    metrics.init_app(app)
+    compression.init_app(app)
+    app.register_blueprint(bp)
+
+    # Shared persistent tier for the AI generation cache
+    if os.getenv('AI_CACHE_STORE') == 'mongo':
+        generation_cache.persistent = MongoStore(LocalProxy(lambda: mongo.db.ai_generation_cache), ttl=generation_cache.memory.ttl)
+
+    # Create upload folder if it doesn't exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    # Opt-in: both steps raise, so a missing or conflicting index stops the app
+    # at startup instead of degrading to COLLSCANs
+    if app.config['ENSURE_INDEXES_ON_STARTUP']:
+        indexes.apply_indexes(mongo.db)
+        if app.config['VERIFY_QUERY_PLANS']:
+            indexes.verify_query_plans(mongo.db)
+
+    return app
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# username -> role, so admin checks don't hit Mongo on every request.
+# Role changes and deletions through the admin routes invalidate it here and
+# bump the shared 'roles' version, which makes every other worker drop its
+# cached roles within ROLE_CACHE_CHECK_INTERVAL seconds.
+role_cache = cache.TTLCache(
+    maxsize=int(os.getenv('ROLE_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('ROLE_CACHE_TTL', 60))
+)
+role_version = cache.VersionStamp('roles', check_interval=float(os.getenv('ROLE_CACHE_CHECK_INTERVAL', 1)))
+
+def get_user_role(username):
+    if role_version.changed(db):
+        role_cache.clear()
+    role = role_cache.get(username)
+    if role is cache.MISSING:
+        user = db.users.find_one({"username": username}, {'role': 1, '_id': 0})
+        role = user.get('role', 'user') if user else None # None: no such user
+        role_cache.set(username, role)
+    return role
+
+category_cache = CategoryCache(check_interval=float(os.getenv('CATEGORY_CACHE_CHECK_INTERVAL', 5)))
+
 # Decorator for admin required routes
 def admin_required(f):
     @wraps(f)
@@ -64,31 +153,47 @@ def admin_required(f):
         if not username:
             return jsonify({"message": "Authentication required."}), 401
         
-        user = db.users.find_one({"username": username})
-        if not user or user.get('role') != 'admin':
+        if get_user_role(username) != 'admin':
             return jsonify({"message": "Admin access required."}), 403
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/status', methods=['GET'])
+@bp.app_errorhandler(ConnectionFailure)
+def database_unavailable(e):
+    return jsonify({"message": "Database not connected."}), 503
+
+@bp.app_errorhandler(ValidationError)
+def invalid_request(e):
+    return jsonify({"message": str(e)}), e.status
+
+@bp.route('/status', methods=['GET'])
 def status():
     return jsonify({"status": "Backend is running!"})
 
-@app.route('/db_status', methods=['GET'])
+@bp.route('/db_status', methods=['GET'])
 def db_status():
-    if client is None: # Corrected check
-        return jsonify({"db_status": "MongoDB client not initialized."}),
     try:
         client.admin.command('ping')
         return jsonify({"db_status": "MongoDB connected and accessible!"})
     except Exception as e:
         return jsonify({"db_status": f"MongoDB connection failed: {e}"}), 500
 
-@app.route('/signup', methods=['POST'])
-def signup():
-    if db is None: # Corrected check
-        return jsonify({"message": "Database not connected."}),
+@bp.route('/ready', methods=['GET'])
+def ready():
+    # Readiness probe: only report ready once Mongo answers
+    try:
+        mongo.ping()
+        return jsonify({"ready": True}), 200
+    except Exception as e:
+        return jsonify({"ready": False, "message": f"MongoDB not reachable: {e}"}), 503
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text exposition format
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
+@bp.route('/signup', methods=['POST'])
+def signup():
     data = request.get_json()
     username = data.get('username')
     email = data.get('email')
@@ -97,13 +202,24 @@ def signup():
     if not username or not email or not password:
         return jsonify({"message": "Missing username, email, or password."}),
 
-    # Check if user already exists
-    if db.users.find_one({"username": username}):
-        return jsonify({"message": "Username already exists."}),
-    if db.users.find_one({"email": email}):
-        return jsonify({"message": "Email already exists."}),
+    # Check if user already exists (one query for both fields; the unique
+    # indexes on username and email catch signups racing past this check)
+    existing = db.users.find_one(
+        {"$or": [{"username": username}, {"email": email}]},
+        {"username": 1, "_id": 0}
+    )
+    if existing:
+        if existing.get('username') == username:
+            return jsonify({"message": "Username already exists."}), 400
+        return jsonify({"message": "Email already exists."}), 400
+    # The previous owner's results are still being removed and would be attributed to the new account
+    if username in cascades.pending_targets(db, cascades.USER):
+        return jsonify({"message": "Username is not available yet. Please try again shortly."}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = passwords.hash_password(password)
+    except passwords.PasswordPoolBusy:
+        return jsonify({"message": "Server busy. Please try again."}), 503
 
     user = {
         "username": username,
@@ -111,80 +227,94 @@ def signup():
         "password": hashed_password,
         "role": "user" # Default role for new users
     }
-    db.users.insert_one(user)
+    try:
+        db.users.insert_one(user)
+    except DuplicateKeyError as e:
+        if 'email' in str(e):
+            return jsonify({"message": "Email already exists."}), 400
+        return jsonify({"message": "Username already exists."}), 400
 
     return jsonify({"message": "User created successfully!"}), 201
 
-@app.route('/login', methods=['POST'])
-def login():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
+def make_session_doc(user):
+    return {
+        "user_id": str(user['_id']), # Convert ObjectId to string
+        "username": user['username'],
+        "login_time": datetime.now(),
+        "logout_time": None
+    }
 
-    data = request.get_json()
-    username = data.get('username')
-    password = data.get('password')
+def login_response(user):
+    return {"message": "Login successful!", "user": {"username": user['username'], "email": user['email'], "role": user.get('role', 'user')}}
 
-    if not username or not password:
-        return jsonify({"message": "Missing username or password."}),
+@bp.route('/login', methods=['POST'])
+def login():
+    username, password = validation.parse_login(request.get_json())
 
     user = db.users.find_one({"username": username})
 
-    if user and bcrypt.check_password_hash(user['password'], password):
+    try:
+        password_ok = user is not None and passwords.check_password(user['password'], password)
+    except passwords.PasswordPoolBusy:
+        return jsonify({"message": "Server busy. Please try again."}), 503
+
+    if password_ok:
+        # Upgrade the stored hash if it was made with a different work factor.
+        # Best effort: if the pool is busy the upgrade waits for the next login.
+        if passwords.needs_rehash(user['password']):
+            try:
+                db.users.update_one(
+                    {"_id": user['_id'], "password": user['password']},
+                    {"$set": {"password": passwords.hash_password(password)}}
+                )
+            except passwords.PasswordPoolBusy:
+                pass
         # Record login time
-        db.user_sessions.insert_one({
-            "user_id": str(user['_id']), # Convert ObjectId to string
-            "username": user['username'],
-            "login_time": datetime.now(),
-            "logout_time": None
-        })
-        return jsonify({"message": "Login successful!", "user": {"username": user['username'], "email": user['email'], "role": user.get('role', 'user')}}), 200
+        write_buffer.insert('user_sessions', make_session_doc(user))
+        return jsonify(login_response(user)), 200
     else:
-        return jsonify({"message": "Invalid username or password."}),
+        return jsonify({"message": "Invalid username or password."}), 401
 
-@app.route('/logout', methods=['POST'])
+@bp.route('/logout', methods=['POST'])
 def logout():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
-
     data = request.get_json()
     username = data.get('username')
 
-    print(f"Logout request received for username: {username}") # Debugging
-
     if not username:
-        print("Missing username in logout request.") # Debugging
-        return jsonify({"message": "Missing username."}),
-
-    # Find the most recent active session for the user and update logout_time
-    query = {"username": username, "logout_time": None}
-    print(f"Logout query: {query}") # Debugging
-
-    session = db.user_sessions.find_one_and_update(
-        query,
-        {"$set": {"logout_time": datetime.now()}},
-        sort=[('login_time', -1)] # Get the most recent login
+        logs.event(log, 'logout_rejected', reason='missing_username')
+        return jsonify({"message": "Missing username."}), 400
+
+    # A login in the write-behind window has its session still queued; it is
+    # more recent than any stored one, so close that first
+    logout_time = datetime.now()
+    session = write_buffer.update_pending(
+        'user_sessions', {"username": username, "logout_time": None}, {"logout_time": logout_time}
     )
+    if not session:
+        # Find the most recent active session for the user and update logout_time
+        session = db.user_sessions.find_one_and_update(
+            {"username": username, "logout_time": None},
+            {"$set": {"logout_time": logout_time}},
+            sort=[('login_time', -1)] # Get the most recent login
+        )
 
-    print(f"Session found for logout: {session}") # Debugging
+    logs.event(log, 'logout', username=username, session_found=session is not None)
 
     if session:
         return jsonify({"message": "Logout successful!"}), 200
     else:
-        return jsonify({"message": "No active session found for this user."}),
+        return jsonify({"message": "No active session found for this user."}), 404
 
-@app.route('/categories', methods=['GET'])
+@bp.route('/categories', methods=['GET'])
 def get_categories():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
-    
-    categories = list(db.categories.find({}, {'_id': 0})) # Exclude _id from response
-    return jsonify(categories), 200
+    # Served from memory; the ETag is the category version, so clients revalidate for free
+    version, categories = category_cache.get(db)
+    response = jsonify(categories)
+    response.set_etag(category_cache.etag(version))
+    return response.make_conditional(request)
 
-@app.route('/quizzes', methods=['POST'])
+@bp.route('/quizzes', methods=['POST'])
 def create_quiz():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
-
     data = request.get_json()
     title = data.get('title')
     description = data.get('description')
@@ -224,186 +354,401 @@ def create_quiz():
     result = db.quizzes.insert_one(quiz)
     return jsonify({"message": "Quiz created successfully!", "quiz_id": str(result.inserted_id)}), 201
 
-@app.route('/quizzes', methods=['GET'])
-def get_quizzes():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
-    
-    category = request.args.get('category')
+QUIZ_LIST_SORT = [('created_at', -1), ('_id', -1)]
+# Listing only needs enough to render the catalogue; questions are fetched per quiz
+QUIZ_SUMMARY_PROJECTION = {
+    'title': 1,
+    'description': 1,
+    'category': 1,
+    'created_by': 1,
+    'created_at': 1,
+    'question_count': {'$size': {'$ifNull': ['$questions', []]}}
+}
+
+def conditional_json(payload, status=200):
+    # Tag the response with a hash of its body so clients can revalidate with If-None-Match
+    response = jsonify(payload)
+    response.status_code = status
+    response.add_etag()
+    return response.make_conditional(request)
+
+def quiz_list_query(args):
+    category = args.get('category')
     query = {}
     if category:
         query['category'] = category
+    return query
+
+@bp.route('/quizzes', methods=['GET'])
+def get_quizzes():
+    query = quiz_list_query(request.args)
+    limit, after = validation.parse_page(request.args)
+
+    try:
+        quizzes, next_cursor = pagination.paginate(
+            db.quizzes,
+            query,
+            QUIZ_LIST_SORT,
+            limit,
+            after=after,
+            projection=QUIZ_SUMMARY_PROJECTION
+        )
+    except pagination.InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
+
+    response = conditional_json(quizzes)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@bp.route('/quizzes/search', methods=['GET'])
+def search_quizzes():
+    # ?q=<terms>&category=&limit=&after=; ranked by the quizzes text index
+    text, category, limit, after = validation.parse_search(request.args)
+
+    try:
+        return jsonify(search.search(db, text, category=category, limit=limit, after=after)), 200
+    except pagination.InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        return jsonify({"message": f"Error searching quizzes: {e}"}), 500
 
-    quizzes = []
-    for quiz in db.quizzes.find(query):
-        quiz['_id'] = str(quiz['_id'])
-        quizzes.append(quiz)
+@bp.route('/quizzes/<quiz_id>', methods=['GET'])
+def get_quiz(quiz_id):
+    if not ObjectId.is_valid(quiz_id):
+        return jsonify({"message": "Invalid quiz id."}), 400
 
-    return jsonify(quizzes), 200
+    quiz = db.quizzes.find_one({'_id': ObjectId(quiz_id)})
+    if not quiz:
+        return jsonify({"message": "Quiz not found."}), 404
 
-@app.route('/submit_quiz', methods=['POST'])
+    return conditional_json(quiz)
+
+@bp.route('/quizzes/<quiz_id>/stats', methods=['GET'])
+def get_quiz_stats(quiz_id):
+    if not ObjectId.is_valid(quiz_id):
+        return jsonify({"message": "Invalid quiz id."}), 400
+
+    try:
+        # Counters maintained by every submission: one _id lookup, whatever the attempt count.
+        # The answer key may outlive a quiz deleted by another worker, as in submit_quiz.
+        answer_key = grading.get_answer_key(db, quiz_id)
+        if not answer_key or quiz_id in cascades.deleted_targets(db, cascades.QUIZ):
+            return jsonify({"message": "Quiz not found."}), 404
+        stats = db.quiz_stats.find_one({'_id': quiz_id})
+        return jsonify(quiz_stats.format_stats(quiz_id, stats, answer_key)), 200
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        return jsonify({"message": f"Error fetching quiz stats: {e}"}), 500
+
+MAX_BATCH_SUBMISSIONS = int(os.getenv('MAX_BATCH_SUBMISSIONS', 1000))
+
+def make_result_doc(quiz_id, username, score, total_questions, percentage_score, stored_results):
+    return {
+        "quiz_id": quiz_id,
+        "user_id": username, # Using username as user_id for simplicity
+        "score": score,
+        "total_questions": total_questions,
+        "percentage_score": percentage_score,
+        **stored_results, # Packed per-question results (see result_codec.py)
+        "submission_time": datetime.now()
+    }
+
+def fold_results(results):
+    # Folds stored quiz results into the leaderboard and the quiz analytics.
+    # Results for quizzes deleted meanwhile are left to their cascade.
+    answer_keys = grading.get_answer_keys(db, [result['quiz_id'] for result in results])
+    deleted_quizzes = cascades.deleted_targets(db, cascades.QUIZ)
+    results = [r for r in results if r['quiz_id'] in answer_keys and r['quiz_id'] not in deleted_quizzes]
+    leaderboard.record_scores(db, [
+        (r['user_id'], answer_keys[r['quiz_id']].category, r['percentage_score'], r['submission_time'])
+        for r in results
+    ])
+    quiz_stats.record_results(db, results)
+
+# Only once the result is stored, which in the buffered write modes is after the response
+write_buffer.on_written('quiz_results', fold_results)
+
+def submission_response(result_doc):
+    return {
+        "message": "Quiz submitted successfully!",
+        "score": result_doc['score'],
+        "total_questions": result_doc['total_questions'],
+        "percentage_score": result_doc['percentage_score'],
+        "result_id": str(result_doc['_id'])
+    }
+
+@bp.route('/submit_quiz', methods=['POST'])
 def submit_quiz():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
+    quiz_id, username, user_answers = validation.parse_submission(request.get_json())
+    if not ObjectId.is_valid(quiz_id):
+        return jsonify({"message": "Invalid quiz id."}), 400
+
+    try:
+        # Compiled answer key (cached per quiz); question text never leaves Mongo here.
+        # Another worker may have deleted the quiz while its key is still cached here.
+        answer_key = grading.get_answer_key(db, quiz_id)
+        if not answer_key or quiz_id in cascades.deleted_targets(db, cascades.QUIZ):
+            return jsonify({"message": "Quiz not found."}), 404
+
+        result_doc = make_result_doc(quiz_id, username, *grading.grade(answer_key, user_answers))
+        write_buffer.insert('quiz_results', result_doc) # fold_results() runs once it is stored
+
+        return jsonify(submission_response(result_doc)), 200
+
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        return jsonify({"message": f"Error processing quiz submission: {e}"}), 500
 
+@bp.route('/submit_quiz/batch', methods=['POST'])
+def submit_quiz_batch():
     data = request.get_json()
-    quiz_id = data.get('quiz_id')
-    username = data.get('username')
-    user_answers = data.get('user_answers')
+    submissions = data.get('submissions') if data else None
 
-    if not all([quiz_id, username, user_answers]):
-        return jsonify({"message": "Missing quiz_id, username, or user_answers."}),
+    if not isinstance(submissions, list) or not submissions:
+        return jsonify({"message": "submissions must be a non-empty list."}), 400
+    if len(submissions) > MAX_BATCH_SUBMISSIONS:
+        return jsonify({"message": f"At most {MAX_BATCH_SUBMISSIONS} submissions per batch."}), 400
 
     try:
-        quiz = db.quizzes.find_one({'_id': ObjectId(quiz_id)}) # Find quiz by ObjectId
-        if not quiz:
-            return jsonify({"message": "Quiz not found."}),
-
-        correct_answers = [ord(q['correct_answer'].upper()) - ord('A') for q in quiz['questions']]
-        score = 0
-        detailed_results = []
-
-        for i, user_ans in enumerate(user_answers):
-            is_correct = (user_ans == correct_answers[i])
-            if is_correct:
-                score += 1
-            detailed_results.append({
-                "question_index": i,
-                "user_answer": user_ans,
-                "correct_answer": correct_answers[i],
-                "is_correct": is_correct
-            })
-        
-        total_questions = len(quiz['questions'])
-        percentage_score = (score / total_questions) * 100 if total_questions > 0 else 0
-
-        result_doc = {
-            "quiz_id": quiz_id,
-            "user_id": username, # Using username as user_id for simplicity
-            "score": score,
-            "total_questions": total_questions,
-            "percentage_score": percentage_score,
-            "detailed_results": detailed_results,
-            "submission_time": datetime.now()
-        }
-        db.quiz_results.insert_one(result_doc)
+        results = [None] * len(submissions)
+        parsed = [] # (index, quiz_id, username, user_answers) of the valid submissions
+        for index, submission in enumerate(submissions):
+            try:
+                parsed.append((index, *validation.parse_submission(submission)))
+            except ValidationError as e:
+                results[index] = {"index": index, "status": "error", "message": str(e)}
+
+        # One answer-key lookup per distinct quiz for the whole batch
+        answer_keys = grading.get_answer_keys(db, [quiz_id for _, quiz_id, _, _ in parsed])
+        deleted_quizzes = cascades.deleted_targets(db, cascades.QUIZ)
+
+        result_docs = []
+        doc_indexes = [] # result_docs[i] belongs to submissions[doc_indexes[i]]
+        for index, quiz_id, username, user_answers in parsed:
+            answer_key = answer_keys.get(quiz_id)
+            if not answer_key or quiz_id in deleted_quizzes:
+                results[index] = {"index": index, "status": "error", "message": "Quiz not found."}
+                continue
+
+            result_docs.append(make_result_doc(quiz_id, username, *grading.grade(answer_key, user_answers)))
+            doc_indexes.append(index)
+
+        # Unordered, so one bad document doesn't stop the rest of the batch
+        failed_docs = {}
+        if result_docs:
+            try:
+                db.quiz_results.insert_many(result_docs, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    failed_docs[error['index']] = error.get('errmsg', 'Write failed.')
+
+        scores = []
+        stored_docs = []
+        for doc_index, (index, doc) in enumerate(zip(doc_indexes, result_docs)):
+            if doc_index in failed_docs:
+                results[index] = {"index": index, "status": "error", "message": failed_docs[doc_index]}
+                continue
+            results[index] = {
+                "index": index,
+                "status": "ok",
+                "score": doc['score'],
+                "total_questions": doc['total_questions'],
+                "percentage_score": doc['percentage_score'],
+                "result_id": str(doc['_id'])
+            }
+            scores.append((doc['user_id'], answer_keys[doc['quiz_id']].category, doc['percentage_score'], doc['submission_time']))
+            stored_docs.append(doc)
+        leaderboard.record_scores(db, scores)
+        quiz_stats.record_results(db, stored_docs)
 
+        failed = sum(1 for r in results if r['status'] == 'error')
         return jsonify({
-            "message": "Quiz submitted successfully!",
-            "score": score,
-            "total_questions": total_questions,
-            "percentage_score": percentage_score,
-            "result_id": str(result_doc['_id'])
-        }), 200
-
+            "message": "Batch processed.",
+            "submitted": len(results) - failed,
+            "failed": failed,
+            "results": results
+        }), 207 if failed else 200
+
+    except ConnectionFailure:
+        raise
     except Exception as e:
-        return jsonify({"message": f"Error processing quiz submission: {e}"}), 500
+        return jsonify({"message": f"Error processing batch submission: {e}"}), 500
 
-@app.route('/results/<result_id>', methods=['GET'])
+@bp.route('/results/<result_id>', methods=['GET'])
 def get_quiz_result(result_id):
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
-
     try:
         result = db.quiz_results.find_one({'_id': ObjectId(result_id)})
+        if not result:
+            # Just submitted and still waiting in the write-behind buffer
+            result = write_buffer.pending('quiz_results', ObjectId(result_id))
         if not result:
             return jsonify({"message": "Result not found."}),
-        
-        result['_id'] = str(result['_id']) # Convert ObjectId to string
-        result['submission_time'] = result['submission_time'].isoformat() # Convert datetime to string
+
+        # Correct answers aren't stored with packed results; they come from the (cached) answer key
+        if result_codec.FIELD in result:
+            key = grading.get_answer_key(db, result['quiz_id']) if ObjectId.is_valid(result.get('quiz_id')) else None
+            result = result_codec.expand(result, key.answers if key else None)
 
         return jsonify(result), 200
 
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error fetching quiz result: {e}"}), 500
 
-@app.route('/leaderboard', methods=['GET'])
+@bp.route('/leaderboard', methods=['GET'])
 def get_leaderboard():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
+    category, window, limit = validation.parse_leaderboard(request.args)
 
     try:
-        # Aggregate to get the highest percentage_score for each user
-        leaderboard_data = db.quiz_results.aggregate([
-            {
-                '$group': {
-                    '_id': '$user_id',
-                    'username': {'$first': '$user_id'},
-                    'highest_score': {'$max': '$percentage_score'}
-                }
-            },
-            {
-                '$sort': {'highest_score': -1}
-            },
-            {
-                '$limit': 10 # Top 10 users
-            },
-            {
-                '$project': {
-                    '_id': 0, # Exclude _id
-                    'username': 1,
-                    'highest_score': {'$round': ['$highest_score', 2]} # Round to 2 decimal places
-                }
-            }
-        ])
-        
-        leaderboard = list(leaderboard_data)
-        return jsonify(leaderboard), 200
-
+        # Served from the materialized leaderboard collection maintained by submit_quiz
+        return jsonify(leaderboard.top_scores(
+            db, category=category, window=window, limit=limit,
+            exclude=cascades.pending_targets(db, cascades.USER)
+        )), 200
+
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error fetching leaderboard: {e}"}), 500
 
-@app.route('/profile/<username>', methods=['GET'])
+HISTORY_SORT = [('submission_time', -1), ('_id', -1)]
+
+# Per-question results are only needed by /results/<result_id>, so history pages leave them out
+HISTORY_PROJECTION = {'detailed_results': 0, 'packed_results': 0}
+
+def history_query(username, deleted_quizzes=()):
+    # Results of quizzes whose delete is still cascading are hidden already
+    query = {'user_id': username}
+    if deleted_quizzes:
+        query['quiz_id'] = {'$nin': list(deleted_quizzes)}
+    return query
+
+def profile_stats_pipeline(username, deleted_quizzes=()):
+    # Summary stats are computed server-side so clients don't need the full history
+    return [
+        {'$match': history_query(username, deleted_quizzes)},
+        {'$group': {
+            '_id': None,
+            'quizzes_taken': {'$sum': 1},
+            'average_score': {'$avg': '$percentage_score'},
+            'best_score': {'$max': '$percentage_score'}
+        }}
+    ]
+
+def summarize_profile_stats(stats):
+    if not stats:
+        return {"quizzes_taken": 0, "average_score": 0, "best_score": 0}
+    return {
+        "quizzes_taken": stats[0]['quizzes_taken'],
+        "average_score": round(stats[0]['average_score'] or 0, 2),
+        "best_score": round(stats[0]['best_score'] or 0, 2)
+    }
+
+def get_profile_stats(username, deleted_quizzes=()):
+    return summarize_profile_stats(list(db.quiz_results.aggregate(profile_stats_pipeline(username, deleted_quizzes))))
+
+def history_quiz_ids(results):
+    return list({ObjectId(r['quiz_id']) for r in results if ObjectId.is_valid(r.get('quiz_id'))})
+
+def attach_quiz_titles(results, titles):
+    for result in results:
+        if result.get('quiz_id') in titles:
+            result['quiz_title'] = titles[result['quiz_id']]
+    return results
+
+@bp.route('/profile/<username>', methods=['GET'])
 def get_user_profile(username):
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
+    summary_only = validation.is_truthy(request.args.get('summary', ''))
+    limit, after = validation.parse_page(request.args)
 
     try:
         user = db.users.find_one({"username": username}, {'password': 0}) # Exclude password
         if not user:
             return jsonify({"message": "User not found."}),
-        
-        user['_id'] = str(user['_id']) # Convert ObjectId to string
-
-        # Fetch quiz results for this user
-        user_quiz_results = []
-        for result in db.quiz_results.find({"user_id": username}).sort("submission_time", -1):
-            result['_id'] = str(result['_id'])
-            result['submission_time'] = result['submission_time'].isoformat()
-            
-            # Optionally fetch quiz title for each result
-            quiz = db.quizzes.find_one({'_id': ObjectId(result['quiz_id'])}, {'title': 1})
-            if quiz:
-                result['quiz_title'] = quiz['title']
-            
-            user_quiz_results.append(result)
-
-        user['quiz_history'] = user_quiz_results
+
+        deleted_quizzes = cascades.pending_targets(db, cascades.QUIZ)
+        user['stats'] = get_profile_stats(username, deleted_quizzes)
+
+        # Lightweight mode: summary stats only, no history
+        if summary_only:
+            return jsonify(user), 200
+
+        # Fetch one page of quiz results for this user, newest first
+        results, next_cursor = pagination.paginate(
+            db.quiz_results,
+            history_query(username, deleted_quizzes),
+            HISTORY_SORT,
+            limit,
+            after=after,
+            projection=HISTORY_PROJECTION
+        )
+
+        # Resolve all quiz titles for the page with a single $in query
+        quiz_ids = history_quiz_ids(results)
+        titles = {
+            str(quiz['_id']): quiz['title']
+            for quiz in db.quizzes.find({'_id': {'$in': quiz_ids}}, {'title': 1})
+        } if quiz_ids else {}
+
+        user['quiz_history'] = attach_quiz_titles(results, titles)
+        user['next_cursor'] = next_cursor
 
         return jsonify(user), 200
 
+    except pagination.InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error fetching user profile: {e}"}), 500
 
-@app.route('/admin/users', methods=['GET'])
+@bp.route('/admin/users', methods=['GET'])
 @admin_required
 def get_all_users():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
     try:
-        users = []
-        for user in db.users.find({}, {'password': 0}): # Exclude password
-            user['_id'] = str(user['_id'])
-            users.append(user)
+        users = list(db.users.find({}, {'password': 0})) # Exclude password
         return jsonify(users), 200
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error fetching users: {e}"}), 500
 
-@app.route('/admin/user/<username>/role', methods=['PUT'])
+def export_response(collection, export, query, export_format, limit, after):
+    # The cursor (and a bad `after` token) is checked before any of the body is sent
+    try:
+        cursor = exports.export_cursor(collection, export, query, export_format, limit, after)
+        next_cursor = pagination.next_page_cursor(collection, query, export.sort_fields, limit, after) if limit else None
+    except pagination.InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
+
+    headers = {"Cache-Control": "no-store"}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    if export_format == 'csv':
+        headers['Content-Disposition'] = f'attachment; filename="{export.name}.csv"'
+    return Response(
+        exports.stream_rows(cursor, export, export_format),
+        mimetype=exports.EXPORT_MIMETYPES[export_format],
+        headers=headers
+    )
+
+@bp.route('/admin/users/export', methods=['GET'])
+@admin_required
+def export_users():
+    # ?format=ndjson|csv&role=&created_from=&created_to=&limit=&after=
+    export_format, created_from, created_to, limit, after = validation.parse_export(request.args)
+    query = exports.user_query(request.args.get('role'), created_from, created_to)
+    return export_response(db.users, exports.USERS, query, export_format, limit, after)
+
+@bp.route('/admin/user/<username>/role', methods=['PUT'])
 @admin_required
 def update_user_role(username):
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
     data = request.get_json()
     new_role = data.get('role')
 
@@ -415,64 +760,118 @@ def update_user_role(username):
             {"username": username},
             {"$set": {"role": new_role}}
         )
+        role_cache.invalidate(username)
+        role_version.bump(db)
         if result.matched_count == 0:
             return jsonify({"message": "User not found."}),
         return jsonify({"message": "User role updated successfully!"}), 200
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error updating user role: {e}"}), 500
 
-@app.route('/admin/user/<username>', methods=['DELETE'])
+@bp.route('/admin/user/<username>', methods=['DELETE'])
 @admin_required
 def delete_user(username):
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
     try:
-        # Delete the user record
-        user_delete_result = db.users.delete_one({"username": username})
-        
-        # Optionally, delete associated data (quiz results, sessions) for this user
-        db.quiz_results.delete_many({"user_id": username})
-        db.user_sessions.delete_many({"username": username})
+        # The user is removed now; their quiz results and sessions in the background
+        job = cascade_deleter.delete_user(username)
+        role_cache.invalidate(username)
+        role_version.bump(db)
 
-        if user_delete_result.deleted_count == 0:
-            return jsonify({"message": "User not found."}),
-        
-        return jsonify({"message": "User deleted successfully!"}), 200
+        if job is None:
+            return jsonify({"message": "User not found."}), 404
+
+        return jsonify(deletion_queued_response("User deleted successfully!", job)), 202
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error deleting user: {e}"}), 500
 
-@app.route('/admin/category', methods=['POST'])
+@bp.route('/admin/cache_stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    return jsonify({
+        "role_cache": role_cache.stats(),
+        "answer_key_cache": grading.answer_key_cache.stats(),
+        "ai_generation_cache": generation_cache.stats(),
+        "ai_backend": ai_quiz_generator.get_backend().stats(),
+        "category_cache": {"version": category_cache.version, "loaded": category_cache.categories is not None}
+    }), 200
+
+def collect_service_metrics():
+    # Exposed at /metrics alongside the request and Mongo metrics
+    caches = {
+        "role": role_cache.stats(),
+        "answer_key": grading.answer_key_cache.stats(),
+        "ai_generation": generation_cache.memory.stats()
+    }
+    yield ('quiz_cache_hits_total', 'counter', 'In-process cache hits.',
+           [({"cache": name}, stats['hits']) for name, stats in caches.items()])
+    yield ('quiz_cache_misses_total', 'counter', 'In-process cache misses.',
+           [({"cache": name}, stats['misses']) for name, stats in caches.items()])
+    yield ('quiz_cache_entries', 'gauge', 'Entries held by an in-process cache.',
+           [({"cache": name}, stats['size']) for name, stats in caches.items()])
+
+    buffer_stats = write_buffer.stats()
+    yield ('quiz_write_buffer_queue_depth', 'gauge', 'Documents waiting in the write-behind buffer.',
+           [({}, buffer_stats['queue_depth'])])
+    yield ('quiz_write_buffer_documents_written_total', 'counter', 'Documents flushed by the write-behind buffer.',
+           [({}, buffer_stats['documents_written'])])
+    yield ('quiz_write_buffer_sync_fallbacks_total', 'counter', 'Inserts written synchronously because the buffer was full.',
+           [({}, buffer_stats['sync_fallbacks'])])
+    yield ('quiz_write_buffer_dead_lettered_total', 'counter', 'Documents dropped by the write-behind buffer after repeated failures.',
+           [({}, buffer_stats['dead_lettered'])])
+
+    ai_stats = ai_quiz_generator.get_backend().stats()
+    yield ('quiz_ai_calls_total', 'counter', 'Model calls, by outcome.',
+           [({"outcome": "ok"}, ai_stats['calls'] - ai_stats['failures']), ({"outcome": "error"}, ai_stats['failures'])])
+    yield ('quiz_ai_retries_total', 'counter', 'Model calls retried after a transient error.', [({}, ai_stats['retries'])])
+    yield ('quiz_ai_throttled_total', 'counter', 'Model calls refused by the concurrency or rate limit.', [({}, ai_stats['throttled'])])
+    yield ('quiz_ai_tokens_total', 'counter', 'Tokens reported by the model.',
+           [({"kind": "prompt"}, ai_stats['prompt_tokens']), ({"kind": "output"}, ai_stats['output_tokens'])])
+
+    job_stats = ai_job_manager.stats()
+    yield ('quiz_ai_jobs', 'gauge', 'AI generation jobs held by this process, by status.',
+           [({"status": status}, job_stats[status]) for status in ('queued', 'running', 'done', 'failed')])
+
+metrics.registry.register_collector(collect_service_metrics)
+
+@bp.route('/admin/write_buffer_stats', methods=['GET'])
+@admin_required
+def get_write_buffer_stats():
+    return jsonify(write_buffer.stats()), 200
+
+@bp.route('/admin/category', methods=['POST'])
 @admin_required
 def add_category():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
     data = request.get_json()
     name = data.get('name')
     description = data.get('description')
 
-    print(f"Attempting to add category: Name={name}, Description={description}") # Debugging
-
     if not name or not description:
-        print("Missing category name or description.") # Debugging
-        return jsonify({"message": "Missing category name or description."}),
+        logs.event(log, 'category_rejected', reason='missing_fields', name=name)
+        return jsonify({"message": "Missing category name or description."}), 400
     
     if db.categories.find_one({"name": name}):
-        print(f"Category '{name}' already exists.") # Debugging
-        return jsonify({"message": "Category with this name already exists."}),
+        logs.event(log, 'category_rejected', reason='duplicate', name=name)
+        return jsonify({"message": "Category with this name already exists."}), 400
 
     try:
         result = db.categories.insert_one({"name": name, "description": description})
-        print(f"Insert result: {result.inserted_id}") # Debugging
+        category_cache.bump(db)
+        # Admin actions are rare, so always keep these
+        logs.event(log, 'category_added', sampled=False, name=name, category_id=str(result.inserted_id))
         return jsonify({"message": "Category added successfully!"}), 201
+    except ConnectionFailure:
+        raise
     except Exception as e:
-        print(f"Error adding category: {e}") # Debugging
+        logs.event(log, 'category_add_failed', level=logging.ERROR, exc_info=True, name=name)
         return jsonify({"message": f"Error adding category: {e}"}), 500
 
-@app.route('/admin/category/<category_name>', methods=['PUT'])
+@bp.route('/admin/category/<category_name>', methods=['PUT'])
 @admin_required
 def update_category(category_name):
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
     data = request.get_json()
     new_description = data.get('description')
 
@@ -486,86 +885,254 @@ def update_category(category_name):
         )
         if result.matched_count == 0:
             return jsonify({"message": "Category not found."}),
+        category_cache.bump(db)
         return jsonify({"message": "Category updated successfully!"}), 200
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error updating category: {e}"}), 500
 
-@app.route('/admin/category/<category_name>', methods=['DELETE'])
+@bp.route('/admin/category/<category_name>', methods=['DELETE'])
 @admin_required
 def delete_category(category_name):
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
     try:
         result = db.categories.delete_one({"name": category_name})
         if result.deleted_count == 0:
             return jsonify({"message": "Category not found."}),
+        category_cache.bump(db)
         return jsonify({"message": "Category deleted successfully!"}), 200
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error deleting category: {e}"}), 500
 
-@app.route('/admin/quizzes', methods=['GET'])
+@bp.route('/admin/quizzes', methods=['GET'])
 @admin_required
 def get_all_quizzes_admin():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
     try:
-        quizzes = []
-        for quiz in db.quizzes.find({}):
-            quiz['_id'] = str(quiz['_id'])
-            quiz['created_at'] = quiz['created_at'].isoformat()
-            quizzes.append(quiz)
+        quizzes = list(db.quizzes.find({}))
         return jsonify(quizzes), 200
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error fetching quizzes: {e}"}), 500
 
-@app.route('/admin/quiz/<quiz_id>', methods=['DELETE'])
+@bp.route('/admin/quizzes/export', methods=['GET'])
+@admin_required
+def export_quizzes():
+    # ?format=ndjson|csv&category=&created_by=&created_from=&created_to=&limit=&after=
+    export_format, created_from, created_to, limit, after = validation.parse_export(request.args)
+    query = exports.quiz_query(request.args.get('category'), request.args.get('created_by'), created_from, created_to)
+    return export_response(db.quizzes, exports.QUIZZES, query, export_format, limit, after)
+
+@bp.route('/admin/quiz/<quiz_id>', methods=['DELETE'])
 @admin_required
 def delete_quiz_admin(quiz_id):
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
+    if not ObjectId.is_valid(quiz_id):
+        return jsonify({"message": "Invalid quiz id."}), 400
+
     try:
-        # Delete the quiz itself
-        quiz_delete_result = db.quizzes.delete_one({'_id': ObjectId(quiz_id)})
-        
-        # Optionally, delete associated quiz results
-        db.quiz_results.delete_many({'quiz_id': quiz_id})
+        # The quiz is removed now; its results in the background
+        job = cascade_deleter.delete_quiz(ObjectId(quiz_id))
+        grading.invalidate(quiz_id)
 
-        if quiz_delete_result.deleted_count == 0:
-            return jsonify({"message": "Quiz not found."}),
-        
-        return jsonify({"message": "Quiz deleted successfully!"}), 200
+        if job is None:
+            return jsonify({"message": "Quiz not found."}), 404
+
+        return jsonify(deletion_queued_response("Quiz deleted successfully!", job)), 202
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error deleting quiz: {e}"}), 500
 
-@app.route('/generate_quiz_ai', methods=['POST'])
+def deletion_queued_response(message, job):
+    return {
+        "message": message,
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "status_url": f"/admin/deletions/{job['job_id']}"
+    }
+
+@bp.route('/admin/deletions/<job_id>', methods=['GET'])
+@admin_required
+def get_deletion_job(job_id):
+    # Progress of a cascade: status and the number of rows deleted per collection
+    job = cascade_deleter.get(job_id)
+    if job is None:
+        return jsonify({"message": "Deletion job not found."}), 404
+    return jsonify(job), 200
+
+STREAM_MIMETYPES = validation.STREAM_MIMETYPES
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+GENERATION_FAILED = "Failed to generate quiz. Please try again or refine your content."
+
+def stream_event(stream_format, event, payload):
+    body = json.dumps(payload)
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {body}\n\n"
+    return json.dumps({"type": event, **payload}) + "\n"
+
+def stream_generated_quiz(params, stream_format):
+    count = 0
+    try:
+        for question in stream_quiz_from_content(**params):
+            yield stream_event(stream_format, 'question', {"index": count, "question": question})
+            count += 1
+    except Exception as e:
+        yield stream_event(stream_format, 'error', {"message": f"Error generating AI quiz: {e}"})
+        return
+    if count == 0:
+        yield stream_event(stream_format, 'error', {"message": GENERATION_FAILED})
+        return
+    yield stream_event(stream_format, 'done', {"message": "Quiz generated successfully!", "count": count})
+
+@bp.route('/generate_quiz_ai', methods=['POST'])
 def generate_quiz_ai():
-    if db is None:
-        return jsonify({"message": "Database not connected."}), 500
-    
-    data = request.get_json()
-    content = data.get('content')
-    num_questions = data.get('num_questions', 5) # Default to 5 questions
-    quiz_type = data.get('quiz_type', 'multiple choice')
-    difficulty = data.get('difficulty', 'medium')
+    params, run_async, stream_format = validation.parse_generation(
+        request.get_json(), request.args, request.accept_mimetypes.best
+    )
 
-    if not content:
-        return jsonify({"message": "Content for quiz generation is required."}), 400
+    # Streaming mode: emit each question as soon as the model has written it
+    if stream_format:
+        return Response(
+            stream_with_context(stream_generated_quiz(params, stream_format)),
+            mimetype=STREAM_MIMETYPES[stream_format],
+            headers=STREAM_HEADERS
+        )
+
+    # Job mode: hand the generation to the worker pool and return right away
+    if run_async:
+        try:
+            job = ai_job_manager.submit(**params)
+        except JobQueueFull as e:
+            return jsonify({"message": str(e)}), 503
+        return jsonify(job_queued_response(job)), 202
 
     try:
-        generated_quiz = generate_quiz_from_content(
-            content=content,
-            num_questions=num_questions,
-            quiz_type=quiz_type,
-            difficulty=difficulty
-        )
+        generated_quiz = generate_quiz_from_content(**params)
         
         if not generated_quiz:
-            return jsonify({"message": "Failed to generate quiz. Please try again or refine your content."}), 500
+            return jsonify({"message": GENERATION_FAILED}), 500
         
         return jsonify({"message": "Quiz generated successfully!", "quiz_data": generated_quiz}), 200
 
+    except AIGenerationError as e:
+        payload, status, headers = ai_error_response(e)
+        return jsonify(payload), status, headers
+    except ConnectionFailure:
+        raise
     except Exception as e:
         return jsonify({"message": f"Error generating AI quiz: {e}"}), 500
 
+def job_queued_response(job):
+    return {
+        "message": "Quiz generation queued.",
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "status_url": f"/generate_quiz_ai/{job['job_id']}"
+    }
+
+def ai_error_response(e):
+    # Quota/overload: tell the client to come back; anything else is an upstream failure
+    if e.transient:
+        return {"message": f"AI service is busy. Please try again shortly. ({e})"}, 503, {"Retry-After": "30"}
+    return {"message": f"Error generating AI quiz: {e}"}, 502, {}
+
+@bp.route('/generate_quiz_ai/<job_id>', methods=['GET'])
+def get_generate_quiz_ai_job(job_id):
+    # ?wait=<seconds> long-polls until the job finishes or the wait runs out
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), AI_JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"message": "wait must be a number of seconds."}), 400
+
+    job = ai_job_manager.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"message": "Job not found."}), 404
+
+    response = {"job_id": job_id, "status": job['status']}
+    if job['status'] == 'done':
+        response["message"] = "Quiz generated successfully!"
+        response["quiz_data"] = job['result']
+    elif job['status'] == 'failed':
+        response["message"] = f"Failed to generate quiz: {job['error']}"
+    return jsonify(response), 200
+
+@bp.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Creates all required indexes and checks hot queries don't COLLSCAN."""
+    try:
+        indexes.apply_indexes(db)
+        indexes.verify_query_plans(db)
+    except indexes.IndexVerificationError as e:
+        raise SystemExit(str(e))
+    print("Indexes created and query plans verified.")
+
+DEFAULT_CATEGORIES = [
+    {"name": "Science", "description": "Questions about various scientific fields."},
+    {"name": "History", "description": "Events and figures from the past."},
+    {"name": "Mathematics", "description": "Problems and concepts in mathematics."},
+    {"name": "Literature", "description": "Works and authors of literature."}
+]
+
+@bp.cli.command('seed-categories')
+def seed_categories_command():
+    """Adds the default categories if the categories collection is empty."""
+    if db.categories.count_documents({}) > 0:
+        print("Categories already present; nothing to do.")
+        return
+    db.categories.insert_many([dict(category) for category in DEFAULT_CATEGORIES])
+    category_cache.bump(db)
+    print("Default categories added.")
+
+@bp.cli.command('resume-deletions')
+def resume_deletions_command():
+    """Finishes user and quiz deletes whose cascade was interrupted or failed."""
+    count = cascade_deleter.resume()
+    print(f"Finished {count} deletion(s).")
+
+@bp.cli.command('compact-results')
+@click.option('--batch-size', default=result_codec.MIGRATION_BATCH_SIZE, show_default=True, help='Results rewritten per batch.')
+@click.option('--dry-run', is_flag=True, help='Report the savings without rewriting anything.')
+def compact_results_command(batch_size, dry_run):
+    """Rewrites quiz results stored in the old detailed_results format in the packed one."""
+    report = result_codec.migrate(db, grading.get_answer_keys, batch_size=batch_size, dry_run=dry_run)
+    saved = report['bytes_before'] - report['bytes_after']
+    percent = round(100 * saved / report['bytes_before'], 1) if report['bytes_before'] else 0
+    print(f"{'Would compact' if dry_run else 'Compacted'} {report['compacted']} of {report['scanned']} old-format results "
+          f"({report['skipped']} skipped: their quiz is gone or differs, or an answer doesn't pack).")
+    print(f"Size of those results: {report['bytes_before']} -> {report['bytes_after']} bytes, {saved} saved ({percent}%).")
+
+@bp.cli.command('rebuild-quiz-stats')
+@click.option('--quiz-id', default=None, help='Rebuild one quiz only.')
+def rebuild_quiz_stats_command(quiz_id):
+    """Recomputes the per-quiz analytics counters from existing quiz results."""
+    count = quiz_stats.rebuild(db, quiz_id)
+    print(f"Quiz stats rebuilt for {count} quiz(zes).")
+
+@bp.cli.command('check-quiz-stats')
+@click.option('--quiz-id', default=None, help='Check one quiz only.')
+@click.option('--fix', is_flag=True, help='Rebuild the quizzes whose counters differ.')
+def check_quiz_stats_command(quiz_id, fix):
+    """Compares the analytics counters with the raw quiz results."""
+    mismatches = quiz_stats.check(db, quiz_id)
+    for stats_quiz_id, diff in sorted(mismatches.items()):
+        fields = ', '.join(f"{field}: {have} (expected {want})" for field, (have, want) in sorted(diff.items()))
+        print(f"{stats_quiz_id}: {fields}")
+        if fix:
+            quiz_stats.rebuild(db, stats_quiz_id)
+    if not mismatches:
+        print("Quiz stats match the quiz results.")
+    elif fix:
+        print(f"Rebuilt {len(mismatches)} quiz(zes).")
+    else:
+        raise SystemExit(f"{len(mismatches)} quiz(zes) differ; run with --fix to rebuild them.")
+
+@bp.cli.command('rebuild-leaderboard')
+def rebuild_leaderboard_command():
+    """Rebuilds the materialized leaderboard from existing quiz results."""
+    processed = leaderboard.rebuild(db)
+    print(f"Leaderboard rebuilt from {processed} quiz results.")
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
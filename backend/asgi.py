@@ -0,0 +1,362 @@
+import asyncio
+import contextlib
+import time
+from a2wsgi import WSGIMiddleware
+from bson.objectid import ObjectId
+from pymongo.errors import ConnectionFailure
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import generate_etag, parse_accept_header, parse_etags
+from ai_client import AIGenerationError
+from ai_jobs import JobQueueFull
+from ai_quiz_generator import generate_quiz_from_content
+import app as sync_app
+import cascades
+import compression
+from extensions import async_mongo
+import grading
+import json_provider
+import leaderboard
+import metrics
+import pagination
+import passwords
+import quiz_stats
+import search
+import validation
+from validation import ValidationError
+
+# Async (ASGI) serving mode. Run with:
+#
+#     uvicorn --factory asgi:create_app
+#
+# The hot endpoints below run on the event loop against Motor, sharing one
+# connection pool across all in-flight requests, so a slow Mongo or model call
+# no longer pins a worker. Every other route is served by the regular Flask
+# app, mounted underneath on a thread pool. Both apps use the same validation,
+# grading, pagination and leaderboard code, and the same in-process caches.
+#
+# Work that is inherently blocking (bcrypt on the password pool, the model
+# client) is awaited on a worker thread via asyncio.to_thread.
+
+db = None # Motor database, set when the app starts
+settings = None # The Flask app's config, set by create_app()
+
+
+class FastJSONResponse(JSONResponse):
+    # Same encoder as the Flask app's JSON provider (ObjectId and datetime included)
+
+    def render(self, content):
+        return json_provider.dumps_bytes(content)
+
+
+def json_response(payload, status=200, headers=None):
+    return FastJSONResponse(payload, status_code=status, headers=headers)
+
+
+def conditional_json(request, payload, headers=None):
+    # Same contract as the Flask app: an ETag over the body, 304 on If-None-Match
+    response = json_response(payload, headers=headers)
+    etag = generate_etag(response.body)
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+        return Response(status_code=304, headers={**(headers or {}), 'ETag': f'"{etag}"'})
+    response.headers['ETag'] = f'"{etag}"'
+    return response
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise ValidationError("Request body must be JSON.")
+
+
+async def insert_buffered(collection_name, doc):
+    # The buffered write modes only enqueue in memory; in sync mode write
+    # through Motor rather than blocking the loop on pymongo. Returns True if
+    # the write was left to the buffer (which runs its on_written callbacks).
+    if sync_app.write_buffer.buffered:
+        sync_app.write_buffer.insert(collection_name, doc)
+        return True
+    doc.setdefault('_id', ObjectId())
+    await db[collection_name].insert_one(doc)
+    return False
+
+
+async def login(request):
+    username, password = validation.parse_login(await read_json(request))
+
+    user = await db.users.find_one({"username": username})
+
+    try:
+        password_ok = user is not None and await asyncio.to_thread(passwords.check_password, user['password'], password)
+    except passwords.PasswordPoolBusy:
+        return json_response({"message": "Server busy. Please try again."}, 503)
+
+    if not password_ok:
+        return json_response({"message": "Invalid username or password."}, 401)
+
+    # Upgrade the stored hash if it was made with a different work factor (best effort)
+    if passwords.needs_rehash(user['password']):
+        try:
+            rehashed = await asyncio.to_thread(passwords.hash_password, password)
+            await db.users.update_one(
+                {"_id": user['_id'], "password": user['password']},
+                {"$set": {"password": rehashed}}
+            )
+        except passwords.PasswordPoolBusy:
+            pass
+    await insert_buffered('user_sessions', sync_app.make_session_doc(user))
+    return json_response(sync_app.login_response(user))
+
+
+async def submit_quiz(request):
+    quiz_id, username, user_answers = validation.parse_submission(await read_json(request))
+    if not ObjectId.is_valid(quiz_id):
+        return json_response({"message": "Invalid quiz id."}, 400)
+
+    try:
+        answer_key = await grading.get_answer_key_async(db, quiz_id)
+        if not answer_key or quiz_id in await cascades.deleted_targets_async(db, cascades.QUIZ):
+            return json_response({"message": "Quiz not found."}, 404)
+
+        result_doc = sync_app.make_result_doc(quiz_id, username, *grading.grade(answer_key, user_answers))
+        if not await insert_buffered('quiz_results', result_doc):
+            # Stored now; buffered results are folded in by sync_app.fold_results once written
+            await leaderboard.record_score_async(
+                db, username, answer_key.category, result_doc['percentage_score'], result_doc['submission_time']
+            )
+            await quiz_stats.record_result_async(db, result_doc)
+        return json_response(sync_app.submission_response(result_doc))
+
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        return json_response({"message": f"Error processing quiz submission: {e}"}, 500)
+
+
+async def get_quizzes(request):
+    query = sync_app.quiz_list_query(request.query_params)
+    limit, after = validation.parse_page(request.query_params)
+
+    try:
+        quizzes, next_cursor = await pagination.paginate_async(
+            db.quizzes,
+            query,
+            sync_app.QUIZ_LIST_SORT,
+            limit,
+            after=after,
+            projection=sync_app.QUIZ_SUMMARY_PROJECTION
+        )
+    except pagination.InvalidCursor as e:
+        return json_response({"message": str(e)}, 400)
+
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return conditional_json(request, quizzes, headers)
+
+
+async def search_quizzes(request):
+    text, category, limit, after = validation.parse_search(request.query_params)
+    try:
+        return json_response(await search.search_async(db, text, category=category, limit=limit, after=after))
+    except pagination.InvalidCursor as e:
+        return json_response({"message": str(e)}, 400)
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        return json_response({"message": f"Error searching quizzes: {e}"}, 500)
+
+
+async def get_leaderboard(request):
+    category, window, limit = validation.parse_leaderboard(request.query_params)
+    try:
+        deleted_users = await cascades.pending_targets_async(db, cascades.USER)
+        return json_response(await leaderboard.top_scores_async(
+            db, category=category, window=window, limit=limit, exclude=deleted_users
+        ))
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        return json_response({"message": f"Error fetching leaderboard: {e}"}, 500)
+
+
+async def get_user_profile(request):
+    username = request.path_params['username']
+    summary_only = validation.is_truthy(request.query_params.get('summary', ''))
+    limit, after = validation.parse_page(request.query_params)
+
+    try:
+        user = await db.users.find_one({"username": username}, {'password': 0}) # Exclude password
+        if not user:
+            return json_response({"message": "User not found."}, 404)
+
+        deleted_quizzes = await cascades.pending_targets_async(db, cascades.QUIZ)
+        stats = await db.quiz_results.aggregate(sync_app.profile_stats_pipeline(username, deleted_quizzes)).to_list(None)
+        user['stats'] = sync_app.summarize_profile_stats(stats)
+        if summary_only:
+            return json_response(user)
+
+        results, next_cursor = await pagination.paginate_async(
+            db.quiz_results,
+            sync_app.history_query(username, deleted_quizzes),
+            sync_app.HISTORY_SORT,
+            limit,
+            after=after,
+            projection=sync_app.HISTORY_PROJECTION
+        )
+
+        quiz_ids = sync_app.history_quiz_ids(results)
+        titles = {
+            str(quiz['_id']): quiz['title']
+            async for quiz in db.quizzes.find({'_id': {'$in': quiz_ids}}, {'title': 1})
+        } if quiz_ids else {}
+
+        user['quiz_history'] = sync_app.attach_quiz_titles(results, titles)
+        user['next_cursor'] = next_cursor
+        return json_response(user)
+
+    except pagination.InvalidCursor as e:
+        return json_response({"message": str(e)}, 400)
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        return json_response({"message": f"Error fetching user profile: {e}"}, 500)
+
+
+async def stream_generated_quiz(params, stream_format):
+    # The model client is synchronous, so each event is pulled on a worker thread
+    events = sync_app.stream_generated_quiz(params, stream_format)
+    try:
+        while True:
+            event = await asyncio.to_thread(next, events, None)
+            if event is None:
+                return
+            yield event
+    finally:
+        # Client went away: close the generator so its model call slot is released
+        await asyncio.to_thread(events.close)
+
+
+async def generate_quiz_ai(request):
+    accept = parse_accept_header(request.headers.get('accept'), MIMEAccept)
+    params, run_async, stream_format = validation.parse_generation(await read_json(request), request.query_params, accept.best)
+
+    if stream_format:
+        return StreamingResponse(
+            stream_generated_quiz(params, stream_format),
+            media_type=sync_app.STREAM_MIMETYPES[stream_format],
+            headers=sync_app.STREAM_HEADERS
+        )
+
+    if run_async:
+        try:
+            job = await asyncio.to_thread(sync_app.ai_job_manager.submit, **params)
+        except JobQueueFull as e:
+            return json_response({"message": str(e)}, 503)
+        return json_response(sync_app.job_queued_response(job), 202)
+
+    try:
+        generated_quiz = await asyncio.to_thread(generate_quiz_from_content, **params)
+        if not generated_quiz:
+            return json_response({"message": sync_app.GENERATION_FAILED}, 500)
+        return json_response({"message": "Quiz generated successfully!", "quiz_data": generated_quiz})
+
+    except AIGenerationError as e:
+        payload, status, headers = sync_app.ai_error_response(e)
+        return json_response(payload, status, headers)
+    except Exception as e:
+        return json_response({"message": f"Error generating AI quiz: {e}"}, 500)
+
+
+def compress_response(request, response):
+    # compression.init_app() does this for the Flask routes
+    response.headers.append('Vary', 'Accept-Encoding')
+    if isinstance(response, StreamingResponse) or not compression.should_compress(
+            response.status_code, response.headers.get('content-type'), response.headers.get('content-encoding'),
+            len(response.body), settings['COMPRESS_MIN_SIZE']):
+        return
+    encoding = compression.choose_encoding(request.headers.get('accept-encoding'))
+    if encoding is None:
+        return
+    response.body = compression.compress(response.body, encoding, settings['COMPRESS_LEVEL'], settings['COMPRESS_BROTLI_QUALITY'])
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(response.body))
+    if 'etag' in response.headers:
+        response.headers['ETag'] = compression.weaken_etag(response.headers['etag'])
+
+
+def instrumented(route, endpoint, method):
+    # Times the route like metrics.init_app() does for Flask routes, and maps
+    # the errors the Flask app handles with errorhandlers to the same responses
+    label = route.replace('{', '<').replace('}', '>')
+
+    async def handle(request):
+        started = time.perf_counter()
+        stats, token = metrics.start_request()
+        try:
+            try:
+                response = await endpoint(request)
+            except ValidationError as e:
+                response = json_response({"message": str(e)}, e.status)
+            except ConnectionFailure:
+                response = json_response({"message": "Database not connected."}, 503)
+        finally:
+            metrics.end_request(token)
+        compress_response(request, response)
+        metrics.observe_request(
+            request.method,
+            label,
+            response.status_code,
+            time.perf_counter() - started,
+            stats,
+            request_bytes=int(request.headers.get('content-length') or 0),
+            response_bytes=None if isinstance(response, StreamingResponse) else len(response.body)
+        )
+        return response
+
+    return Route(route, handle, methods=[method])
+
+
+def create_app(config=None):
+    """
+    Builds the ASGI app: the async routes, with the Flask app from
+    app.create_app(config) mounted underneath for everything else.
+    """
+    global settings
+    flask_app = sync_app.create_app(config)
+    settings = flask_app.config
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        global db
+        # Created inside the running loop, which Motor binds to
+        async_mongo.init_app(flask_app.config)
+        db = async_mongo.db
+        yield
+        async_mongo.close()
+
+    routes = [
+        instrumented('/login', login, 'POST'),
+        instrumented('/submit_quiz', submit_quiz, 'POST'),
+        instrumented('/quizzes', get_quizzes, 'GET'),
+        instrumented('/quizzes/search', search_quizzes, 'GET'),
+        instrumented('/leaderboard', get_leaderboard, 'GET'),
+        instrumented('/profile/{username}', get_user_profile, 'GET'),
+        instrumented('/generate_quiz_ai', generate_quiz_ai, 'POST'),
+        # Everything else, including other methods on the paths above
+        Mount('/', app=WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_SYNC_WORKERS']))
+    ]
+    return Starlette(
+        routes=routes,
+        middleware=[Middleware(
+            CORSMiddleware,
+            allow_origins=['*'],
+            allow_methods=['*'],
+            allow_headers=['*'],
+            expose_headers=['ETag', 'X-Next-Cursor']
+        )],
+        lifespan=lifespan
+    )
@@ -0,0 +1,446 @@
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo import MongoClient
+import grading
+import indexes
+import leaderboard
+import passwords
+import quiz_stats
+
+# Load-test and benchmark harness for the backend API.
+#
+#   python benchmark.py seed --users 2000 --quizzes 200 --results 50000
+#   python benchmark.py run --spawn --mix default --concurrency 16 --duration 30 \
+#       --save-baseline baseline.json
+#   python benchmark.py run --spawn --baseline baseline.json --threshold 0.15
+#
+# `seed` fills a dedicated database (quiz_benchmark by default) with users,
+# quizzes and results. `run` replays a weighted mix of requests against a
+# server from `--concurrency` client threads for `--duration` seconds and
+# reports throughput and p50/p95/p99 latency per endpoint. With --baseline it
+# exits non-zero if any endpoint regressed by more than --threshold.
+#
+# --spawn starts the server itself against the benchmark database with the
+# stub AI backend (AI_BACKEND=stub), so /generate_quiz_ai is measured offline.
+# Against an already running server, the run refuses to send AI traffic unless
+# the server reports the stub backend or --allow-real-ai is given.
+#
+# Seeded users are named bench_user_<n> and share BENCH_PASSWORD; the admin
+# account is bench_admin.
+
+BENCH_DB = 'quiz_benchmark'
+BENCH_PASSWORD = 'benchmark-password'
+BENCH_ADMIN = 'bench_admin'
+CATEGORIES = ['Science', 'History', 'Mathematics', 'Literature']
+SEED_BATCH_SIZE = 1000
+
+# Relative weights of each operation in a traffic mix
+MIXES = {
+    'default': {
+        'list_quizzes': 30, 'submit_quiz': 20, 'leaderboard': 15, 'profile': 12,
+        'login': 10, 'signup': 3, 'admin_users': 3, 'get_quiz': 5, 'generate_quiz_ai': 2
+    },
+    'read_heavy': {
+        'list_quizzes': 40, 'leaderboard': 25, 'profile': 20, 'get_quiz': 10, 'login': 5
+    },
+    'write_heavy': {
+        'submit_quiz': 60, 'login': 15, 'signup': 10, 'list_quizzes': 10, 'leaderboard': 5
+    },
+    'ai': {
+        'generate_quiz_ai': 100
+    }
+}
+
+# Comparisons need enough samples to be meaningful
+MIN_SAMPLES = 20
+
+PASSAGES = [
+    f"Passage {n}: " + " ".join(
+        f"The {subject} of topic {n} is described in sentence {i}." for i, subject in enumerate(
+            ['history', 'structure', 'function', 'origin', 'impact', 'future'] * 3
+        )
+    )
+    for n in range(20)
+]
+
+
+def seed(db, users, quizzes, results, questions_per_quiz, drop=False):
+    """Fills `db` with benchmark data and builds the indexes, leaderboard and quiz stats."""
+    if drop:
+        # Derived collections and tombstones too, so no counters or deletions from an earlier run remain
+        for name in ('users', 'quizzes', 'quiz_results', 'categories', 'leaderboard', 'user_sessions',
+                     'quiz_stats', 'cache_versions', 'deletions'):
+            db[name].drop()
+    rng = random.Random(42) # Same data on every seed
+
+    # One bcrypt hash for everyone; logins still pay the full verification cost
+    hashed = passwords.hash_password(BENCH_PASSWORD)
+    user_docs = [{"username": BENCH_ADMIN, "email": f"{BENCH_ADMIN}@bench.local", "password": hashed, "role": "admin"}]
+    user_docs += [
+        {"username": f"bench_user_{n}", "email": f"bench_user_{n}@bench.local", "password": hashed, "role": "user"}
+        for n in range(users)
+    ]
+    for start in range(0, len(user_docs), SEED_BATCH_SIZE):
+        db.users.insert_many(user_docs[start:start + SEED_BATCH_SIZE])
+
+    db.categories.insert_many([{"name": name, "description": f"{name} questions."} for name in CATEGORIES])
+
+    now = datetime.now()
+    quiz_docs = []
+    for n in range(quizzes):
+        quiz_docs.append({
+            "title": f"Benchmark quiz {n}",
+            "description": "Generated by benchmark.py.",
+            "category": CATEGORIES[n % len(CATEGORIES)],
+            "created_by": BENCH_ADMIN,
+            "questions": [
+                {
+                    "question_text": f"Question {q} of quiz {n}?",
+                    "options": ["A", "B", "C", "D"],
+                    "correct_answer": rng.choice("ABCD")
+                }
+                for q in range(questions_per_quiz)
+            ],
+            "created_at": now - timedelta(minutes=quizzes - n)
+        })
+    db.quizzes.insert_many(quiz_docs)
+    keys = [grading.compile_answer_key(quiz) for quiz in quiz_docs]
+
+    batch = []
+    for _ in range(results):
+        key = rng.choice(keys)
+        answers = [rng.randrange(4) for _ in key.answers]
+        score, total, pct, stored_results = grading.grade(key, answers)
+        batch.append({
+            "quiz_id": key.quiz_id,
+            "user_id": f"bench_user_{rng.randrange(users)}" if users else BENCH_ADMIN,
+            "score": score,
+            "total_questions": total,
+            "percentage_score": pct,
+            **stored_results,
+            "submission_time": now - timedelta(seconds=rng.randrange(30 * 86400))
+        })
+        if len(batch) >= SEED_BATCH_SIZE:
+            db.quiz_results.insert_many(batch)
+            batch = []
+    if batch:
+        db.quiz_results.insert_many(batch)
+
+    indexes.apply_indexes(db)
+    leaderboard.rebuild(db)
+    quiz_stats.rebuild(db)
+
+
+class Workload:
+    """Builds requests for each operation from the seeded data."""
+
+    def __init__(self, db):
+        self.usernames = [
+            user['username']
+            for user in db.users.find({"username": {"$regex": "^bench_user_"}}, {"username": 1}).limit(5000)
+        ]
+        self.quizzes = [
+            (str(quiz['_id']), quiz['question_count'])
+            for quiz in db.quizzes.aggregate([
+                {'$match': {'created_by': BENCH_ADMIN}},
+                {'$limit': 5000},
+                {'$project': {'question_count': {'$size': '$questions'}}}
+            ])
+        ]
+        if not self.usernames or not self.quizzes:
+            raise SystemExit("No benchmark data found; run `python benchmark.py seed` first.")
+
+    # Each operation draws from the calling thread's `rng` and returns
+    # (method, path, json_body, headers)
+
+    def list_quizzes(self, rng):
+        category = rng.choice([None] + CATEGORIES)
+        return 'GET', '/quizzes' + (f'?category={category}' if category else ''), None, {}
+
+    def get_quiz(self, rng):
+        return 'GET', f'/quizzes/{rng.choice(self.quizzes)[0]}', None, {}
+
+    def submit_quiz(self, rng):
+        quiz_id, question_count = rng.choice(self.quizzes)
+        return 'POST', '/submit_quiz', {
+            "quiz_id": quiz_id,
+            "username": rng.choice(self.usernames),
+            "user_answers": [rng.randrange(4) for _ in range(question_count)]
+        }, {}
+
+    def leaderboard(self, rng):
+        window = rng.choice(['all', 'all', 'weekly', 'daily'])
+        category = rng.choice([None] + CATEGORIES)
+        return 'GET', f'/leaderboard?window={window}' + (f'&category={category}' if category else ''), None, {}
+
+    def profile(self, rng):
+        return 'GET', f'/profile/{rng.choice(self.usernames)}', None, {}
+
+    def login(self, rng):
+        return 'POST', '/login', {"username": rng.choice(self.usernames), "password": BENCH_PASSWORD}, {}
+
+    def signup(self, rng):
+        name = f"bench_signup_{uuid.uuid4().hex[:12]}"
+        return 'POST', '/signup', {"username": name, "email": f"{name}@bench.local", "password": BENCH_PASSWORD}, {}
+
+    def admin_users(self, rng):
+        return 'GET', '/admin/users', None, {"X-User-Username": BENCH_ADMIN}
+
+    def generate_quiz_ai(self, rng):
+        return 'POST', '/generate_quiz_ai', {"content": rng.choice(PASSAGES), "num_questions": 5}, {}
+
+
+def send(base_url, method, path, body, headers, timeout):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method, headers={
+        **headers, **({"Content-Type": "application/json"} if data else {})
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return 0 # Connection error or timeout
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """Turns {operation: [(seconds, status)]} into per-endpoint stats."""
+    endpoints = {}
+    for operation, entries in sorted(samples.items()):
+        latencies = sorted(seconds for seconds, _ in entries)
+        errors = sum(1 for _, status in entries if status == 0 or status >= 500)
+        endpoints[operation] = {
+            "requests": len(entries),
+            "errors": errors,
+            "throughput_rps": round(len(entries) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+        }
+    total = sum(len(entries) for entries in samples.values())
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "total_requests": total,
+        "total_throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints
+    }
+
+
+def run_load(base_url, workload, mix, concurrency, duration, warmup=0.0, timeout=30.0, seed_value=None):
+    """
+    Sends requests drawn from `mix` from `concurrency` threads for `duration`
+    seconds (after `warmup` seconds whose samples are discarded).
+
+    Returns:
+        dict: The summary from summarize().
+    """
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    samples = {op: [] for op in operations}
+    lock = threading.Lock()
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        rng = random.Random(None if seed_value is None else seed_value + index)
+        local = {op: [] for op in operations}
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            operation = rng.choices(operations, weights)[0]
+            method, path, body, headers = getattr(workload, operation)(rng)
+            request_started = time.monotonic()
+            status = send(base_url, method, path, body, headers, timeout)
+            finished = time.monotonic()
+            if request_started >= measure_from and finished <= stop_at:
+                local[operation].append((finished - request_started, status))
+        with lock:
+            for op, entries in local.items():
+                samples[op].extend(entries)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+
+    return summarize({op: entries for op, entries in samples.items() if entries}, duration)
+
+
+def compare(current, baseline, threshold):
+    """
+    Compares two summaries endpoint by endpoint.
+
+    Returns:
+        list: Descriptions of every metric that regressed by more than `threshold`
+              (a fraction): higher p50/p95/p99 latency, lower throughput, or new errors.
+    """
+    regressions = []
+    for operation, base in baseline.get("endpoints", {}).items():
+        now = current["endpoints"].get(operation)
+        if now is None or now["requests"] < MIN_SAMPLES or base["requests"] < MIN_SAMPLES:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[metric] > 0 and now[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{operation} {metric}: {base[metric]} -> {now[metric]}")
+        if now["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{operation} throughput_rps: {base['throughput_rps']} -> {now['throughput_rps']}")
+        if now["errors"] / now["requests"] > base["errors"] / base["requests"] + threshold / 10:
+            regressions.append(f"{operation} error rate: {base['errors']}/{base['requests']} -> {now['errors']}/{now['requests']}")
+    return regressions
+
+
+def print_report(summary):
+    print(f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation, stats in summary["endpoints"].items():
+        print(f"{operation:<18}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"total: {summary['total_requests']} requests, {summary['total_throughput_rps']} req/s")
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if send(base_url, 'GET', '/status', None, {}, timeout=2) == 200:
+            return
+        time.sleep(0.2)
+    raise SystemExit(f"Server at {base_url} did not come up within {timeout}s.")
+
+
+def spawn_server(args):
+    env = dict(
+        os.environ,
+        MONGODB_URI=args.mongodb_uri,
+        MONGODB_DB=args.db,
+        AI_BACKEND='stub',
+        AI_STUB_LATENCY=str(args.stub_latency),
+        LOG_SAMPLE_RATE='0'
+    )
+    if args.server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', '--factory', 'asgi:create_app',
+                   '--port', str(args.port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(args.port), '--with-threads']
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            stdout=subprocess.DEVNULL)
+
+
+def check_ai_backend(base_url, mix, allow_real_ai):
+    # Never spend real model quota by accident
+    if 'generate_quiz_ai' not in mix or allow_real_ai:
+        return mix
+    request = urllib.request.Request(base_url + '/admin/cache_stats', headers={"X-User-Username": BENCH_ADMIN})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            model = json.load(response).get('ai_backend', {}).get('model')
+    except (urllib.error.URLError, OSError, ValueError):
+        model = None
+    if model == 'stub':
+        return mix
+    print("Server is not using the stub AI backend; skipping generate_quiz_ai (use --allow-real-ai to include it).")
+    return {op: weight for op, weight in mix.items() if op != 'generate_quiz_ai'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed and load-test the quiz backend.")
+    parser.add_argument('--mongodb-uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default=os.getenv('BENCH_DB', BENCH_DB), help="Benchmark database name.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help="Fill the benchmark database.")
+    seed_parser.add_argument('--users', type=int, default=1000)
+    seed_parser.add_argument('--quizzes', type=int, default=100)
+    seed_parser.add_argument('--results', type=int, default=20000)
+    seed_parser.add_argument('--questions', type=int, default=10, help="Questions per quiz.")
+    seed_parser.add_argument('--drop', action='store_true', help="Drop existing benchmark data first.")
+
+    run_parser = commands.add_parser('run', help="Replay a traffic mix and report latency.")
+    run_parser.add_argument('--url', default='http://localhost:5000')
+    run_parser.add_argument('--spawn', action='store_true', help="Start the server against the benchmark database.")
+    run_parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi', help="Server to start with --spawn.")
+    run_parser.add_argument('--port', type=int, default=5055, help="Port for --spawn.")
+    run_parser.add_argument('--stub-latency', type=float, default=0.2, help="Stub AI latency (seconds) for --spawn.")
+    run_parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=30)
+    run_parser.add_argument('--warmup', type=float, default=3)
+    run_parser.add_argument('--timeout', type=float, default=30, help="Per-request timeout in seconds.")
+    run_parser.add_argument('--seed', type=int, default=None, help="Random seed for a repeatable request sequence.")
+    run_parser.add_argument('--allow-real-ai', action='store_true')
+    run_parser.add_argument('--output', help="Write the summary JSON here.")
+    run_parser.add_argument('--save-baseline', help="Write the summary JSON as the new baseline.")
+    run_parser.add_argument('--baseline', help="Compare against this baseline and fail on regressions.")
+    run_parser.add_argument('--threshold', type=float, default=0.10, help="Allowed regression, as a fraction.")
+
+    args = parser.parse_args(argv)
+    db = MongoClient(args.mongodb_uri, serverSelectionTimeoutMS=5000)[args.db]
+
+    if args.command == 'seed':
+        started = time.monotonic()
+        seed(db, args.users, args.quizzes, args.results, args.questions, drop=args.drop)
+        print(f"Seeded {args.db} in {time.monotonic() - started:.1f}s.")
+        return 0
+
+    server = None
+    base_url = args.url
+    if args.spawn:
+        server = spawn_server(args)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_up(base_url)
+        workload = Workload(db)
+        mix = check_ai_backend(base_url, MIXES[args.mix], args.allow_real_ai)
+        summary = run_load(base_url, workload, mix, args.concurrency, args.duration,
+                           warmup=args.warmup, timeout=args.timeout, seed_value=args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary["config"] = {
+        "mix": args.mix, "concurrency": args.concurrency, "duration": args.duration,
+        "server": args.server if args.spawn else base_url
+    }
+    print_report(summary)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(summary, json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from pymongo import ReturnDocument
+
+# Small in-process caches shared by the request handlers.
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Args:
+        maxsize (int): Maximum number of entries; the least recently used entry
+                       is evicted when it is exceeded.
+        ttl (float): Seconds an entry stays valid. None disables expiry.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class VersionStamp:
+    """
+    A version counter in the cache_versions collection, shared by every worker.
+
+    A worker that changes cached data bumps it; the others see the new version
+    at most `check_interval` seconds later and drop what they cached.
+
+    Args:
+        doc_id (str): The counter's _id in cache_versions.
+        check_interval (float): Minimum seconds between reads in changed().
+    """
+
+    def __init__(self, doc_id, check_interval=1.0):
+        self.doc_id = doc_id
+        self.check_interval = check_interval
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def read(self, db):
+        doc = db.cache_versions.find_one({'_id': self.doc_id}, {'version': 1})
+        return doc['version'] if doc else 0
+
+    def changed(self, db):
+        """
+        Returns True if the version moved since the previous check (re-read at
+        most once per check interval). The first check only records it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.version is not None and now - self._checked_at < self.check_interval:
+                return False
+            version = self.read(db)
+            moved = self.version is not None and version != self.version
+            self.version = version
+            self._checked_at = now
+            return moved
+
+    def bump(self, db):
+        """Increments the shared version and returns the new value."""
+        doc = db.cache_versions.find_one_and_update(
+            {'_id': self.doc_id},
+            {'$inc': {'version': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc['version']
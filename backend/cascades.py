@@ -0,0 +1,297 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from cache import MISSING, TTLCache
+import leaderboard
+import logs
+import quiz_stats
+
+# Background cascade deletes for users and quizzes.
+#
+# Deleting a user or quiz first writes a tombstone to the `deletions`
+# collection, then removes the primary document, and returns. The dependent
+# rows (quiz results, sessions) are deleted by a worker thread in batches of
+# `batch_size` with a pause in between, so a large cascade doesn't hold up the
+# request or starve live submissions.
+#
+# The tombstone doubles as the job status (GET /admin/deletions/<job_id>).
+# While it is pending, reads that could still see the dependent rows filter
+# its target out (see pending_targets()). Every step is idempotent, so an
+# interrupted cascade is finished by re-running it: `flask resume-deletions`.
+#
+# Other workers may still hold a deleted quiz's answer key, so submissions
+# check deleted_targets(), which also covers finished cascades until their
+# tombstone expires. Quiz cascades sweep once more after SETTLE_SECONDS, for
+# submissions accepted by workers that hadn't seen the tombstone yet, and the
+# leaderboard entries of the quiz's players are rebuilt as soon as it is
+# deleted rather than when its cascade's turn comes.
+
+USER = 'user'
+QUIZ = 'quiz'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# A failed cascade still has rows left, so its target stays filtered out
+UNFINISHED = (QUEUED, RUNNING, FAILED)
+
+# Pending targets are read on hot paths (leaderboard, profile); other workers'
+# new tombstones are picked up within this many seconds
+PENDING_CACHE_TTL = 5
+# Past this many seconds after a tombstone is written, every worker rejects
+# submissions for its target (with a margin for writes already in flight)
+SETTLE_SECONDS = PENDING_CACHE_TTL + 1
+
+log = logs.get_logger('cascades')
+
+_pending_cache = TTLCache(maxsize=8, ttl=PENDING_CACHE_TTL)
+_deleted_cache = TTLCache(maxsize=8, ttl=PENDING_CACHE_TTL)
+
+
+def _pending_query(kind):
+    return {'kind': kind, 'status': {'$in': list(UNFINISHED)}}
+
+
+def pending_targets(db, kind):
+    """Returns the set of usernames (kind USER) or quiz ids (kind QUIZ) whose cascade has not finished."""
+    targets = _pending_cache.get(kind)
+    if targets is MISSING:
+        targets = frozenset(doc['target'] for doc in db.deletions.find(_pending_query(kind), {'target': 1}))
+        _pending_cache.set(kind, targets)
+    return targets
+
+
+async def pending_targets_async(db, kind):
+    """pending_targets() for a Motor (async) database handle."""
+    targets = _pending_cache.get(kind)
+    if targets is MISSING:
+        docs = await db.deletions.find(_pending_query(kind), {'target': 1}).to_list(None)
+        targets = frozenset(doc['target'] for doc in docs)
+        _pending_cache.set(kind, targets)
+    return targets
+
+
+def deleted_targets(db, kind):
+    """
+    Returns the set of usernames or quiz ids that have a tombstone: pending,
+    or finished within the retention period.
+    """
+    targets = _deleted_cache.get(kind)
+    if targets is MISSING:
+        targets = frozenset(doc['target'] for doc in db.deletions.find({'kind': kind}, {'target': 1}))
+        _deleted_cache.set(kind, targets)
+    return targets
+
+
+async def deleted_targets_async(db, kind):
+    """deleted_targets() for a Motor (async) database handle."""
+    targets = _deleted_cache.get(kind)
+    if targets is MISSING:
+        docs = await db.deletions.find({'kind': kind}, {'target': 1}).to_list(None)
+        targets = frozenset(doc['target'] for doc in docs)
+        _deleted_cache.set(kind, targets)
+    return targets
+
+
+def _invalidate(kind):
+    _pending_cache.invalidate(kind)
+    _deleted_cache.invalidate(kind)
+
+
+def format_job(job):
+    job = dict(job)
+    job['job_id'] = job.pop('_id')
+    job.pop('expires_at', None)
+    return job
+
+
+class CascadeDeleter:
+    """
+    Args:
+        db: The MongoDB database handle (a LocalProxy is fine).
+        batch_size (int): Dependent rows deleted per batch.
+        pause (float): Seconds to sleep between batches.
+        retention (float): Seconds a finished job's tombstone is kept.
+    """
+
+    def __init__(self, db, batch_size=500, pause=0.05, retention=7 * 24 * 3600):
+        self.db = db
+        self.batch_size = batch_size
+        self.pause = pause
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._executor = None
+        self._boards_executor = None
+
+    def _get_executor(self):
+        # Created on first use so pre-fork servers don't inherit threads. One
+        # thread: cascades run one after another, which is the throttle.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cascade')
+            return self._executor
+
+    def _get_boards_executor(self):
+        # Leaderboard rebuilds don't wait behind queued cascades
+        with self._lock:
+            if self._boards_executor is None:
+                self._boards_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cascade-boards')
+            return self._boards_executor
+
+    def delete_user(self, username):
+        """
+        Deletes a user and queues the removal of their results and sessions.
+
+        Returns:
+            dict: The job's status, or None if the user does not exist.
+        """
+        def remove():
+            if self.db.users.delete_one({'username': username}).deleted_count == 0:
+                return False
+            # A handful of documents; done now so the user leaves the boards at once
+            leaderboard.remove_user(self.db, username)
+            return True
+        return self._start(USER, username, remove)
+
+    def delete_quiz(self, quiz_id):
+        """
+        Deletes a quiz and queues the removal of its results.
+
+        Args:
+            quiz_id (ObjectId): The quiz's _id.
+
+        Returns:
+            dict: The job's status, or None if the quiz does not exist.
+        """
+        return self._start(QUIZ, str(quiz_id), lambda: self.db.quizzes.delete_one({'_id': quiz_id}).deleted_count > 0)
+
+    def _start(self, kind, target, remove_primary):
+        now = datetime.now()
+        job = {
+            '_id': uuid.uuid4().hex,
+            'kind': kind,
+            'target': target,
+            'status': QUEUED,
+            'deleted': {},
+            'error': None,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None
+        }
+        # Tombstone first, so readers filter the target out before its primary
+        # document is gone and an interrupted delete can be resumed
+        self.db.deletions.insert_one(job)
+        _invalidate(kind)
+        if not remove_primary():
+            self.db.deletions.delete_one({'_id': job['_id']})
+            _invalidate(kind)
+            return None
+        snapshot = format_job(job)
+        if kind == QUIZ:
+            self._get_boards_executor().submit(self.refresh_quiz_boards, job['_id'], target)
+        self._get_executor().submit(self.run, job)
+        return snapshot
+
+    def get(self, job_id):
+        job = self.db.deletions.find_one({'_id': job_id})
+        return format_job(job) if job else None
+
+    def run(self, job):
+        """Runs (or resumes) one cascade to completion. Called in the worker thread."""
+        self._update(job, status=RUNNING, started_at=datetime.now(), error=None)
+        try:
+            if job['kind'] == USER:
+                self._delete_in_batches(
+                    job, 'quiz_results', {'user_id': job['target']}, self._uncount_results,
+                    projection=quiz_stats.RESULT_PROJECTION
+                )
+                self._delete_in_batches(job, 'user_sessions', {'username': job['target']})
+                # Catch entries re-added by submissions that were in flight
+                leaderboard.remove_user(self.db, job['target'])
+            else:
+                self._delete_in_batches(job, 'quiz_results', {'quiz_id': job['target']}, self._refresh_boards)
+                # Catch results from submissions accepted before every worker saw the tombstone
+                settle = (job['created_at'] + timedelta(seconds=SETTLE_SECONDS) - datetime.now()).total_seconds()
+                if settle > 0:
+                    time.sleep(settle)
+                    self._delete_in_batches(job, 'quiz_results', {'quiz_id': job['target']}, self._refresh_boards)
+                quiz_stats.remove_quiz(self.db, job['target'])
+        except Exception as e:
+            logs.event(log, 'cascade_failed', level=logging.ERROR, exc_info=True, job_id=job['_id'])
+            self._update(job, status=FAILED, error=str(e), finished_at=datetime.now())
+            return
+        self._update(job, status=DONE, finished_at=datetime.now())
+        logs.event(log, 'cascade_done', sampled=False, job_id=job['_id'], kind=job['kind'], deleted=job['deleted'])
+
+    def _delete_in_batches(self, job, collection_name, query, after_batch=None, projection=None):
+        # after_batch(batch) gets the deleted documents, with the `projection` fields
+        collection = self.db[collection_name]
+        deleted = job['deleted'].get(collection_name, 0)
+        while True:
+            batch = list(collection.find(query, projection or {'user_id': 1}).limit(self.batch_size))
+            if not batch:
+                return
+            deleted += collection.delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}}).deleted_count
+            if after_batch:
+                after_batch(batch)
+            self._update(job, **{f'deleted.{collection_name}': deleted})
+            job['deleted'][collection_name] = deleted
+            time.sleep(self.pause)
+
+    def refresh_quiz_boards(self, job_id, quiz_id):
+        """
+        Rebuilds the leaderboard entries of everyone who played a deleted quiz,
+        without its results. Called in its own thread when the quiz is deleted.
+        """
+        try:
+            seen = set()
+            query = {'quiz_id': quiz_id}
+            while True:
+                batch = list(self.db.quiz_results.find(query, {'user_id': 1}).sort('_id', 1).limit(self.batch_size))
+                if not batch:
+                    return
+                query = {'quiz_id': quiz_id, '_id': {'$gt': batch[-1]['_id']}}
+                usernames = {doc['user_id'] for doc in batch if doc.get('user_id')} - seen
+                seen |= usernames
+                leaderboard.rebuild_users(self.db, usernames, exclude_quizzes=pending_targets(self.db, QUIZ))
+        except Exception:
+            # The cascade refreshes the same boards as it deletes the results
+            logs.event(log, 'cascade_boards_failed', level=logging.ERROR, exc_info=True, job_id=job_id)
+
+    def _refresh_boards(self, batch):
+        # The leaderboard keeps best scores, which can't be decremented:
+        # recompute the affected users from the results they have left
+        usernames = {doc['user_id'] for doc in batch if doc.get('user_id')}
+        leaderboard.rebuild_users(self.db, usernames, exclude_quizzes=pending_targets(self.db, QUIZ))
+
+    def _uncount_results(self, batch):
+        # Take a deleted user's results out of the quiz analytics; quizzes being
+        # deleted lose their counters as a whole
+        deleted_quizzes = pending_targets(self.db, QUIZ)
+        quiz_stats.record_results(self.db, [r for r in batch if r.get('quiz_id') not in deleted_quizzes], sign=-1)
+
+    def _update(self, job, **fields):
+        # Only finished cascades expire; a failed one's tombstone stays until it is resumed
+        if fields.get('status') == DONE:
+            fields['expires_at'] = fields['finished_at'] + timedelta(seconds=self.retention)
+        job.update({key: value for key, value in fields.items() if '.' not in key})
+        self.db.deletions.update_one({'_id': job['_id']}, {'$set': fields})
+        if 'status' in fields:
+            _invalidate(job['kind'])
+
+    def resume(self):
+        """
+        Runs every unfinished cascade in the calling thread, e.g. after a
+        restart interrupted them.
+
+        Returns:
+            int: The number of cascades run.
+        """
+        jobs = list(self.db.deletions.find({'status': {'$in': list(UNFINISHED)}}))
+        for job in jobs:
+            self.run(job)
+        return len(jobs)
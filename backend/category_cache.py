@@ -0,0 +1,54 @@
+import threading
+import time
+from cache import VersionStamp
+
+# Versioned in-memory copy of the categories collection.
+#
+# Every write through the /admin/category routes bumps a version counter stored
+# in Mongo (cache_versions, _id 'categories'). Each worker keeps the list it
+# loaded together with the version it saw, and re-reads only the version
+# document at most once per check interval, reloading the list when it moved.
+# A worker therefore serves stale categories for at most one interval after a
+# write made by another worker, and never after a write it made itself.
+
+VERSION_DOC_ID = 'categories'
+DEFAULT_CHECK_INTERVAL = 5.0
+
+
+class CategoryCache:
+
+    def __init__(self, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.version = None
+        self.categories = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stamp = VersionStamp(VERSION_DOC_ID, check_interval)
+
+    def get(self, db):
+        """
+        Returns (version, categories), reloading from Mongo only when the
+        version document changed since the last load.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.categories is not None and now - self._checked_at < self.check_interval:
+                return self.version, self.categories
+
+            version = self._stamp.read(db)
+            if self.categories is None or version != self.version:
+                self.categories = list(db.categories.find({}, {'_id': 0})) # Exclude _id from response
+                self.version = version
+            self._checked_at = now
+            return self.version, self.categories
+
+    def bump(self, db):
+        """Records a category write: increments the shared version and drops the local copy."""
+        version = self._stamp.bump(db)
+        with self._lock:
+            self.categories = None
+            self.version = None
+        return version
+
+    def etag(self, version):
+        return f"categories-{version}"
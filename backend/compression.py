@@ -0,0 +1,85 @@
+import gzip
+
+# Negotiated response compression. Bodies of at least COMPRESS_MIN_SIZE bytes
+# with a compressible content type are encoded with brotli (if the brotli
+# package is installed and the client accepts it) or gzip. Streamed responses
+# (NDJSON/SSE) are left alone so events aren't held back in a buffer.
+#
+# A compressed response's ETag is made weak: the bytes differ from the
+# identity encoding, but If-None-Match uses weak comparison, so revalidation
+# with either form still gets a 304.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def choose_encoding(accept_encoding):
+    """Returns 'br', 'gzip' or None for an Accept-Encoding header value."""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding, gzip_level=6, brotli_quality=4):
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+def should_compress(status, content_type, content_encoding, size, min_size):
+    return (
+        200 <= status < 300 and status != 204
+        and not content_encoding
+        and size >= min_size
+        and (content_type or '').startswith(COMPRESSIBLE_TYPES)
+    )
+
+
+def weaken_etag(etag):
+    if etag and not etag.startswith('W/'):
+        return f'W/{etag}'
+    return etag
+
+
+def init_app(app):
+    """Compresses eligible Flask responses, using COMPRESS_MIN_SIZE and COMPRESS_LEVEL from the config."""
+    from flask import request
+
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    gzip_level = app.config['COMPRESS_LEVEL']
+    brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+
+    @app.after_request
+    def _compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if response.direct_passthrough or response.is_streamed:
+            return response
+        body = response.get_data()
+        if not should_compress(response.status_code, response.content_type,
+                               response.content_encoding, len(body), min_size):
+            return response
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        response.set_data(compress(body, encoding, gzip_level, brotli_quality))
+        response.content_encoding = encoding
+        if 'ETag' in response.headers:
+            response.headers['ETag'] = weaken_etag(response.headers['ETag'])
+        return response
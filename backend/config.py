@@ -0,0 +1,39 @@
+import os
+
+# Settings read by create_app(). Every value can be overridden with an
+# environment variable of the same name, or by passing a dict to create_app().
+
+
+def _flag(name, default='0'):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+class Config:
+    MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/') # Assuming default MongoDB port
+    MONGODB_DB = os.getenv('MONGODB_DB', 'test_quiz_db')
+
+    # Connection pool. The client connects lazily on the first operation, so
+    # these timeouts bound how long a request waits when Mongo is unreachable.
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 2000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 2000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 10000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+
+    # Index creation touches the database, so it is off the startup path by
+    # default; run `flask ensure-indexes` once per deployment instead.
+    ENSURE_INDEXES_ON_STARTUP = _flag('ENSURE_INDEXES_ON_STARTUP')
+    VERIFY_QUERY_PLANS = _flag('VERIFY_QUERY_PLANS')
+
+    # Responses of at least COMPRESS_MIN_SIZE bytes are gzip/brotli encoded
+    # when the client accepts it
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 4))
+
+    # ASGI mode (asgi.py): threads serving the routes that stay on the Flask app
+    ASGI_SYNC_WORKERS = int(os.getenv('ASGI_SYNC_WORKERS', 10))
+
+    # Configuration for file uploads
+    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'static/avatars')
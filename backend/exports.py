@@ -0,0 +1,139 @@
+import csv
+import io
+from datetime import date, datetime
+from bson.objectid import ObjectId
+import json_provider
+import pagination
+
+# Streaming admin exports. Rows are encoded as they come off the Mongo cursor
+# and sent in chunks of one cursor batch, so an export of any size is served
+# in constant memory and the first bytes go out after the first batch.
+#
+# Exports are keyset paginated like the public listings: without `limit` the
+# whole (filtered) collection is streamed; with it, the response carries an
+# X-Next-Cursor header to pass back as `after`. Since headers go out before the
+# last row is read, that token is found with a separate sort-key-only query.
+
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Documents per cursor batch, and per chunk written to the client
+EXPORT_BATCH_SIZE = 500
+MAX_EXPORT_PAGE_SIZE = 10000
+
+
+class Export:
+    """
+    How one collection is exported.
+
+    Args:
+        name (str): Used for the CSV file name.
+        sort_fields (list): (field, direction) pairs, ending with _id.
+        projection (dict): Projection for NDJSON exports (full documents).
+        columns (list): CSV columns, in order. CSV exports only fetch these.
+        csv_projection (dict): Extra computed fields needed by `columns`.
+    """
+
+    def __init__(self, name, sort_fields, projection, columns, csv_projection=None):
+        self.name = name
+        self.sort_fields = sort_fields
+        self.projection = projection
+        self.columns = columns
+        self.csv_projection = dict({column: 1 for column in columns}, **(csv_projection or {}))
+
+
+USERS = Export(
+    'users',
+    [('_id', 1)],
+    {'password': 0},
+    ['_id', 'username', 'email', 'role']
+)
+
+QUIZZES = Export(
+    'quizzes',
+    [('created_at', -1), ('_id', -1)],
+    None,
+    ['_id', 'title', 'category', 'created_by', 'created_at', 'question_count'],
+    {'question_count': {'$size': {'$ifNull': ['$questions', []]}}}
+)
+
+
+def user_query(role=None, created_from=None, created_to=None):
+    # Users have no timestamp field; the creation time is the one in their _id
+    query = {}
+    if role:
+        query['role'] = role
+    created = {}
+    if created_from:
+        created['$gte'] = ObjectId.from_datetime(created_from)
+    if created_to:
+        created['$lt'] = ObjectId.from_datetime(created_to)
+    if created:
+        query['_id'] = created
+    return query
+
+
+def quiz_query(category=None, created_by=None, created_from=None, created_to=None):
+    query = {}
+    if category:
+        query['category'] = category
+    if created_by:
+        query['created_by'] = created_by
+    created = {}
+    if created_from:
+        created['$gte'] = created_from
+    if created_to:
+        created['$lt'] = created_to
+    if created:
+        query['created_at'] = created
+    return query
+
+
+def export_cursor(collection, export, query, export_format, limit=None, after=None):
+    """
+    Opens the cursor for one export page.
+
+    Raises:
+        pagination.InvalidCursor: If `after` is not a valid token.
+    """
+    projection = export.csv_projection if export_format == 'csv' else export.projection
+    cursor = pagination.keyset_cursor(collection, query, export.sort_fields, after, projection)
+    cursor = cursor.batch_size(EXPORT_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_rows(cursor, export, export_format):
+    """Yields the encoded export (bytes) one batch of rows at a time, and closes the cursor."""
+    try:
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(export.columns)
+            for count, doc in enumerate(cursor, 1):
+                writer.writerow([_csv_value(doc.get(column)) for column in export.columns])
+                if count % EXPORT_BATCH_SIZE == 0:
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode('utf-8')
+            return
+
+        rows = []
+        for doc in cursor:
+            rows.append(json_provider.dumps_bytes(doc))
+            if len(rows) == EXPORT_BATCH_SIZE:
+                yield b'\n'.join(rows) + b'\n'
+                rows = []
+        if rows:
+            yield b'\n'.join(rows) + b'\n'
+    finally:
+        cursor.close()
@@ -0,0 +1,71 @@
+from pymongo import MongoClient
+import metrics
+
+# Process-wide service handles, bound to an app by create_app().
+
+
+def client_options(config):
+    # Pool settings and command metrics shared by the sync and async clients
+    return {
+        "maxPoolSize": config['MONGO_MAX_POOL_SIZE'],
+        "minPoolSize": config['MONGO_MIN_POOL_SIZE'],
+        "serverSelectionTimeoutMS": config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        "connectTimeoutMS": config['MONGO_CONNECT_TIMEOUT_MS'],
+        "socketTimeoutMS": config['MONGO_SOCKET_TIMEOUT_MS'],
+        "waitQueueTimeoutMS": config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+        "event_listeners": [metrics.command_listener]
+    }
+
+
+class Mongo:
+    """
+    Lazily connected MongoDB client.
+
+    init_app() only builds the client with connect=False: no connection is
+    opened and no thread is started until the first operation. That keeps worker
+    boot fast and safe to fork, and a worker with Mongo down starts immediately
+    instead of waiting out the server-selection timeout.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.db = None
+
+    def init_app(self, app):
+        config = app.config
+        self.client = MongoClient(config['MONGODB_URI'], connect=False, **client_options(config))
+        self.db = self.client[config['MONGODB_DB']]
+        app.extensions['mongo'] = self
+
+    def ping(self):
+        # The ping command is cheap and does not require auth.
+        self.client.admin.command('ping')
+
+
+class AsyncMongo:
+    """
+    Motor (asyncio) client for the ASGI app, created by init_app() from the same
+    settings as Mongo. Motor opens connections on the first awaited operation,
+    on the running event loop, and every coroutine shares its pool.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.db = None
+
+    def init_app(self, config):
+        # Imported here so the sync app doesn't need motor installed
+        from motor.motor_asyncio import AsyncIOMotorClient
+        self.client = AsyncIOMotorClient(config['MONGODB_URI'], **client_options(config))
+        self.db = self.client[config['MONGODB_DB']]
+
+    async def ping(self):
+        await self.client.admin.command('ping')
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+mongo = Mongo()
+async_mongo = AsyncMongo()
@@ -0,0 +1,107 @@
+import operator
+import os
+from collections import namedtuple
+from bson.objectid import ObjectId
+import cache
+import result_codec
+
+# Compiled answer keys for grading. A key holds the correct option index of every
+# question packed into bytes, plus the few quiz fields a submission needs, so
+# submit_quiz never loads question text or options.
+
+AnswerKey = namedtuple('AnswerKey', ['quiz_id', 'answers', 'category'])
+
+# Quizzes are immutable once created, so entries only leave the cache when the
+# quiz is deleted (or on TTL, which bounds staleness in other workers)
+answer_key_cache = cache.TTLCache(
+    maxsize=int(os.getenv('ANSWER_KEY_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('ANSWER_KEY_CACHE_TTL', 300))
+)
+
+# Only the fields needed to build a key are fetched from Mongo
+ANSWER_KEY_PROJECTION = {'questions.correct_answer': 1, 'category': 1}
+
+
+def compile_answer_key(quiz):
+    """
+    Packs a quiz document's correct answers into an AnswerKey.
+
+    Args:
+        quiz (dict): A quiz document with at least 'questions.correct_answer'.
+
+    Returns:
+        AnswerKey: The compiled key; `answers[i]` is the 0-based option index
+                   of question i.
+    """
+    answers = bytes(ord(q['correct_answer'].upper()) - ord('A') for q in quiz['questions'])
+    return AnswerKey(str(quiz['_id']), answers, quiz.get('category'))
+
+
+def get_answer_key(db, quiz_id):
+    """Returns the AnswerKey for `quiz_id`, or None if the quiz does not exist."""
+    key = answer_key_cache.get(quiz_id)
+    if key is cache.MISSING:
+        quiz = db.quizzes.find_one({'_id': ObjectId(quiz_id)}, ANSWER_KEY_PROJECTION)
+        if not quiz:
+            return None
+        key = compile_answer_key(quiz)
+        answer_key_cache.set(quiz_id, key)
+    return key
+
+
+async def get_answer_key_async(db, quiz_id):
+    """get_answer_key() for a Motor (async) database handle; shares the same cache."""
+    key = answer_key_cache.get(quiz_id)
+    if key is cache.MISSING:
+        quiz = await db.quizzes.find_one({'_id': ObjectId(quiz_id)}, ANSWER_KEY_PROJECTION)
+        if not quiz:
+            return None
+        key = compile_answer_key(quiz)
+        answer_key_cache.set(quiz_id, key)
+    return key
+
+
+def get_answer_keys(db, quiz_ids):
+    """
+    Returns {quiz_id: AnswerKey} for every existing quiz in `quiz_ids`, fetching
+    all cache misses with a single $in query. Invalid or unknown ids are omitted.
+    """
+    keys = {}
+    missing = []
+    for quiz_id in {quiz_id for quiz_id in quiz_ids if isinstance(quiz_id, str)}:
+        key = answer_key_cache.get(quiz_id)
+        if key is not cache.MISSING:
+            keys[quiz_id] = key
+        elif ObjectId.is_valid(quiz_id):
+            missing.append(ObjectId(quiz_id))
+
+    if missing:
+        for quiz in db.quizzes.find({'_id': {'$in': missing}}, ANSWER_KEY_PROJECTION):
+            key = compile_answer_key(quiz)
+            answer_key_cache.set(key.quiz_id, key)
+            keys[key.quiz_id] = key
+    return keys
+
+
+def invalidate(quiz_id):
+    answer_key_cache.invalidate(quiz_id)
+
+
+def grade(key, user_answers):
+    """
+    Grades a submission against a compiled key in one pass.
+
+    Args:
+        key (AnswerKey): The quiz's compiled answer key.
+        user_answers (list): The chosen option index per question (None if unanswered).
+
+    Returns:
+        tuple: (score, total_questions, percentage_score, stored_results).
+               stored_results are the per-question fields to store with the
+               result, in the compact format of result_codec.encode().
+    """
+    answers = key.answers
+    score = sum(map(operator.eq, user_answers, answers))
+    total_questions = len(answers)
+    percentage_score = (score / total_questions) * 100 if total_questions > 0 else 0
+    return score, total_questions, percentage_score, result_codec.encode(user_answers, answers)
@@ -0,0 +1,133 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+import leaderboard
+import search
+
+# Every index the backend's queries rely on, declared per collection.
+# apply_indexes() creates them; creating an index that already exists with the
+# same spec is a no-op in MongoDB, so this is safe to run on every startup.
+REQUIRED_INDEXES = {
+    'users': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+        # Admin export filtered by role
+        IndexModel([('role', ASCENDING), ('_id', ASCENDING)], name='users_by_role'),
+    ],
+    'user_sessions': [
+        # logout: latest open session for a user
+        IndexModel(
+            [('username', ASCENDING), ('logout_time', ASCENDING), ('login_time', DESCENDING)],
+            name='open_session_by_user'
+        ),
+    ],
+    'quiz_results': [
+        # Profile history (keyset paginated) and profile stats
+        IndexModel(
+            [('user_id', ASCENDING), ('submission_time', DESCENDING), ('_id', DESCENDING)],
+            name='results_by_user'
+        ),
+        # Cascade delete when a quiz is removed
+        IndexModel([('quiz_id', ASCENDING)], name='results_by_quiz'),
+    ],
+    'quizzes': [
+        # Catalogue listing, with and without a category filter
+        IndexModel(
+            [('category', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='quizzes_by_category'
+        ),
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='quizzes_by_created_at'),
+        # Admin export filtered by creator
+        IndexModel(
+            [('created_by', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='quizzes_by_creator'
+        ),
+        # /quizzes/search
+        *search.INDEXES,
+    ],
+    'categories': [
+        IndexModel([('name', ASCENDING)], name='name_unique', unique=True),
+    ],
+    'leaderboard': leaderboard.INDEXES,
+    'deletions': [
+        # Unfinished cascades, read (cached) by the leaderboard and profile
+        IndexModel([('kind', ASCENDING), ('status', ASCENDING)], name='deletions_by_status'),
+        IndexModel([('expires_at', ASCENDING)], name='deletion_expiry', expireAfterSeconds=0),
+    ],
+    'ai_jobs': [
+        IndexModel([('expires_at', ASCENDING)], name='job_expiry', expireAfterSeconds=0),
+    ],
+    'ai_generation_cache': [
+        IndexModel([('expires_at', ASCENDING)], name='generation_expiry', expireAfterSeconds=0),
+    ],
+}
+
+# Hot queries that must be served by an index: (collection, filter, sort)
+HOT_QUERIES = [
+    ('users', {'username': ''}, None),
+    ('users', {'email': ''}, None),
+    ('user_sessions', {'username': '', 'logout_time': None}, [('login_time', DESCENDING)]),
+    ('quiz_results', {'user_id': ''}, [('submission_time', DESCENDING), ('_id', DESCENDING)]),
+    ('quiz_results', {'quiz_id': ''}, None),
+    ('quizzes', {'category': ''}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('quizzes', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('users', {'role': ''}, [('_id', ASCENDING)]),
+    ('quizzes', {'created_by': ''}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('quizzes', {'$text': {'$search': 'quiz'}}, None),
+    ('categories', {'name': ''}, None),
+    ('deletions', {'kind': '', 'status': ''}, None),
+    ('leaderboard', {'category': '', 'window': 'all', 'period': 'all'}, [('highest_score', DESCENDING)]),
+]
+
+
+class IndexVerificationError(RuntimeError):
+    pass
+
+
+def apply_indexes(db):
+    """
+    Creates every index in REQUIRED_INDEXES.
+
+    Raises:
+        IndexVerificationError: If an index cannot be created, e.g. a unique
+                                index over existing duplicate values or an
+                                index that exists with different options.
+    """
+    failures = []
+    for collection_name, models in REQUIRED_INDEXES.items():
+        try:
+            db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            failures.append(f"{collection_name}: {e}")
+    if failures:
+        raise IndexVerificationError("Could not create indexes:\n" + "\n".join(failures))
+
+
+def _stages(plan):
+    # Walks an explain() plan tree and yields every stage name in it
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def verify_query_plans(db):
+    """
+    Explains every query in HOT_QUERIES and checks none of them is a collection scan.
+
+    Raises:
+        IndexVerificationError: Listing each query whose winning plan contains a COLLSCAN.
+    """
+    offenders = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        if 'COLLSCAN' in _stages(winning_plan):
+            offenders.append(f"{collection_name}.find({query}) sort={sort}")
+    if offenders:
+        raise IndexVerificationError("Queries falling back to COLLSCAN:\n" + "\n".join(offenders))
@@ -0,0 +1,57 @@
+import json
+from datetime import date, datetime
+from bson.objectid import ObjectId
+from flask.json.provider import JSONProvider
+
+# JSON encoding for API responses. Documents straight from Mongo can be passed
+# to jsonify(): ObjectId is written as its hex string and datetime as ISO 8601
+# (the same strings str(_id) and .isoformat() produce), so handlers don't
+# convert every document in a Python loop first.
+#
+# orjson is used when installed (it encodes datetime natively and only calls
+# back into Python for ObjectId); otherwise the stdlib encoder with the same
+# output is used.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(value):
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps_bytes(value):
+        return json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by dumps_bytes(); install with app.json = FastJSONProvider(app)."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # Encode straight to bytes instead of going through a str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype='application/json')
@@ -0,0 +1,88 @@
+import json
+
+# Incremental parser for the model's JSON-array output.
+#
+# The model answers with a JSON array of question objects, sometimes wrapped in
+# a ```json markdown fence. feed() accepts the text in arbitrary fragments (as a
+# streaming response delivers it) and returns every object that became
+# complete, so each question can be used as soon as its closing brace arrives.
+# Anything before the opening '[' (such as the fence) and after the closing ']'
+# is ignored.
+
+
+class IncompleteJSONArray(ValueError):
+    pass
+
+
+class JSONArrayStreamParser:
+
+    def __init__(self):
+        self._buffer = []  # Characters of the element being read
+        self._started = False  # Seen the opening '['
+        self._finished = False  # Seen the closing ']'
+        self._depth = 0  # Nesting depth inside the current element
+        self._in_string = False
+        self._escaped = False
+        self.count = 0
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def feed(self, text):
+        """
+        Consumes the next fragment of model output.
+
+        Returns:
+            list: The array elements completed by this fragment, already decoded.
+        """
+        completed = []
+        for ch in text:
+            if self._finished:
+                break
+            if not self._started:
+                if ch == '[':
+                    self._started = True
+                continue
+
+            if self._depth == 0:
+                # Between elements: skip separators, stop at the end of the array
+                if ch == ']':
+                    self._finished = True
+                elif ch in '{[':
+                    self._depth = 1
+                    self._buffer = [ch]
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.append(json.loads(''.join(self._buffer)))
+                    self._buffer = []
+                    self.count += 1
+        return completed
+
+    def close(self):
+        """Checks the whole array was read; raises IncompleteJSONArray if not."""
+        if not self._finished:
+            raise IncompleteJSONArray("Model output did not contain a complete JSON array.")
+
+
+def parse_json_array(text):
+    """Parses a whole (possibly fenced) JSON array at once."""
+    parser = JSONArrayStreamParser()
+    items = parser.feed(text)
+    parser.close()
+    return items
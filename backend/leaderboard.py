@@ -0,0 +1,223 @@
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+
+# Materialized leaderboard: one document per (category, window, period, username)
+# holding that user's best percentage_score on the board. submit_quiz keeps it
+# up to date with $max upserts, so GET /leaderboard is an indexed top-N read
+# instead of a $group over the whole quiz_results collection.
+
+ALL_CATEGORIES = '__all__'
+WINDOWS = ('all', 'weekly', 'daily')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+REBUILD_BATCH_SIZE = 1000
+# Daily/weekly boards are only read for the current period; keep the previous
+# one around for a while and let the TTL index clean up after that
+RETENTION = {'daily': timedelta(days=2), 'weekly': timedelta(days=14)}
+
+
+def period_for(window, when):
+    """Returns the period key a submission made at `when` falls into for `window`."""
+    if window == 'daily':
+        return when.strftime('%Y-%m-%d')
+    if window == 'weekly':
+        year, week, _ = when.isocalendar()
+        return f"{year}-W{week:02d}"
+    return 'all'
+
+
+INDEXES = [
+    # Serves the top-N read: equality on the board key, then sorted by score
+    IndexModel(
+        [('category', ASCENDING), ('window', ASCENDING), ('period', ASCENDING),
+         ('highest_score', DESCENDING)],
+        name='board_top_n'
+    ),
+    # One entry per user per board; also the target of every upsert
+    IndexModel(
+        [('username', ASCENDING), ('category', ASCENDING), ('window', ASCENDING), ('period', ASCENDING)],
+        name='board_user_unique',
+        unique=True
+    ),
+    # All-time entries have no expires_at and are never removed
+    IndexModel('expires_at', name='board_expiry', expireAfterSeconds=0),
+]
+
+
+def ensure_indexes(db):
+    db.leaderboard.create_indexes(INDEXES)
+
+
+def _score_updates(username, category, percentage_score, when):
+    categories = [ALL_CATEGORIES]
+    if category:
+        categories.append(category)
+
+    updates = []
+    for board_category in categories:
+        for window in WINDOWS:
+            fields = {"updated_at": when}
+            if window in RETENTION:
+                fields["expires_at"] = when + RETENTION[window]
+            updates.append(UpdateOne(
+                {
+                    "username": username,
+                    "category": board_category,
+                    "window": window,
+                    "period": period_for(window, when)
+                },
+                {
+                    "$max": {"highest_score": percentage_score},
+                    "$set": fields
+                },
+                upsert=True
+            ))
+    return updates
+
+
+def record_score(db, username, category, percentage_score, when=None):
+    """
+    Folds a single quiz submission into every board it belongs to.
+
+    Args:
+        db: The MongoDB database handle.
+        username (str): The user who submitted the quiz.
+        category (str): The quiz category, or None if the quiz has none.
+        percentage_score (float): The submission's percentage score.
+        when (datetime): The submission time. Defaults to now.
+    """
+    when = when or datetime.now()
+    db.leaderboard.bulk_write(_score_updates(username, category, percentage_score, when), ordered=False)
+
+
+async def record_score_async(db, username, category, percentage_score, when=None):
+    """record_score() for a Motor (async) database handle."""
+    when = when or datetime.now()
+    await db.leaderboard.bulk_write(_score_updates(username, category, percentage_score, when), ordered=False)
+
+
+def record_scores(db, scores):
+    """
+    Folds many submissions into the leaderboard with a single bulk write.
+
+    Args:
+        db: The MongoDB database handle.
+        scores (list): (username, category, percentage_score, when) tuples.
+    """
+    updates = []
+    for username, category, percentage_score, when in scores:
+        updates.extend(_score_updates(username, category, percentage_score, when))
+    if updates:
+        db.leaderboard.bulk_write(updates, ordered=False)
+
+
+def top_scores(db, category=None, window='all', limit=DEFAULT_LIMIT, when=None, exclude=()):
+    """
+    Returns the top `limit` users of a board, best score first.
+
+    Args:
+        db: The MongoDB database handle.
+        category (str): Restrict the board to one category. None means all categories.
+        window (str): One of 'all', 'weekly' or 'daily'.
+        limit (int): Number of entries to return.
+        when (datetime): Picks the current daily/weekly period. Defaults to now.
+        exclude (iterable): Usernames to leave out, e.g. users being deleted.
+
+    Returns:
+        list: Dictionaries with 'username' and 'highest_score' (rounded to 2 places).
+    """
+    return [_format_entry(entry) for entry in _top_cursor(db, category, window, limit, when, exclude)]
+
+
+async def top_scores_async(db, category=None, window='all', limit=DEFAULT_LIMIT, when=None, exclude=()):
+    """top_scores() for a Motor (async) database handle."""
+    return [_format_entry(entry) async for entry in _top_cursor(db, category, window, limit, when, exclude)]
+
+
+def _top_cursor(db, category, window, limit, when, exclude=()):
+    if window not in WINDOWS:
+        raise ValueError(f"Invalid window '{window}'. Must be one of: {', '.join(WINDOWS)}.")
+
+    when = when or datetime.now()
+    query = {
+        "category": category or ALL_CATEGORIES,
+        "window": window,
+        "period": period_for(window, when)
+    }
+    if exclude:
+        query["username"] = {"$nin": list(exclude)}
+    return db.leaderboard.find(query, {'_id': 0, 'username': 1, 'highest_score': 1}) \
+        .sort('highest_score', DESCENDING) \
+        .limit(limit)
+
+
+def _format_entry(entry):
+    return {"username": entry['username'], "highest_score": round(entry['highest_score'], 2)}
+
+
+def remove_user(db, username):
+    db.leaderboard.delete_many({"username": username})
+
+
+def rebuild(db, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Rebuilds the leaderboard collection from the existing quiz_results.
+
+    Results are streamed from the cursor and folded in with the same $max
+    upserts submit_quiz uses, so the rebuild runs in bounded memory.
+
+    Returns:
+        int: The number of quiz results processed.
+    """
+    db.leaderboard.delete_many({})
+    ensure_indexes(db)
+    return _fold_results(db, {}, batch_size)
+
+
+def rebuild_users(db, usernames, exclude_quizzes=(), batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recomputes the entries of `usernames` from their remaining quiz_results,
+    e.g. after some of those results were deleted.
+
+    Args:
+        exclude_quizzes (iterable): Quiz ids whose results are ignored (quizzes
+                                    being deleted whose results are not all gone yet).
+
+    Returns:
+        int: The number of quiz results processed.
+    """
+    usernames = list(usernames)
+    if not usernames:
+        return 0
+    query = {"user_id": {"$in": usernames}}
+    if exclude_quizzes:
+        query["quiz_id"] = {"$nin": list(exclude_quizzes)}
+    db.leaderboard.delete_many({"username": {"$in": usernames}})
+    return _fold_results(db, query, batch_size)
+
+
+def _fold_results(db, query, batch_size):
+    # Quizzes are few compared to results, so resolve categories up front
+    categories = {
+        str(quiz['_id']): quiz.get('category')
+        for quiz in db.quizzes.find({}, {'category': 1})
+    }
+
+    processed = 0
+    pending = []
+    projection = {'quiz_id': 1, 'user_id': 1, 'percentage_score': 1, 'submission_time': 1}
+    for result in db.quiz_results.find(query, projection).batch_size(batch_size):
+        pending.extend(_score_updates(
+            result['user_id'],
+            categories.get(result.get('quiz_id')),
+            result.get('percentage_score', 0),
+            result.get('submission_time') or datetime.now()
+        ))
+        processed += 1
+        if len(pending) >= batch_size:
+            db.leaderboard.bulk_write(pending, ordered=False)
+            pending = []
+
+    if pending:
+        db.leaderboard.bulk_write(pending, ordered=False)
+    return processed
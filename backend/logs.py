@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+# Structured, sampled logging. Every record is one JSON object per line on
+# stderr: {"ts", "level", "logger", "event", ...fields}.
+#
+# Routine events on hot paths are logged with sampled=True and only a
+# LOG_SAMPLE_RATE fraction of them is kept. The sampling decision is made
+# before the record is built, so a dropped event costs one random() call.
+# Warnings and errors are never sampled.
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_root = logging.getLogger('quiz')
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(JSONFormatter())
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+def get_logger(name):
+    return _root.getChild(name)
+
+
+def event(logger, event_name, /, level=logging.INFO, sampled=True, exc_info=False, **fields):
+    """
+    Logs `event_name` with `fields` as a structured record.
+
+    Args:
+        logger (logging.Logger): From get_logger().
+        event_name (str): e.g. 'logout'.
+        level (int): A logging level.
+        sampled (bool): Keep only LOG_SAMPLE_RATE of these events; ignored for
+                        warnings and errors.
+        exc_info (bool): Attach the exception being handled.
+    """
+    if sampled and level < logging.WARNING and random.random() >= LOG_SAMPLE_RATE:
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, event_name, exc_info=exc_info, extra={"fields": fields})
@@ -0,0 +1,254 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from pymongo import monitoring
+import logs
+
+# In-process metrics, exposed in the Prometheus text format at /metrics.
+#
+# Requests are timed by hooks installed with init_app() (and by asgi.py for the
+# async routes). Every MongoDB command goes through CommandMetrics, a pymongo
+# command listener; commands issued while a request is being handled are also
+# counted against that request, so a route doing N+1 queries shows up in
+# http_request_mongo_commands. Values are per process.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Requests slower than this are always logged, regardless of sampling
+SLOW_REQUEST_SECONDS = 1.0
+
+log = logs.get_logger('http')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {} # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                labels = list(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """
+        Adds a callable run at scrape time. It returns an iterable of
+        (name, type, help, samples) where samples is a list of (labels dict, value).
+        """
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    'http_requests_total', 'HTTP requests handled.', ('method', 'route', 'status'))
+HTTP_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, until the response is returned.', ('method', 'route'))
+HTTP_REQUEST_SIZE = registry.histogram(
+    'http_request_size_bytes', 'Request body size.', ('method', 'route'), buckets=SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = registry.histogram(
+    'http_response_size_bytes', 'Response body size (streamed responses are not counted).', ('method', 'route'), buckets=SIZE_BUCKETS)
+HTTP_MONGO_COMMANDS = registry.histogram(
+    'http_request_mongo_commands', 'MongoDB commands issued per request.', ('method', 'route'), buckets=COUNT_BUCKETS)
+HTTP_MONGO_SECONDS = registry.histogram(
+    'http_request_mongo_seconds', 'Time spent in MongoDB commands per request.', ('method', 'route'))
+MONGO_COMMANDS = registry.counter(
+    'mongo_commands_total', 'MongoDB commands completed.', ('command', 'outcome'))
+MONGO_LATENCY = registry.histogram(
+    'mongo_command_duration_seconds', 'MongoDB command round-trip time.', ('command',))
+
+
+class RequestStats:
+    __slots__ = ('mongo_commands', 'mongo_seconds')
+
+    def __init__(self):
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+
+
+# Stats of the request being handled. Motor copies the context into its
+# executor threads, so async routes are attributed too.
+_current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class CommandMetrics(monitoring.CommandListener):
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, 'ok')
+
+    def failed(self, event):
+        self._record(event, 'error')
+
+    def _record(self, event, outcome):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMANDS.inc(command=event.command_name, outcome=outcome)
+        MONGO_LATENCY.observe(seconds, command=event.command_name)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.mongo_commands += 1
+            stats.mongo_seconds += seconds
+
+
+command_listener = CommandMetrics()
+
+
+def start_request():
+    """Starts attributing Mongo commands to a new request; returns (stats, token)."""
+    stats = RequestStats()
+    return stats, _current_request.set(stats)
+
+
+def end_request(token):
+    _current_request.reset(token)
+
+
+def observe_request(method, route, status, seconds, stats, request_bytes=None, response_bytes=None):
+    """Records a finished request and logs it (sampled, unless it was slow or failed)."""
+    HTTP_REQUESTS.inc(method=method, route=route, status=status)
+    HTTP_LATENCY.observe(seconds, method=method, route=route)
+    HTTP_MONGO_COMMANDS.observe(stats.mongo_commands, method=method, route=route)
+    HTTP_MONGO_SECONDS.observe(stats.mongo_seconds, method=method, route=route)
+    if request_bytes is not None:
+        HTTP_REQUEST_SIZE.observe(request_bytes, method=method, route=route)
+    if response_bytes is not None:
+        HTTP_RESPONSE_SIZE.observe(response_bytes, method=method, route=route)
+
+    notable = seconds >= SLOW_REQUEST_SECONDS or status >= 500
+    logs.event(
+        log, 'request',
+        level=logging.WARNING if notable else logging.INFO,
+        method=method,
+        route=route,
+        status=status,
+        duration_ms=round(seconds * 1000, 1),
+        mongo_commands=stats.mongo_commands,
+        mongo_ms=round(stats.mongo_seconds * 1000, 1)
+    )
+
+
+def init_app(app):
+    """Installs request timing hooks on a Flask app."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_stats, g.metrics_token = start_request()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            observe_request(
+                request.method,
+                request.url_rule.rule if request.url_rule else 'unmatched',
+                response.status_code,
+                time.perf_counter() - started,
+                g.metrics_stats,
+                request_bytes=request.content_length or 0,
+                # Don't buffer streamed bodies just to measure them; use the header if set
+                response_bytes=response.content_length if response.is_streamed else response.calculate_content_length()
+            )
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            end_request(token)
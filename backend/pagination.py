@@ -0,0 +1,113 @@
+import base64
+from bson import json_util
+
+# Keyset (cursor) pagination helpers. A cursor token is the sort-key values of
+# the last document on a page, so the next page is an index range scan that
+# starts right after it instead of a skip() over everything before it.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parses a `limit` query argument and clamps it to [1, maximum]."""
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer.")
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(doc, sort_fields):
+    """Builds an opaque token from the sort-key values of `doc`."""
+    values = [doc[field] for field, _ in sort_fields]
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token, sort_fields):
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise InvalidCursor("Invalid pagination cursor.")
+    if not isinstance(values, list) or len(values) != len(sort_fields):
+        raise InvalidCursor("Invalid pagination cursor.")
+    return values
+
+
+def keyset_filter(token, sort_fields):
+    """
+    Returns the query clause selecting documents that sort after the cursor.
+
+    Args:
+        token (str): A token produced by encode_cursor.
+        sort_fields (list): (field, direction) pairs, the same ones used to sort
+                            the query. The last one must be unique (e.g. _id).
+
+    Returns:
+        dict: A clause to combine with the rest of the query using $and.
+    """
+    values = decode_cursor(token, sort_fields)
+    clauses = []
+    for i, (field, direction) in enumerate(sort_fields):
+        clause = {f: v for (f, _), v in zip(sort_fields[:i], values[:i])}
+        clause[field] = {'$lt' if direction < 0 else '$gt': values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def paginate(collection, query, sort_fields, limit, after=None, projection=None):
+    """
+    Fetches one page of `collection` in `sort_fields` order.
+
+    Returns:
+        tuple: (documents, next_cursor). next_cursor is None on the last page.
+    """
+    docs = list(_page_cursor(collection, query, sort_fields, limit, after, projection))
+    return split_page(docs, sort_fields, limit)
+
+
+async def paginate_async(collection, query, sort_fields, limit, after=None, projection=None):
+    """paginate() for a Motor (async) collection."""
+    docs = await _page_cursor(collection, query, sort_fields, limit, after, projection).to_list(limit + 1)
+    return split_page(docs, sort_fields, limit)
+
+
+def keyset_cursor(collection, query, sort_fields, after=None, projection=None):
+    """Returns an unlimited cursor over `collection` in `sort_fields` order, starting after the `after` token."""
+    if after:
+        query = {'$and': [query, keyset_filter(after, sort_fields)]} if query else keyset_filter(after, sort_fields)
+    return collection.find(query, projection).sort(sort_fields)
+
+
+def next_page_cursor(collection, query, sort_fields, limit, after=None):
+    """
+    Returns the token for the page after the `limit` documents following
+    `after`, or None if that is the last page.
+
+    For responses that are streamed, and so send their headers before the
+    page's last document has been read. Only the sort keys are fetched.
+    """
+    keys = {field: 1 for field, _ in sort_fields}
+    docs = list(keyset_cursor(collection, query, sort_fields, after, keys).skip(limit - 1).limit(2))
+    if len(docs) < 2:
+        return None
+    return encode_cursor(docs[0], sort_fields)
+
+
+def _page_cursor(collection, query, sort_fields, limit, after, projection):
+    # Fetch one extra document to know whether another page exists
+    return keyset_cursor(collection, query, sort_fields, after, projection).limit(limit + 1)
+
+
+def split_page(docs, sort_fields, limit):
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_fields)
+    return docs, next_cursor
@@ -0,0 +1,85 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+# Password hashing and verification, run on a dedicated process pool so bcrypt's
+# CPU time doesn't stall the request workers.
+#
+# PASSWORD_POOL_SIZE   worker processes (0 runs bcrypt inline, e.g. for debugging)
+# PASSWORD_MAX_PENDING bound on hash/check jobs queued or running at once; beyond
+#                      it callers get PasswordPoolBusy instead of piling up
+# BCRYPT_LOG_ROUNDS    work factor for new hashes; existing hashes with another
+#                      cost are upgraded on the next successful login
+
+LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+POOL_SIZE = int(os.getenv('PASSWORD_POOL_SIZE', min(4, os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv('PASSWORD_MAX_PENDING', 64))
+# How long a request waits for a free slot / for the pool to return
+ACQUIRE_TIMEOUT = float(os.getenv('PASSWORD_ACQUIRE_TIMEOUT', 5))
+RESULT_TIMEOUT = float(os.getenv('PASSWORD_RESULT_TIMEOUT', 30))
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class PasswordPoolBusy(RuntimeError):
+    pass
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError: # Malformed stored hash
+        return False
+
+
+def _get_executor():
+    global _executor
+    # Created on first use so pre-fork servers don't inherit pool processes
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=POOL_SIZE)
+        return _executor
+
+
+def _run(fn, *args):
+    if POOL_SIZE <= 0:
+        return fn(*args)
+    if not _slots.acquire(timeout=ACQUIRE_TIMEOUT):
+        raise PasswordPoolBusy("Too many password operations in progress.")
+    try:
+        return _get_executor().submit(fn, *args).result(timeout=RESULT_TIMEOUT)
+    finally:
+        _slots.release()
+
+
+def hash_password(password, rounds=None):
+    """Returns a bcrypt hash of `password` using the configured work factor."""
+    return _run(_hash, password, rounds or LOG_ROUNDS)
+
+
+def check_password(hashed, password):
+    """Returns True if `password` matches the stored bcrypt `hashed`."""
+    return _run(_check, hashed, password)
+
+
+def needs_rehash(hashed):
+    # bcrypt hashes look like $2b$<cost>$<salt+hash>
+    try:
+        return int(hashed.split('$')[2]) != LOG_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,218 @@
+from collections import Counter, defaultdict
+from pymongo import UpdateOne
+import result_codec
+
+# Materialized per-quiz analytics: one document per quiz in `quiz_stats`,
+# keyed by the quiz id, holding
+#
+#     attempts, score_sum
+#     histogram.<bucket>                    submissions per 10-point score bucket
+#     questions.<i>.answered / .correct / .unanswered
+#     questions.<i>.choices.<option index>  how often each option was picked
+#
+# submit_quiz folds every submission in with a single $inc upsert, so
+# GET /quizzes/<id>/stats is one _id lookup however many attempts there are.
+# rebuild() recomputes the counters from quiz_results and check() compares
+# them with it.
+
+BUCKET_WIDTH = 10
+BUCKETS = [str(lower) for lower in range(0, 100, BUCKET_WIDTH)] # '0' .. '90'; 100% falls in '90'
+REBUILD_BATCH_SIZE = 1000
+
+# Floating-point sums of percentages may differ in the last digits
+SCORE_SUM_TOLERANCE = 1e-6
+
+
+def bucket_for(percentage_score):
+    index = min(int(percentage_score // BUCKET_WIDTH), len(BUCKETS) - 1)
+    return BUCKETS[max(index, 0)]
+
+
+def increments(result, sign=1):
+    """
+    Returns the counter changes ({dotted field: amount}) for one quiz_results
+    document; sign=-1 undoes them.
+    """
+    percentage_score = result.get('percentage_score') or 0
+    inc = Counter({
+        'attempts': sign,
+        'score_sum': sign * percentage_score,
+        f'histogram.{bucket_for(percentage_score)}': sign
+    })
+    for i, (user_ans, is_correct) in enumerate(result_codec.answer_pairs(result)):
+        prefix = f'questions.{i}'
+        if user_ans is None:
+            inc[f'{prefix}.unanswered'] += sign
+            continue
+        inc[f'{prefix}.answered'] += sign
+        if is_correct:
+            inc[f'{prefix}.correct'] += sign
+        if type(user_ans) is int and user_ans >= 0:
+            inc[f'{prefix}.choices.{user_ans}'] += sign
+    return inc
+
+
+def _update(result, sign=1):
+    return UpdateOne({'_id': result['quiz_id']}, {'$inc': dict(increments(result, sign))}, upsert=True)
+
+
+def record_result(db, result):
+    """Folds one submission (a quiz_results document) into its quiz's counters."""
+    db.quiz_stats.update_one({'_id': result['quiz_id']}, {'$inc': dict(increments(result))}, upsert=True)
+
+
+async def record_result_async(db, result):
+    """record_result() for a Motor (async) database handle."""
+    await db.quiz_stats.update_one({'_id': result['quiz_id']}, {'$inc': dict(increments(result))}, upsert=True)
+
+
+def record_results(db, results, sign=1):
+    """
+    Folds many submissions in with one bulk write; sign=-1 removes them again
+    (used when their results are deleted).
+    """
+    updates = [_update(result, sign) for result in results if result.get('quiz_id')]
+    if updates:
+        db.quiz_stats.bulk_write(updates, ordered=False)
+
+
+def remove_quiz(db, quiz_id):
+    db.quiz_stats.delete_one({'_id': quiz_id})
+
+
+# Fields of quiz_results the counters are computed from
+RESULT_PROJECTION = {
+    'quiz_id': 1,
+    'percentage_score': 1,
+    result_codec.FIELD: 1,
+    result_codec.LEGACY_FIELD: 1
+}
+
+
+def tally(db, quiz_id=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recomputes the counters from quiz_results.
+
+    Returns:
+        dict: {quiz_id: Counter of dotted field -> amount}, for one quiz or all.
+    """
+    query = {'quiz_id': quiz_id} if quiz_id else {}
+    totals = defaultdict(Counter)
+    for result in db.quiz_results.find(query, RESULT_PROJECTION).batch_size(batch_size):
+        if result.get('quiz_id'):
+            totals[result['quiz_id']].update(increments(result))
+    return totals
+
+
+def _flatten(doc, prefix=''):
+    flat = {}
+    for key, value in doc.items():
+        if prefix == '' and key == '_id':
+            continue
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def _unflatten(flat):
+    doc = {}
+    for path, value in flat.items():
+        node = doc
+        *parents, leaf = path.split('.')
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return doc
+
+
+def _nonzero(flat):
+    return {key: value for key, value in flat.items() if value}
+
+
+def rebuild(db, quiz_id=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Replaces the counters of one quiz (or all quizzes) with ones recomputed
+    from quiz_results. Submissions made while it runs may be missed; run
+    check() afterwards.
+
+    Returns:
+        int: The number of quizzes written.
+    """
+    totals = tally(db, quiz_id, batch_size)
+    if quiz_id is None:
+        db.quiz_stats.delete_many({'_id': {'$nin': list(totals)}})
+    elif quiz_id not in totals:
+        db.quiz_stats.delete_one({'_id': quiz_id})
+    for stats_quiz_id, counts in totals.items():
+        db.quiz_stats.replace_one({'_id': stats_quiz_id}, _unflatten(_nonzero(counts)), upsert=True)
+    return len(totals)
+
+
+def check(db, quiz_id=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Compares the stored counters with ones recomputed from quiz_results.
+
+    Returns:
+        dict: {quiz_id: {field: (stored, expected)}} for every quiz whose
+              counters differ. Empty when everything matches.
+    """
+    totals = tally(db, quiz_id, batch_size)
+    query = {'_id': quiz_id} if quiz_id else {}
+    stored = {doc['_id']: _nonzero(_flatten(doc)) for doc in db.quiz_stats.find(query)}
+
+    mismatches = {}
+    for stats_quiz_id in set(totals) | set(stored):
+        expected = _nonzero(totals.get(stats_quiz_id, {}))
+        actual = stored.get(stats_quiz_id, {})
+        diff = {}
+        for field in set(expected) | set(actual):
+            want, have = expected.get(field, 0), actual.get(field, 0)
+            if field == 'score_sum' and abs(want - have) <= SCORE_SUM_TOLERANCE * max(1, abs(want)):
+                continue
+            if want != have:
+                diff[field] = (have, want)
+        if diff:
+            mismatches[stats_quiz_id] = diff
+    return mismatches
+
+
+def format_stats(quiz_id, doc, answer_key):
+    """
+    Builds the API response from a quiz_stats document (or None if the quiz has
+    no attempts yet) and the quiz's AnswerKey.
+    """
+    doc = doc or {}
+    attempts = doc.get('attempts', 0)
+    histogram = doc.get('histogram', {})
+    questions = doc.get('questions', {})
+
+    question_stats = []
+    for i, correct_answer in enumerate(answer_key.answers):
+        counts = questions.get(str(i), {})
+        answered = counts.get('answered', 0)
+        question_stats.append({
+            "question_index": i,
+            "correct_answer": correct_answer,
+            "answered": answered,
+            "unanswered": counts.get('unanswered', 0),
+            "correct": counts.get('correct', 0),
+            "correct_rate": round(counts.get('correct', 0) / answered, 4) if answered else None,
+            "choices": {
+                option: count
+                for option, count in sorted(counts.get('choices', {}).items(), key=lambda item: int(item[0]))
+                if count
+            }
+        })
+
+    return {
+        "quiz_id": quiz_id,
+        "attempts": attempts,
+        "average_score": round(doc.get('score_sum', 0) / attempts, 2) if attempts else None,
+        "score_histogram": [
+            {"min_score": int(bucket), "count": histogram.get(bucket, 0)}
+            for bucket in BUCKETS
+        ],
+        "questions": question_stats
+    }
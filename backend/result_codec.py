@@ -0,0 +1,197 @@
+from bson import encode as bson_encode
+from pymongo import UpdateOne
+
+# Compact storage for the per-question results of a quiz submission.
+#
+# Version 1 replaces the `detailed_results` list (one
+# {question_index, user_answer, correct_answer, is_correct} object per
+# question) with
+#
+#     packed_results: {v: 1, a: <answers>, c: <correctness bitmap>}
+#
+# where `a` holds one byte per question (the chosen option index, or
+# UNANSWERED) and bit i of `c` is set when question i was answered correctly.
+# The correct answers are not stored: they are the quiz's, and expand() takes
+# them from its compiled answer key (grading.py). Submissions with answers that
+# don't fit in a byte are stored in the old format, which is still read as is.
+
+FIELD = 'packed_results'
+LEGACY_FIELD = 'detailed_results'
+VERSION = 1
+UNANSWERED = 255
+
+MIGRATION_BATCH_SIZE = 500
+
+
+def detailed_results(user_answers, answers):
+    """The legacy (and API) form: one dict per question."""
+    return [
+        {
+            "question_index": i,
+            "user_answer": user_ans,
+            "correct_answer": correct,
+            "is_correct": user_ans == correct
+        }
+        for i, (user_ans, correct) in enumerate(zip(user_answers, answers))
+    ]
+
+
+def _pack(pairs):
+    # pairs: (user_answer, is_correct) per question. None if an answer can't be packed.
+    pairs = list(pairs)
+    given = bytearray(len(pairs))
+    bits = bytearray((len(pairs) + 7) // 8)
+    for i, (user_ans, is_correct) in enumerate(pairs):
+        if user_ans is None:
+            given[i] = UNANSWERED
+        elif type(user_ans) is int and 0 <= user_ans < UNANSWERED:
+            given[i] = user_ans
+        else:
+            return None
+        if is_correct:
+            bits[i >> 3] |= 1 << (i & 7)
+    return {'v': VERSION, 'a': bytes(given), 'c': bytes(bits)}
+
+
+def encode(user_answers, answers):
+    """
+    Returns the fields to store for a graded submission: {FIELD: ...}, or
+    {LEGACY_FIELD: [...]} if an answer is not an option index.
+
+    Args:
+        user_answers (list): The submitted answers.
+        answers (bytes): The correct option index per question (AnswerKey.answers).
+    """
+    packed = _pack((user_ans, user_ans == correct) for user_ans, correct in zip(user_answers, answers))
+    if packed is None:
+        return {LEGACY_FIELD: detailed_results(user_answers, answers)}
+    return {FIELD: packed}
+
+
+def expand(result, answers):
+    """
+    Returns a copy of a result document with its packed results replaced by
+    `detailed_results`. `result` itself is left as it is: it may be a document
+    still waiting in the write buffer.
+
+    Args:
+        result (dict): A quiz_results document, in either format.
+        answers (bytes): The quiz's correct answers, or None if the quiz no
+                         longer exists (correct_answer is then only known for
+                         correctly answered questions).
+
+    Returns:
+        dict: The expanded document (`result` itself if it is not packed).
+    """
+    packed = result.get(FIELD)
+    if packed is None:
+        return result
+    if packed.get('v') != VERSION:
+        raise ValueError(f"Unknown packed_results version {packed.get('v')!r}.")
+    result = {key: value for key, value in result.items() if key != FIELD}
+
+    given, bits = packed['a'], packed['c']
+    detailed = []
+    for i, raw in enumerate(given):
+        user_ans = None if raw == UNANSWERED else raw
+        is_correct = bool(bits[i >> 3] >> (i & 7) & 1)
+        if answers is not None and i < len(answers):
+            correct = answers[i]
+        else:
+            correct = user_ans if is_correct else None
+        detailed.append({
+            "question_index": i,
+            "user_answer": user_ans,
+            "correct_answer": correct,
+            "is_correct": is_correct
+        })
+    result[LEGACY_FIELD] = detailed
+    return result
+
+
+def answer_pairs(result):
+    """
+    Returns (user_answer, is_correct) per question of a result document in
+    either format, as graded when it was submitted.
+    """
+    packed = result.get(FIELD)
+    if packed is not None:
+        bits = packed['c']
+        return [
+            (None if raw == UNANSWERED else raw, bool(bits[i >> 3] >> (i & 7) & 1))
+            for i, raw in enumerate(packed['a'])
+        ]
+    return [
+        (item.get('user_answer'), bool(item.get('is_correct')))
+        for item in result.get(LEGACY_FIELD) or []
+        if isinstance(item, dict)
+    ]
+
+
+def compact_legacy(result, answers):
+    """
+    Packs a legacy result document's `detailed_results`.
+
+    Only done when expand() would give the stored list back exactly: every
+    answer fits in a byte and the stored correct answers are the quiz's current
+    ones.
+
+    Returns:
+        dict: The packed value, or None if the document must stay as it is.
+    """
+    detailed = result.get(LEGACY_FIELD)
+    if not isinstance(detailed, list) or answers is None or len(detailed) > len(answers):
+        return None
+    for i, item in enumerate(detailed):
+        if (not isinstance(item, dict) or item.get('question_index') != i
+                or item.get('correct_answer') != answers[i]
+                or item.get('is_correct') != (item.get('user_answer') == answers[i])):
+            return None
+    return _pack((item.get('user_answer'), item['is_correct']) for item in detailed)
+
+
+def migrate(db, get_answer_keys, batch_size=MIGRATION_BATCH_SIZE, dry_run=False):
+    """
+    Rewrites legacy quiz_results documents in the packed format, one batch at a time.
+
+    Args:
+        db: The MongoDB database handle.
+        get_answer_keys (callable): grading.get_answer_keys.
+        batch_size (int): Documents read and rewritten per batch.
+        dry_run (bool): Measure the savings without writing anything.
+
+    Returns:
+        dict: scanned, compacted and skipped document counts, and the BSON
+              size of the compacted documents before and after.
+    """
+    report = {'scanned': 0, 'compacted': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0}
+    query = {LEGACY_FIELD: {'$exists': True}}
+    last_id = None
+    while True:
+        # Skipped documents still match the query, so walk by _id
+        page_query = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+        batch = list(db.quiz_results.find(page_query).sort('_id', 1).limit(batch_size))
+        if not batch:
+            return report
+        last_id = batch[-1]['_id']
+
+        keys = get_answer_keys(db, [result.get('quiz_id') for result in batch])
+        updates = []
+        for result in batch:
+            report['scanned'] += 1
+            key = keys.get(result.get('quiz_id'))
+            packed = compact_legacy(result, key.answers if key else None)
+            if packed is None:
+                report['skipped'] += 1
+                continue
+            report['bytes_before'] += len(bson_encode(result))
+            compacted = dict(result, **{FIELD: packed})
+            del compacted[LEGACY_FIELD]
+            report['bytes_after'] += len(bson_encode(compacted))
+            report['compacted'] += 1
+            updates.append(UpdateOne(
+                {'_id': result['_id'], LEGACY_FIELD: {'$exists': True}},
+                {'$set': {FIELD: packed}, '$unset': {LEGACY_FIELD: ''}}
+            ))
+        if updates and not dry_run:
+            db.quiz_results.bulk_write(updates, ordered=False)
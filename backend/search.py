@@ -0,0 +1,115 @@
+from pymongo import TEXT, IndexModel
+import pagination
+
+# Ranked full-text search over quizzes, backed by a MongoDB text index on the
+# title, description and question text. MongoDB updates the index on every
+# insert and delete, so quizzes are searchable as soon as create_quiz returns
+# and disappear when they are deleted.
+#
+# One aggregation serves a search page: the $text match (an index lookup), a
+# projection down to the summary fields and the relevance score (so the
+# questions never reach the in-memory stages), then a $facet with the page
+# itself (keyset paginated on relevance score, then _id), the total number of
+# matches and the per-category counts. Category counts cover every match, so a
+# client can narrow to a category and still show the others.
+
+# A title match counts for more than a description match, which counts for
+# more than one in the question text
+INDEXES = [
+    IndexModel(
+        [('title', TEXT), ('description', TEXT), ('questions.question_text', TEXT)],
+        name='quiz_text',
+        weights={'title': 10, 'description': 4, 'questions.question_text': 1},
+        default_language='english',
+        # Don't let a stray `language` field in a quiz pick the stemmer
+        language_override='search_language'
+    ),
+]
+
+SEARCH_SORT = [('score', -1), ('_id', -1)]
+MAX_QUERY_LENGTH = 200
+
+SEARCH_PROJECTION = {
+    'title': 1,
+    'description': 1,
+    'category': 1,
+    'created_by': 1,
+    'created_at': 1,
+    'question_count': {'$size': {'$ifNull': ['$questions', []]}},
+    'score': {'$meta': 'textScore'}
+}
+
+
+def search_pipeline(text, category=None, limit=pagination.DEFAULT_PAGE_SIZE, after=None):
+    """
+    Builds the aggregation for one page of search results.
+
+    Raises:
+        pagination.InvalidCursor: If `after` is not a valid token.
+    """
+    page_match = {'category': category} if category else {}
+    if after:
+        keyset = pagination.keyset_filter(after, SEARCH_SORT)
+        page_match = {'$and': [page_match, keyset]} if page_match else keyset
+
+    return [
+        {'$match': {'$text': {'$search': text}}},
+        {'$project': SEARCH_PROJECTION},
+        {'$facet': {
+            'results': [
+                {'$match': page_match},
+                {'$sort': dict(SEARCH_SORT)},
+                # One extra document to know whether another page exists
+                {'$limit': limit + 1}
+            ],
+            'total': [
+                {'$match': {'category': category} if category else {}},
+                {'$count': 'count'}
+            ],
+            'categories': [
+                {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
+                {'$sort': {'count': -1, '_id': 1}}
+            ]
+        }}
+    ]
+
+
+def format_page(facets, limit):
+    """Turns the $facet output into {results, total, categories, next_cursor}."""
+    facets = facets[0] if facets else {}
+    results, next_cursor = pagination.split_page(facets.get('results', []), SEARCH_SORT, limit)
+    total = facets.get('total')
+    return {
+        "results": results,
+        "total": total[0]['count'] if total else 0,
+        "categories": [
+            {"category": entry['_id'], "count": entry['count']}
+            for entry in facets.get('categories', [])
+        ],
+        "next_cursor": next_cursor
+    }
+
+
+def search(db, text, category=None, limit=pagination.DEFAULT_PAGE_SIZE, after=None):
+    """
+    Returns one page of quizzes matching `text`, most relevant first.
+
+    Args:
+        db: The MongoDB database handle.
+        text (str): Search terms; "quoted phrases" and -excluded words use the
+                    $text syntax.
+        category (str): Only return quizzes in this category (facets still cover all).
+        limit (int): Page size.
+        after (str): The next_cursor of the previous page.
+
+    Returns:
+        dict: results (quiz summaries with their relevance `score`), total,
+              categories ([{category, count}]) and next_cursor.
+    """
+    return format_page(list(db.quizzes.aggregate(search_pipeline(text, category, limit, after))), limit)
+
+
+async def search_async(db, text, category=None, limit=pagination.DEFAULT_PAGE_SIZE, after=None):
+    """search() for a Motor (async) database handle."""
+    facets = await db.quizzes.aggregate(search_pipeline(text, category, limit, after)).to_list(None)
+    return format_page(facets, limit)
@@ -0,0 +1,44 @@
+import re
+import threading
+import time
+import ai_pipeline
+
+# Three chunks of distinct paragraphs
+CONTENT = '\n\n'.join(f"Paragraph {i} " + 'word ' * 1500 for i in range(3))
+
+
+def _paragraph(chunk):
+    # Chunks start with the tail of the previous one, which has no marker
+    return re.search(r'Paragraph (\d)', chunk).group(1)
+
+
+def _questions(chunk, n):
+    return [{'question': f"Question {j} about paragraph p{_paragraph(chunk)}?"} for j in range(n)]
+
+
+def test_queued_chunks_keep_their_timeout():
+    # Another request's chunks hold every worker for longer than one chunk's timeout
+    release = threading.Event()
+    executor = ai_pipeline._get_executor()
+    busy = [executor.submit(release.wait, 5) for _ in range(ai_pipeline.CHUNK_WORKERS)]
+    threading.Timer(0.3, release.set).start()
+
+    questions = ai_pipeline.generate_chunked(CONTENT, 3, _questions, timeout=0.2)
+
+    assert len(questions) == 3
+    for future in busy:
+        future.result()
+
+
+def test_slow_chunk_times_out_from_its_start():
+    def generate(chunk, n):
+        if _paragraph(chunk) == '1':
+            time.sleep(1)
+        return _questions(chunk, n)
+
+    started = time.monotonic()
+    questions = ai_pipeline.generate_chunked(CONTENT, 4, generate, timeout=0.2)
+
+    assert time.monotonic() - started < 0.9
+    assert questions
+    assert not any('p1?' in q['question'] for q in questions)
@@ -0,0 +1,25 @@
+import mongomock
+from cache import VersionStamp
+
+
+def test_version_stamp_is_seen_by_other_workers():
+    db = mongomock.MongoClient().db
+    writer = VersionStamp('roles', check_interval=0)
+    reader = VersionStamp('roles', check_interval=0)
+
+    assert not reader.changed(db) # first check only records the version
+    assert not reader.changed(db)
+    assert writer.bump(db) == 1
+    assert reader.changed(db)
+    assert not reader.changed(db)
+
+
+def test_version_stamp_check_interval():
+    db = mongomock.MongoClient().db
+    reader = VersionStamp('roles', check_interval=60)
+    reader.changed(db)
+    VersionStamp('roles').bump(db)
+    # Not re-read until the interval has passed
+    assert not reader.changed(db)
+    reader._checked_at -= 60
+    assert reader.changed(db)
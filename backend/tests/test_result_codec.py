@@ -0,0 +1,119 @@
+import copy
+import mongomock
+import pytest
+from bson import ObjectId
+from grading import AnswerKey
+import result_codec
+
+ANSWERS = bytes([0, 2, 1, 3, 0, 1, 2, 3, 1])
+
+
+def test_round_trip():
+    # Nine questions, so the correctness bitmap spans two bytes
+    user_answers = [0, 1, 1, None, 0, 2, 2, 3, None]
+    stored = dict(result_codec.encode(user_answers, ANSWERS), quiz_id='q')
+    assert result_codec.FIELD in stored
+    assert result_codec.LEGACY_FIELD not in stored
+
+    expanded = result_codec.expand(stored, ANSWERS)
+    assert expanded[result_codec.LEGACY_FIELD] == result_codec.detailed_results(user_answers, ANSWERS)
+    assert result_codec.FIELD not in expanded
+    assert expanded['quiz_id'] == 'q'
+
+
+def test_expand_leaves_the_document_alone():
+    stored = result_codec.encode([0, 2], ANSWERS[:2])
+    before = copy.deepcopy(stored)
+    result_codec.expand(stored, ANSWERS[:2])
+    assert stored == before
+
+
+def test_expand_without_answer_key():
+    stored = result_codec.encode([0, 1], ANSWERS[:2])
+    detailed = result_codec.expand(stored, None)[result_codec.LEGACY_FIELD]
+    assert [item['correct_answer'] for item in detailed] == [0, None]
+    assert [item['is_correct'] for item in detailed] == [True, False]
+
+
+def test_unpackable_answers_stay_legacy():
+    stored = result_codec.encode(['0', 2], ANSWERS[:2])
+    assert stored == {result_codec.LEGACY_FIELD: result_codec.detailed_results(['0', 2], ANSWERS[:2])}
+    assert result_codec.expand(stored, ANSWERS[:2]) is stored
+
+
+def test_unknown_version():
+    with pytest.raises(ValueError):
+        result_codec.expand({result_codec.FIELD: {'v': 99, 'a': b'', 'c': b''}}, None)
+
+
+def test_answer_pairs_match_in_both_formats():
+    user_answers = [0, 1, None, 3]
+    packed = result_codec.encode(user_answers, ANSWERS[:4])
+    legacy = {result_codec.LEGACY_FIELD: result_codec.detailed_results(user_answers, ANSWERS[:4])}
+    assert result_codec.answer_pairs(packed) == result_codec.answer_pairs(legacy)
+
+
+def _answer_keys(keys):
+    def get_answer_keys(db, quiz_ids):
+        return {quiz_id: keys[quiz_id] for quiz_id in quiz_ids if quiz_id in keys}
+    return get_answer_keys
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def _legacy(quiz_id, user_answers, answers):
+    return {
+        '_id': ObjectId(),
+        'quiz_id': quiz_id,
+        'user_id': 'alice',
+        result_codec.LEGACY_FIELD: result_codec.detailed_results(user_answers, answers)
+    }
+
+
+def test_migrate_compacts_legacy_results(db):
+    quiz_id = str(ObjectId())
+    keys = _answer_keys({quiz_id: AnswerKey(quiz_id, ANSWERS, 'General')})
+    originals = [_legacy(quiz_id, [0, 1, None, 3, 0, 1, 2, 3, 1], ANSWERS) for _ in range(5)]
+    db.quiz_results.insert_many(copy.deepcopy(originals))
+
+    report = result_codec.migrate(db, keys, batch_size=2)
+
+    assert report['scanned'] == 5
+    assert report['compacted'] == 5
+    assert report['skipped'] == 0
+    assert report['bytes_after'] < report['bytes_before']
+    for original in originals:
+        stored = db.quiz_results.find_one({'_id': original['_id']})
+        assert result_codec.LEGACY_FIELD not in stored
+        assert result_codec.expand(stored, ANSWERS) == original
+
+
+def test_migrate_skips_what_it_cannot_verify(db):
+    quiz_id = str(ObjectId())
+    keys = _answer_keys({quiz_id: AnswerKey(quiz_id, ANSWERS, 'General')})
+    unknown_quiz = _legacy(str(ObjectId()), [0, 1], ANSWERS[:2])
+    # Graded against answers the quiz no longer has
+    stale = _legacy(quiz_id, [1, 1], bytes([1, 1]))
+    unpackable = _legacy(quiz_id, ['a', 2], ANSWERS[:2])
+    db.quiz_results.insert_many(copy.deepcopy([unknown_quiz, stale, unpackable]))
+
+    report = result_codec.migrate(db, keys)
+
+    assert report == {'scanned': 3, 'compacted': 0, 'skipped': 3, 'bytes_before': 0, 'bytes_after': 0}
+    for original in (unknown_quiz, stale, unpackable):
+        assert db.quiz_results.find_one({'_id': original['_id']}) == original
+
+
+def test_migrate_dry_run_writes_nothing(db):
+    quiz_id = str(ObjectId())
+    keys = _answer_keys({quiz_id: AnswerKey(quiz_id, ANSWERS, 'General')})
+    original = _legacy(quiz_id, [0, 2, 1], ANSWERS[:3])
+    db.quiz_results.insert_one(copy.deepcopy(original))
+
+    report = result_codec.migrate(db, keys, dry_run=True)
+
+    assert report['compacted'] == 1
+    assert db.quiz_results.find_one({'_id': original['_id']}) == original
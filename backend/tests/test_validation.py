@@ -0,0 +1,35 @@
+import pytest
+import validation
+from validation import ValidationError
+
+
+@pytest.mark.parametrize('value, expected', [(1, 1), (10, 10), ('12', 12), (validation.MAX_NUM_QUESTIONS, validation.MAX_NUM_QUESTIONS)])
+def test_num_questions(value, expected):
+    params, _, _ = validation.parse_generation({'content': 'text', 'num_questions': value}, {})
+    assert params['num_questions'] == expected
+
+
+def test_num_questions_default():
+    params, _, _ = validation.parse_generation({'content': 'text'}, {})
+    assert params['num_questions'] == validation.DEFAULT_NUM_QUESTIONS
+
+
+@pytest.mark.parametrize('value', ['abc', '', None, True, 2.5, [5], 0, -3, validation.MAX_NUM_QUESTIONS + 1])
+def test_invalid_num_questions(value):
+    with pytest.raises(ValidationError) as error:
+        validation.parse_generation({'content': 'text', 'num_questions': value}, {})
+    assert error.value.status == 400
+
+
+@pytest.mark.parametrize('quiz_id', [['a'], {'$ne': 1}, 5])
+def test_submission_quiz_id_must_be_a_string(quiz_id):
+    with pytest.raises(ValidationError):
+        validation.parse_submission({'quiz_id': quiz_id, 'username': 'alice', 'user_answers': [0]})
+
+
+@pytest.mark.parametrize('field', ['content', 'quiz_type', 'difficulty'])
+@pytest.mark.parametrize('value', [3, ['hard'], {'a': 1}, None])
+def test_generation_text_fields_must_be_strings(field, value):
+    with pytest.raises(ValidationError) as error:
+        validation.parse_generation({'content': 'text', field: value}, {})
+    assert error.value.status == 400
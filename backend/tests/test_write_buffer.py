@@ -0,0 +1,127 @@
+import threading
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import ConnectionFailure
+from write_buffer import WriteBuffer
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def test_update_pending_changes_the_queued_document(db):
+    buffer = WriteBuffer(db, mode='buffered', flush_interval=60)
+    buffer.insert('user_sessions', {'username': 'alice', 'login_time': 1, 'logout_time': None})
+    buffer.insert('user_sessions', {'username': 'alice', 'login_time': 2, 'logout_time': None})
+
+    assert buffer.update_pending('user_sessions', {'username': 'alice', 'logout_time': None}, {'logout_time': 3})
+    buffer.close()
+
+    sessions = {doc['login_time']: doc['logout_time'] for doc in db.user_sessions.find()}
+    # Only the most recent session is closed
+    assert sessions == {1: None, 2: 3}
+
+
+def test_update_pending_without_a_match(db):
+    buffer = WriteBuffer(db, mode='buffered', flush_interval=60)
+    buffer.insert('user_sessions', {'username': 'bob', 'logout_time': None})
+    assert not buffer.update_pending('user_sessions', {'username': 'alice', 'logout_time': None}, {'logout_time': 3})
+    buffer.close()
+
+
+def test_update_pending_in_sync_mode(db):
+    buffer = WriteBuffer(db)
+    buffer.insert('user_sessions', {'username': 'alice', 'logout_time': None})
+    assert not buffer.update_pending('user_sessions', {'username': 'alice', 'logout_time': None}, {'logout_time': 3})
+    assert db.user_sessions.count_documents({}) == 1
+
+
+def test_update_pending_waits_for_an_in_flight_write(db):
+    buffer = WriteBuffer(db, mode='buffered', flush_interval=60)
+    buffer.insert('user_sessions', {'username': 'alice', 'logout_time': None})
+    with buffer._lock:
+        batch = buffer._take(10) # as the flusher does before writing
+    writer = threading.Timer(0.1, buffer._write, [batch])
+    writer.start()
+
+    assert not buffer.update_pending('user_sessions', {'username': 'alice', 'logout_time': None}, {'logout_time': 3})
+    # Returned only once the document was in Mongo, where the caller updates it
+    assert db.user_sessions.count_documents({'username': 'alice'}) == 1
+    writer.join()
+    buffer.close()
+
+
+class FlakyCollection:
+    """Fails every insert that includes one of the `bad` documents, or all of them while `down`."""
+
+    def __init__(self, collection, bad=(), down=False):
+        self.collection = collection
+        self.name = collection.name
+        self.bad = set(bad)
+        self.down = down
+
+    def insert_many(self, docs, ordered=True):
+        if self.down:
+            raise ConnectionFailure('down')
+        if any(doc['_id'] in self.bad for doc in docs):
+            raise ValueError('cannot encode document')
+        return self.collection.insert_many(docs, ordered=ordered)
+
+    def insert_one(self, doc):
+        return self.insert_many([doc])
+
+
+class FlakyDB(dict):
+
+    def __missing__(self, name):
+        raise KeyError(name)
+
+
+def _flaky_db(db, **kwargs):
+    return FlakyDB(quiz_results=FlakyCollection(db.quiz_results, **kwargs))
+
+
+def test_bad_document_does_not_block_the_rest(db):
+    bad_id = ObjectId()
+    buffer = WriteBuffer(_flaky_db(db, bad=[bad_id]), mode='buffered', flush_interval=0, max_attempts=3)
+    written = []
+    buffer.on_written('quiz_results', written.extend)
+    for i in range(3):
+        buffer.insert('quiz_results', {'_id': bad_id if i == 1 else ObjectId(), 'n': i})
+    buffer.close()
+
+    assert sorted(doc['n'] for doc in db.quiz_results.find()) == [0, 2]
+    assert sorted(doc['n'] for doc in written) == [0, 2]
+    stats = buffer.stats()
+    assert stats['dead_lettered'] == 1
+    assert stats['queue_depth'] == 0
+    assert buffer.pending('quiz_results', bad_id) is None
+
+
+def test_connection_failures_are_retried(db):
+    collection = FlakyCollection(db.quiz_results, down=True)
+    buffer = WriteBuffer(FlakyDB(quiz_results=collection), mode='buffered', flush_interval=0, max_attempts=3)
+    written = []
+    buffer.on_written('quiz_results', written.extend)
+    _id = buffer.insert('quiz_results', {'n': 1})
+
+    buffer.flush()
+    assert written == [] # nothing derived before the document is stored
+    assert buffer.pending('quiz_results', _id) is not None
+    collection.down = False
+    buffer.close()
+
+    assert db.quiz_results.count_documents({}) == 1
+    assert [doc['_id'] for doc in written] == [_id]
+    assert buffer.stats()['dead_lettered'] == 0
+
+
+def test_on_written_in_sync_mode(db):
+    buffer = WriteBuffer(db)
+    written = []
+    buffer.on_written('quiz_results', written.extend)
+    buffer.insert('quiz_results', {'n': 1})
+    assert len(written) == 1
+    assert db.quiz_results.count_documents({}) == 1
@@ -0,0 +1,169 @@
+from datetime import datetime
+import exports
+import leaderboard
+import pagination
+import search
+
+# Request parsing shared by the sync (Flask) and async (ASGI) apps, so both
+# accept the same input and reject it with the same messages. Every parser takes
+# the decoded JSON body (or query arguments) and raises ValidationError.
+
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+STREAM_FORMATS_BY_MIMETYPE = {mimetype: name for name, mimetype in STREAM_MIMETYPES.items()}
+
+DEFAULT_NUM_QUESTIONS = 5
+MAX_NUM_QUESTIONS = 50
+
+
+class ValidationError(ValueError):
+    """A request the API rejects; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def is_truthy(value):
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def parse_login(data):
+    """Returns (username, password) from a login body."""
+    data = data or {}
+    username = data.get('username')
+    password = data.get('password')
+    if not username or not password:
+        raise ValidationError("Missing username or password.")
+    return username, password
+
+
+def parse_submission(data):
+    """Returns (quiz_id, username, user_answers) from a quiz submission."""
+    if not isinstance(data, dict):
+        raise ValidationError("Submission must be an object.")
+    quiz_id = data.get('quiz_id')
+    username = data.get('username')
+    user_answers = data.get('user_answers')
+    if not all([quiz_id, username, user_answers]):
+        raise ValidationError("Missing quiz_id, username, or user_answers.")
+    if not isinstance(quiz_id, str):
+        raise ValidationError("quiz_id must be a string.")
+    if not isinstance(user_answers, list):
+        raise ValidationError("user_answers must be a list.")
+    return quiz_id, username, user_answers
+
+
+def parse_page(args):
+    """Returns (limit, after) from the query arguments of a paginated listing."""
+    try:
+        limit = pagination.parse_limit(args.get('limit'))
+    except ValueError as e:
+        raise ValidationError(str(e))
+    return limit, args.get('after')
+
+
+def parse_date(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(f"{name} must be an ISO 8601 date or datetime.")
+
+
+def parse_export(args):
+    """
+    Parses the query arguments shared by the admin export endpoints.
+
+    Returns:
+        tuple: (export_format, created_from, created_to, limit, after). limit is
+               None for an export of every matching document.
+    """
+    export_format = args.get('format', 'ndjson')
+    if export_format not in exports.EXPORT_MIMETYPES:
+        raise ValidationError("format must be 'ndjson' or 'csv'.")
+    try:
+        limit = pagination.parse_limit(args.get('limit'), default=None, maximum=exports.MAX_EXPORT_PAGE_SIZE)
+    except ValueError as e:
+        raise ValidationError(str(e))
+    return export_format, parse_date(args, 'created_from'), parse_date(args, 'created_to'), limit, args.get('after')
+
+
+def parse_search(args):
+    """Returns (text, category, limit, after) from the /quizzes/search query arguments."""
+    text = (args.get('q') or '').strip()
+    if not text:
+        raise ValidationError("q (the search terms) is required.")
+    if len(text) > search.MAX_QUERY_LENGTH:
+        raise ValidationError(f"q must be at most {search.MAX_QUERY_LENGTH} characters.")
+    limit, after = parse_page(args)
+    return text, args.get('category') or None, limit, after
+
+
+def parse_leaderboard(args):
+    """Returns (category, window, limit) from the leaderboard query arguments."""
+    try:
+        limit = int(args.get('limit', leaderboard.DEFAULT_LIMIT))
+    except ValueError:
+        raise ValidationError("limit must be an integer.")
+    limit = max(1, min(limit, leaderboard.MAX_LIMIT))
+
+    window = args.get('window', 'all')
+    if window not in leaderboard.WINDOWS:
+        raise ValidationError(f"Invalid window. Must be one of: {', '.join(leaderboard.WINDOWS)}.")
+    return args.get('category'), window, limit
+
+
+def parse_num_questions(value):
+    # JSON numbers and numeric strings ("10") are accepted; bools and fractions are not
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if type(value) is not int or not 1 <= value <= MAX_NUM_QUESTIONS:
+        raise ValidationError(f"num_questions must be an integer between 1 and {MAX_NUM_QUESTIONS}.")
+    return value
+
+
+def parse_string(data, name, default):
+    value = data.get(name, default)
+    if not isinstance(value, str):
+        raise ValidationError(f"{name} must be a string.")
+    return value
+
+
+def parse_generation(data, args, best_mimetype=None):
+    """
+    Parses a /generate_quiz_ai request.
+
+    Args:
+        data (dict): The JSON body.
+        args: The query arguments.
+        best_mimetype (str): The client's preferred response type from Accept.
+
+    Returns:
+        tuple: (params, run_async, stream_format). params are the keyword
+               arguments for generate_quiz_from_content(); stream_format is
+               'ndjson', 'sse' or None.
+    """
+    data = data or {}
+    content = data.get('content')
+    if not content:
+        raise ValidationError("Content for quiz generation is required.")
+    if not isinstance(content, str):
+        raise ValidationError("content must be a string.")
+
+    params = {
+        "content": content,
+        "num_questions": parse_num_questions(data.get('num_questions', DEFAULT_NUM_QUESTIONS)),
+        "quiz_type": parse_string(data, 'quiz_type', 'multiple choice'),
+        "difficulty": parse_string(data, 'difficulty', 'medium'),
+        "fresh": bool(data.get('fresh', False)) # Skip the generation cache
+    }
+    run_async = bool(data.get('async', False)) or args.get('mode') == 'async'
+
+    stream_format = data.get('stream') or STREAM_FORMATS_BY_MIMETYPE.get(best_mimetype)
+    if stream_format and stream_format not in STREAM_MIMETYPES:
+        raise ValidationError("stream must be 'ndjson' or 'sse'.")
+    return params, run_async, stream_format or None
@@ -0,0 +1,310 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from pymongo.write_concern import WriteConcern
+import logs
+
+# Write-behind buffer for insert-only collections (user_sessions, quiz_results).
+#
+# In the buffered modes, insert() assigns the document's _id, queues it and
+# returns immediately; a background thread writes queued documents with
+# insert_many once `batch_size` of them are waiting or `flush_interval` seconds
+# have passed. Documents that are queued but not yet written can be read back
+# with pending(), so a result is visible by id right after submission, and
+# changed with update_pending() (e.g. a logout right after login).
+#
+# Work derived from a document (leaderboard, analytics) is registered with
+# on_written() and runs once the document is stored, never before. A document
+# that still fails after `max_attempts` flushes is dropped and logged in full
+# ('write_buffer_dead_letter'), so it can't hold up the queue forever.
+#
+# Modes:
+#   sync           - every insert goes straight to Mongo (no buffering)
+#   buffered       - batched writes; the queue is drained on shutdown
+#   buffered_fsync - as buffered, but the shutdown drain uses a journaled
+#                    write concern so it is on disk before the process exits
+
+MODES = ('sync', 'buffered', 'buffered_fsync')
+
+DUPLICATE_KEY_ERROR = 11000
+
+log = logs.get_logger('write_buffer')
+
+
+class WriteBuffer:
+
+    def __init__(self, db, mode='sync', batch_size=500, flush_interval=0.2, max_queue=10000, max_attempts=5):
+        if mode not in MODES:
+            raise ValueError(f"Invalid write mode '{mode}'. Must be one of: {', '.join(MODES)}.")
+        self.db = db
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+
+        self._queue = deque() # (collection_name, doc)
+        self._pending = {} # (collection_name, _id) -> doc, for read-your-writes
+        self._attempts = {} # (collection_name, _id) -> failed flushes so far
+        self._on_written = {} # collection_name -> callable(docs)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock) # wakes the flusher
+        self._written = threading.Condition(self._lock) # a batch has been written
+        self._thread = None
+        self._closed = False
+
+        self.metrics = {
+            "flushes": 0,
+            "documents_written": 0,
+            "write_errors": 0,
+            "dead_lettered": 0,
+            "sync_fallbacks": 0,
+            "last_flush_seconds": 0.0,
+            "max_flush_seconds": 0.0,
+            "total_flush_seconds": 0.0
+        }
+
+    @property
+    def buffered(self):
+        return self.mode != 'sync'
+
+    def on_written(self, collection_name, callback):
+        """
+        Registers `callback(docs)`, called with the documents of `collection_name`
+        once they are stored: in the calling thread for direct writes, in the
+        flusher for buffered ones.
+        """
+        self._on_written[collection_name] = callback
+
+    def _insert_now(self, collection_name, doc):
+        self.db[collection_name].insert_one(doc)
+        callback = self._on_written.get(collection_name)
+        if callback:
+            callback([doc])
+
+    def insert(self, collection_name, doc):
+        """
+        Inserts `doc` into `collection_name`, now or later depending on the mode.
+
+        Returns:
+            ObjectId: The document's _id, which is assigned before it is queued.
+        """
+        doc.setdefault('_id', ObjectId())
+        if not self.buffered or self._closed:
+            self._insert_now(collection_name, doc)
+            return doc['_id']
+
+        with self._cond:
+            # Backpressure: when Mongo can't keep up, write through instead of growing without bound
+            if len(self._queue) >= self.max_queue:
+                self.metrics["sync_fallbacks"] += 1
+                full = True
+            else:
+                full = False
+                self._queue.append((collection_name, doc))
+                self._pending[(collection_name, doc['_id'])] = doc
+                self._ensure_flusher()
+                if len(self._queue) >= self.batch_size:
+                    self._cond.notify()
+        if full:
+            self._insert_now(collection_name, doc)
+        return doc['_id']
+
+    def pending(self, collection_name, _id):
+        """Returns the queued, not yet written document with this _id, if any."""
+        with self._cond:
+            return self._pending.get((collection_name, _id))
+
+    def update_pending(self, collection_name, match, fields, timeout=5.0):
+        """
+        Sets `fields` on the most recently queued document of `collection_name`
+        whose fields equal `match`, before it is written.
+
+        A matching document the flusher is writing right now can't be changed;
+        this waits (up to `timeout` seconds) until it is in Mongo, so the caller
+        can update it there.
+
+        Returns:
+            bool: True if a queued document was updated, False if the caller
+                  should update Mongo instead.
+        """
+        def matches(doc):
+            return all(doc.get(key) == value for key, value in match.items())
+
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                for queued_collection, doc in reversed(self._queue):
+                    if queued_collection == collection_name and matches(doc):
+                        # Queued documents are only read by the flusher after it takes them, under this lock
+                        doc.update(fields)
+                        return True
+                queued = {id(doc) for _, doc in self._queue}
+                in_flight = any(
+                    key[0] == collection_name and id(doc) not in queued and matches(doc)
+                    for key, doc in self._pending.items()
+                )
+                remaining = deadline - time.monotonic()
+                if not in_flight or remaining <= 0:
+                    return False
+                self._written.wait(remaining)
+
+    def _ensure_flusher(self):
+        # Started lazily so pre-fork servers don't fork a process with a live thread
+        if self._thread is None:
+            atexit.register(self.close)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='write-buffer-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+                batch = self._take(self.batch_size)
+            if batch:
+                self._write(batch)
+
+    def _take(self, limit):
+        # Caller holds the lock
+        batch = []
+        while self._queue and len(batch) < limit:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def _insert(self, collection, docs):
+        # Returns (written, retry): the stored documents and the ones to try again
+        try:
+            collection.insert_many(docs, ordered=False)
+            return docs, []
+        except BulkWriteError as e:
+            # Rejected documents won't succeed on a retry. A duplicate _id means
+            # an earlier, interrupted attempt stored the document after all.
+            rejected = {
+                error['index'] for error in e.details.get('writeErrors', [])
+                if error.get('code') != DUPLICATE_KEY_ERROR
+            }
+            self.metrics["write_errors"] += len(rejected)
+            return [doc for i, doc in enumerate(docs) if i not in rejected], []
+        except Exception as e:
+            if len(docs) > 1 and not isinstance(e, ConnectionFailure):
+                # Not the connection (e.g. a document that can't be encoded):
+                # write them one by one so a bad document doesn't fail the rest
+                written, retry = [], []
+                for doc in docs:
+                    doc_written, doc_retry = self._insert(collection, [doc])
+                    written.extend(doc_written)
+                    retry.extend(doc_retry)
+                return written, retry
+            logs.event(
+                log, 'write_buffer_flush_failed', level=logging.ERROR, exc_info=True,
+                collection=collection.name, documents=len(docs)
+            )
+            self.metrics["write_errors"] += len(docs)
+            return [], docs
+
+    def _write(self, batch, write_concern=None):
+        started = time.monotonic()
+        by_collection = {}
+        for collection_name, doc in batch:
+            by_collection.setdefault(collection_name, []).append(doc)
+
+        written = {}
+        retry = []
+        for collection_name, docs in by_collection.items():
+            collection = self.db[collection_name]
+            if write_concern is not None:
+                collection = collection.with_options(write_concern=write_concern)
+            written[collection_name], failed = self._insert(collection, docs)
+            self.metrics["documents_written"] += len(written[collection_name])
+            retry.extend((collection_name, doc) for doc in failed)
+
+        elapsed = time.monotonic() - started
+        requeue = []
+        dead = []
+        with self._lock:
+            for collection_name, doc in retry:
+                key = (collection_name, doc['_id'])
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                if self._attempts[key] < self.max_attempts:
+                    requeue.append((collection_name, doc))
+                else:
+                    dead.append((collection_name, doc, self._attempts.pop(key)))
+            requeued_ids = {(collection_name, doc['_id']) for collection_name, doc in requeue}
+            for collection_name, doc in batch:
+                key = (collection_name, doc['_id'])
+                if key not in requeued_ids:
+                    self._pending.pop(key, None)
+                    self._attempts.pop(key, None)
+            self._queue.extendleft(reversed(requeue))
+            self.metrics["dead_lettered"] += len(dead)
+            self.metrics["flushes"] += 1
+            self.metrics["last_flush_seconds"] = elapsed
+            self.metrics["max_flush_seconds"] = max(self.metrics["max_flush_seconds"], elapsed)
+            self.metrics["total_flush_seconds"] += elapsed
+            self._written.notify_all()
+
+        for collection_name, doc, attempts in dead:
+            # The whole document goes to the log so it can be restored by hand
+            logs.event(
+                log, 'write_buffer_dead_letter', level=logging.ERROR,
+                collection=collection_name, attempts=attempts, document=doc
+            )
+        for collection_name, docs in written.items():
+            callback = self._on_written.get(collection_name)
+            if callback and docs:
+                try:
+                    callback(docs)
+                except Exception:
+                    logs.event(
+                        log, 'write_buffer_callback_failed', level=logging.ERROR, exc_info=True,
+                        collection=collection_name, documents=len(docs)
+                    )
+        if requeue:
+            time.sleep(self.flush_interval)
+        return not requeue
+
+    def flush(self, write_concern=None):
+        """Writes everything currently queued, in batches, from the calling thread."""
+        while True:
+            with self._cond:
+                batch = self._take(self.batch_size)
+            if not batch:
+                return
+            if not self._write(batch, write_concern):
+                return
+
+    def close(self):
+        """Stops the flusher and drains the queue. Safe to call more than once."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        # flush() stops at a failed batch; retry until every document is stored or dead-lettered
+        write_concern = WriteConcern(j=True) if self.mode == 'buffered_fsync' else None
+        for _ in range(self.max_attempts):
+            self.flush(write_concern)
+            if not self._queue:
+                break
+        if self._queue:
+            logs.event(log, 'write_buffer_unwritten', level=logging.ERROR, documents=len(self._queue))
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.metrics)
+            stats["mode"] = self.mode
+            stats["queue_depth"] = len(self._queue)
+        stats["avg_flush_seconds"] = stats["total_flush_seconds"] / stats["flushes"] if stats["flushes"] else 0.0
+        return stats
@@ -6,6 +6,17 @@ function Profile() {
   const [profileData, setProfileData] = useState(null);
   const [loading, setLoading] = useState(true);
   const [message, setMessage] = useState('');
+  const [nextCursor, setNextCursor] = useState(null); // Cursor for the next page of quiz history
+
+  const fetchProfilePage = async (username, after) => {
+    const params = new URLSearchParams();
+    if (after) {
+      params.set('after', after);
+    }
+    const response = await fetch(`http://localhost:5000/profile/${username}?${params.toString()}`);
+    const data = await response.json();
+    return { response, data };
+  };
 
   useEffect(() => {
     const fetchProfile = async () => {
@@ -18,11 +29,11 @@ function Profile() {
 
       try {
         setLoading(true);
-        const response = await fetch(`http://localhost:5000/profile/${username}`);
-        const data = await response.json();
+        const { response, data } = await fetchProfilePage(username);
 
         if (response.ok) {
           setProfileData(data);
+          setNextCursor(data.next_cursor);
         } else {
           setMessage(data.message || 'Failed to fetch profile data.');
         }
@@ -37,6 +48,24 @@ function Profile() {
     fetchProfile();
   }, []); // Empty dependency array means this effect runs once on mount
 
+  const handleLoadMore = async () => {
+    try {
+      const { response, data } = await fetchProfilePage(profileData.username, nextCursor);
+      if (response.ok) {
+        setProfileData((prevData) => ({
+          ...prevData,
+          quiz_history: [...prevData.quiz_history, ...data.quiz_history]
+        }));
+        setNextCursor(data.next_cursor);
+      } else {
+        setMessage(data.message || 'Failed to fetch quiz history.');
+      }
+    } catch (error) {
+      console.error('Error fetching quiz history:', error);
+      setMessage('Network error. Could not load quiz history.');
+    }
+  };
+
   if (loading) {
     return <div>Loading Profile...</div>;
   }
@@ -49,10 +78,9 @@ function Profile() {
     return <div className="profile-container">No profile data available.</div>;
   }
 
-  // Calculate Quizzes Taken and Average Score
-  const quizzesTaken = profileData.quiz_history ? profileData.quiz_history.length : 0;
-  const totalScore = profileData.quiz_history ? profileData.quiz_history.reduce((sum, result) => sum + result.percentage_score, 0) : 0;
-  const averageScore = quizzesTaken > 0 ? (totalScore / quizzesTaken).toFixed(2) : 0;
+  // Quizzes Taken and Average Score come from the backend, since quiz_history is paginated
+  const quizzesTaken = profileData.stats ? profileData.stats.quizzes_taken : 0;
+  const averageScore = profileData.stats ? profileData.stats.average_score.toFixed(2) : 0;
 
   return (
     <div className="profile-container"> {/* Apply profile-container here */}
@@ -99,6 +127,11 @@ function Profile() {
       ) : (
         <p>No quiz history found. Take some quizzes!</p>
       )}
+      {nextCursor && (
+        <p style={{ textAlign: 'center' }}>
+          <button onClick={handleLoadMore}>Load More History</button>
+        </p>
+      )}
 
       <p style={{ textAlign: 'center', marginTop: '2rem' }}>
         <Link to="/dashboard" className="admin-button">Back to Dashboard</Link>
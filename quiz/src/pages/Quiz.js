@@ -16,15 +16,47 @@ function Quiz() {
   const [timeLeft, setTimeLeft] = useState(300); // 5 minutes = 300 seconds
   const [quizStarted, setQuizStarted] = useState(false); // To control timer start
   const [searchTerm, setSearchTerm] = useState(''); // New state for search term
+  const [nextCursor, setNextCursor] = useState(null); // Cursor for the next page of quizzes
 
   console.log('Category Name from URL:', categoryName); // Debugging
 
+  // Fetches the full quiz (with questions) only when the user starts it
+  const startQuiz = async (quizId) => {
+    try {
+      const response = await fetch(`http://localhost:5000/quizzes/${quizId}`);
+      const quiz = await response.json();
+      if (!response.ok) {
+        setMessage(quiz.message || 'Failed to load quiz.');
+        return;
+      }
+      setCurrentQuiz(quiz);
+      setSelectedQuizId(quiz._id);
+      setCurrentQuestionIndex(0);
+      setSelectedOption('');
+      setUserAnswers(new Array(quiz.questions.length).fill(null));
+      setTimeLeft(300); // Reset timer for new quiz (5 minutes)
+      setQuizStarted(true); // Start timer
+    } catch (error) {
+      console.error('Error loading quiz:', error);
+      setMessage('Network error. Could not load quiz.');
+    }
+  };
+
+  const fetchQuizPage = async (after) => {
+    const params = new URLSearchParams({ category: categoryName });
+    if (after) {
+      params.set('after', after);
+    }
+    const response = await fetch(`http://localhost:5000/quizzes?${params.toString()}`);
+    const data = await response.json();
+    return { response, data, next: response.headers.get('X-Next-Cursor') };
+  };
+
   useEffect(() => {
     const fetchQuizzes = async () => {
       try {
         setLoading(true);
-        const response = await fetch(`http://localhost:5000/quizzes?category=${categoryName}`);
-        const data = await response.json();
+        const { response, data, next } = await fetchQuizPage(null);
 
         console.log('Backend Response OK:', response.ok); // Debugging
         console.log('Backend Data:', data); // Debugging
@@ -32,12 +64,10 @@ function Quiz() {
         if (response.ok) {
           if (data.length > 0) {
             setQuizzes(data);
+            setNextCursor(next);
             // If only one quiz, select it automatically
-            if (data.length === 1) {
-              setCurrentQuiz(data[0]);
-              setSelectedQuizId(data[0]._id);
-              setUserAnswers(new Array(data[0].questions.length).fill(null));
-              setQuizStarted(true); // Start timer if quiz auto-selected
+            if (data.length === 1 && !next) {
+              await startQuiz(data[0]._id);
             }
             console.log('Quizzes set:', data); // Debugging
           } else {
@@ -59,6 +89,21 @@ function Quiz() {
     fetchQuizzes();
   }, [categoryName]); // Re-run when categoryName changes
 
+  const handleLoadMore = async () => {
+    try {
+      const { response, data, next } = await fetchQuizPage(nextCursor);
+      if (response.ok) {
+        setQuizzes((prevQuizzes) => [...prevQuizzes, ...data]);
+        setNextCursor(next);
+      } else {
+        setMessage(data.message || 'Failed to fetch quizzes.');
+      }
+    } catch (error) {
+      console.error('Error fetching quizzes:', error);
+      setMessage('Network error. Could not load quizzes.');
+    }
+  };
+
   // Timer useEffect
   useEffect(() => {
     let timer;
@@ -136,13 +181,7 @@ function Quiz() {
   };
 
   const handleQuizSelect = (quiz) => {
-    setCurrentQuiz(quiz);
-    setSelectedQuizId(quiz._id);
-    setCurrentQuestionIndex(0);
-    setSelectedOption('');
-    setUserAnswers(new Array(quiz.questions.length).fill(null));
-    setTimeLeft(300); // Reset timer for new quiz (5 minutes)
-    setQuizStarted(true); // Start timer
+    startQuiz(quiz._id);
   };
 
   // Filter quizzes based on search term
@@ -184,6 +223,7 @@ function Quiz() {
               <li key={quiz._id}>
                 <h3>{quiz.title}</h3>
                 <p>{quiz.description}</p>
+                <p>{quiz.question_count} questions</p>
                 <button onClick={() => handleQuizSelect(quiz)}>Start Quiz</button>
               </li>
             ))}
@@ -191,6 +231,11 @@ function Quiz() {
         ) : (
           <p>No quizzes found matching your search.</p>
         )}
+        {nextCursor && (
+          <p>
+            <button onClick={handleLoadMore}>Load More Quizzes</button>
+          </p>
+        )}
         <p>
           <button onClick={() => navigate('/dashboard')}>Back to Dashboard</button>
         </p>